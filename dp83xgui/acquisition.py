@@ -0,0 +1,334 @@
+# Background acquisition for the DP83X
+#
+# Once started, the Acquisition thread is the only thing that talks to the
+# instrument.  Everything else (GUI buttons, the function generator, ...) hands
+# it work through submit() so commands are serialised with the polling and the
+# caller never waits on a SCPI round trip.
+#
+# Polls are taken on a Schedule (scheduler.py), so the sample rate doesn't
+# drift with the time each poll takes, and stats() says how well it kept up.
+#
+# Energy is integrated here too, trapezoidally between the monotonic times of
+# consecutive polls, and added to each channel's readings as "e" in Wh, so the
+# GUI and the logs all see the same figure.  Time spent paused isn't counted,
+# nothing was measured then.
+#
+# After maxErrors polls in a row fail the link is assumed to be down: polling
+# stops and inst.reconnect() is tried with exponential backoff until it works,
+# then polling carries on where it left off.  Energy totals live here, and the
+# GUI's traces and logs just see a gap, so nothing is lost but the outage.
+#
+# A BurstCapture (trigger.py) sees every sample here too.  While it is capturing
+# an event the polls run at its burst interval, and the temperature and setpoint
+# checks wait, so the link is spent on readings.
+#
+# A protection Watchdog (protection.py) is checked against each sample as soon
+# as it is read, before anything else sees it, and eStop()s the supply from
+# here, so a trip never waits on the GUI or the logs.  While one is set the
+# polls carry on when paused, for the watchdog only: nothing is emitted, logged
+# or integrated, so an energy limit holds at the total from before the pause.
+
+import itertools
+import queue
+import threading
+import time
+
+from scheduler import SKIP, Backoff, Schedule
+
+
+class Acquisition(threading.Thread):
+    """
+    Poll a DP83X from a background thread and pass timestamped sample batches
+    to onSamples(list).  Errors are passed to onError(str) and polling carries on.
+    tempInterval=None leaves the temperature alone.  If waveform is a WaveformEngine
+    its steps are written from this thread too, in between polls.
+    policy is what to do about missed polls, see Schedule.  Every checkInterval mS the
+    driver's cached setpoints are read back to catch front panel changes, None doesn't.
+    maxErrors=None never reconnects.  burst is an optional BurstCapture, see setBurst(),
+    and watchdog an optional protection Watchdog, see setWatchdog().
+    """
+
+    def __init__(self, inst, channels=("CH1", "CH2", "CH3"), interval=1000,
+                 onSamples=None, onError=None, tempInterval=1000, batchInterval=20, waveform=None,
+                 policy=SKIP, checkInterval=2000, maxErrors=3, backoff=None, burst=None, watchdog=None):
+        super(Acquisition, self).__init__(daemon=True)
+        self.inst = inst
+        self.channels = list(channels)
+        self.interval = interval / 1000.0
+        self.schedule = Schedule(self.interval, policy)
+        self.tempSchedule = None if tempInterval is None else Schedule(tempInterval / 1000.0)
+        self.checkSchedule = None if checkInterval is None else Schedule(checkInterval / 1000.0)
+        self.batchInterval = int(batchInterval * 1e6)     # ns
+        self.onSamples = onSamples
+        self.onError = onError
+        self.waveform = waveform
+        self.energy = {}        # channel -> Wh since start
+        self.lastPower = {}     # channel -> (monotonic time, W) of the last poll, cleared by a pause
+        self.burst = burst
+        self.watchdog = watchdog
+
+        self.maxErrors = maxErrors
+        self.backoff = Backoff() if backoff is None else backoff
+        self.reconnectAt = None # monotonic_ns() of the next reconnect attempt while the link is down
+        self.failures = 0       # polls failed in a row
+        self.health = {"errors": 0, "reconnects": 0, "rtt": None, "connected": True}
+
+        # (priority, sequence, func, args) - sequence keeps FIFO order within a priority
+        self.commands = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.paused = False
+        self.running = True
+
+    def submit(self, func, *args, urgent=False):
+        """Queue func(*args) to run on the acquisition thread, returns immediately"""
+        self.commands.put((0 if urgent else 1, next(self.sequence), func, args))
+
+    def setInterval(self, interval):
+        """Set the polling interval in mS"""
+        self.interval = interval / 1000.0
+        self.submit(self._applyInterval, urgent=True)
+
+    def setBurst(self, burst):
+        """Start (or replace) triggered captures with a BurstCapture, None stops them"""
+        self.submit(self._setBurst, burst, urgent=True)
+
+    def _setBurst(self, burst):
+        if self.burst is not None:
+            self.burst.flush()
+        self.burst = burst
+        self._applyInterval()
+
+    def setWatchdog(self, watchdog):
+        """Start (or replace) protection with a Watchdog, None stops it"""
+        self.submit(setattr, self, "watchdog", watchdog, urgent=True)
+
+    def _bursting(self):
+        return self.burst is not None and self.burst.active
+
+    def _applyInterval(self):
+        interval = self.burst.interval / 1000.0 if self._bursting() else self.interval
+        if self.schedule.period != int(interval * 1e9):
+            self.schedule.setInterval(interval)
+
+    def setChannels(self, channels):
+        self.channels = list(channels)
+
+    def pause(self, paused=True):
+        """Stop passing on samples and stepping waveforms, a watchdog still polls and trips"""
+        if paused:
+            self.paused = True
+            self._wake()
+        else:
+            # Cleared by the acquisition thread, so no poll can come between it and the restart
+            self.submit(self._resume, urgent=True)
+
+    def _resume(self):
+        self._restart()
+        self.paused = False
+
+    def _restart(self):
+        # Polls missed while paused (or disconnected) weren't late, start the slots again
+        # from now, and don't integrate energy across the gap
+        self.schedule.restart()
+        if self.waveform is not None:
+            self.waveform.restart()
+        self.lastPower = {}
+
+    def stats(self):
+        """How the polls (and any waveform steps) are keeping to time, see Schedule.stats()"""
+        stats = {"poll": self.schedule.stats(), "link": dict(self.health)}
+        reconnectAt = self.reconnectAt
+        if reconnectAt is not None:
+            stats["link"]["reconnectIn"] = max(0, reconnectAt - time.monotonic_ns()) / 1e9
+        if self.waveform is not None:
+            stats["waveform"] = self.waveform.stats()
+        return stats
+
+    def stop(self, timeout=5):
+        """Stop polling, run any commands already submitted and wait for the thread to exit"""
+        self.running = False
+        self._wake()
+        if self.is_alive():
+            self.join(timeout)
+
+    def _wake(self):
+        self.commands.put((0, next(self.sequence), None, ()))
+
+    def _error(self, err):
+        if self.onError is not None:
+            self.onError(str(err))
+        else:
+            print(err)
+
+    def _execute(self, func, args):
+        if func is None:
+            return
+        try:
+            func(*args)
+        except Exception as err:
+            self._error(err)
+
+    def _drain(self):
+        """Run whatever else is queued without waiting"""
+        while True:
+            try:
+                _, _, func, args = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            self._execute(func, args)
+
+    def _polling(self):
+        # A watchdog keeps the polls going while paused, nothing else sees them
+        return not self.paused or self.watchdog is not None
+
+    def _poll(self, now, integrate=True):
+        start = time.perf_counter()
+        readings = self.inst.pollAll(self.channels)
+        self.health["rtt"] = time.perf_counter() - start
+        mono = now / 1e9
+        if integrate:
+            self._integrate(mono, readings)
+        else:
+            for ch, r in readings.items():
+                r["e"] = self.energy.get(ch, 0.0)
+        return {"time": time.time(), "mono": mono, "readings": readings}
+
+    def _failed(self, now, err):
+        self.health["errors"] += 1
+        self.failures += 1
+        self._error(err)
+        if self.maxErrors is not None and self.failures >= self.maxErrors and hasattr(self.inst, "reconnect"):
+            self.health["connected"] = False
+            self.reconnectAt = now + int(self.backoff.next() * 1e9)
+
+    def _reconnect(self, now):
+        try:
+            self.inst.reconnect()
+        except Exception as err:
+            self._error("Reconnect failed: %s" % err)
+            self.reconnectAt = now + int(self.backoff.next() * 1e9)
+            return
+        self.health["reconnects"] += 1
+        self.health["connected"] = True
+        self.reconnectAt = None
+        self.failures = 0
+        self.backoff.reset()
+        self._restart()     # the outage is a gap, like a pause
+
+    def _integrate(self, mono, readings):
+        for ch, r in readings.items():
+            last = self.lastPower.get(ch)
+            if last is not None:
+                self.energy[ch] = self.energy.get(ch, 0.0) + (last[1] + r["p"]) / 2 * (mono - last[0]) / 3600.0
+            r["e"] = self.energy.get(ch, 0.0)
+            self.lastPower[ch] = (mono, r["p"])
+
+    def _protect(self, sample):
+        received = time.monotonic_ns()
+        breaches = self.watchdog.check(sample)
+        if not breaches:
+            return
+        self.inst.eStop()
+        off = time.monotonic_ns()
+        sample["trip"] = self.watchdog.record(sample, breaches, received, off)
+
+    def _addBurst(self, sample, bursting):
+        try:
+            self.burst.add(sample)
+        except Exception as err:
+            self._error("Triggered capture failed: %s" % err)
+        if self.burst.active != bursting:
+            self._applyInterval()
+
+    def _emit(self, batch):
+        if self.onSamples is not None:
+            self.onSamples(batch)
+
+    def run(self):
+        self.schedule.restart()
+        lastEmit = time.monotonic_ns()
+        batch = []
+
+        while self.running:
+            # Sleep until the earliest of the next poll (or reconnect), batch and waveform step
+            if self.reconnectAt is not None:
+                deadlines = [self.reconnectAt]
+            else:
+                deadlines = [self.schedule.deadline()] if self._polling() else []
+            if batch:
+                deadlines.append(lastEmit + self.batchInterval)
+            stepping = self.waveform is not None and not self.paused and self.reconnectAt is None
+            nextStep = self.waveform.nextTime() if stepping else None
+            if nextStep is not None:
+                deadlines.append(nextStep)
+            timeout = max(0, min(deadlines) - time.monotonic_ns()) / 1e9 if deadlines else None
+
+            # Wait for the next poll, running any commands that arrive meanwhile.  Writes
+            # queued together go out as one message where the transport can do that
+            try:
+                _, _, func, args = self.commands.get(timeout=timeout)
+                with self.inst.coalesce():
+                    self._execute(func, args)
+                    self._drain()
+            except queue.Empty:
+                pass
+            except Exception as err:
+                self._error(err)
+
+            if not self.running:
+                break
+
+            now = time.monotonic_ns()
+            if self.reconnectAt is not None and now >= self.reconnectAt:
+                self._reconnect(now)
+            linkUp = self.reconnectAt is None
+
+            if linkUp and self.waveform is not None and not self.paused:
+                cmds = self.waveform.due(now)
+                if cmds:
+                    self._execute(self.inst.send, (cmds,))
+                    self.inst.invalidate(self.waveform.channels(), "v")
+
+            now = time.monotonic_ns()
+            if linkUp and self._polling() and self.schedule.due(now):
+                self.schedule.tick(now)
+                # Paused, the readings are only taken for the watchdog
+                paused = self.paused
+                try:
+                    sample = self._poll(now, integrate=not paused)
+                    if self.watchdog is not None:
+                        self._protect(sample)
+                    bursting = not paused and self._bursting()
+                    if not bursting and self.tempSchedule is not None and self.tempSchedule.due(now):
+                        self.tempSchedule.tick(now)
+                        sample["temp"] = self.inst.temperature()
+                        if self.watchdog is not None and "trip" not in sample:
+                            self._protect(sample)
+                    self.failures = 0
+                    if not paused:
+                        batch.append(sample)
+                        if self.burst is not None:
+                            self._addBurst(sample, bursting)
+                        if not bursting and self.checkSchedule is not None and self.checkSchedule.due(now):
+                            self.checkSchedule.tick(now)
+                            self.inst.checkSetpoints()
+                except Exception as err:
+                    self._failed(now, err)
+
+            now = time.monotonic_ns()
+            if batch and now - lastEmit >= self.batchInterval:
+                self._emit(batch)
+                batch = []
+                lastEmit = now
+
+        # Commands queued before stop(), e.g. turning the timer off on disconnect, still go out
+        try:
+            with self.inst.coalesce():
+                self._drain()
+        except Exception as err:
+            self._error(err)
+        if batch:
+            self._emit(batch)
+        if self.burst is not None:
+            self.burst.flush()
+            self.burst.wait()
@@ -0,0 +1,206 @@
+# Round robin archive for DP83X runs of any length
+#
+# An archive is one file of fixed size, allocated when it is created, so a
+# month long burn-in uses no more disk than an hour long one.  It holds tiers
+# of ring buffers: the first keeps every sample for the most recent stretch,
+# the others keep one record per 1 s, 1 min and 1 h bucket for longer and
+# longer.  When a tier's ring is full its oldest records are overwritten.
+#
+#   8 bytes   b"DP83XRRA"
+#   uint32    header length n (little endian)
+#   n bytes   JSON {"version", "idn", "model", "serial", "start", "channels",
+#             "tiers": [{"resolution", "slots", "row"}, ...]}, space padded to 8 bytes
+#   records   float64 t (time.time(), 0 for a slot not written yet), then per channel
+#             Vmin, Imin, Pmin, Vmax, Imax, Pmax, Vmean, Imean, Pmean, Energy, little endian
+# A tier's records start at record number "row", full rate records have min = max = mean.
+# Consolidated records are at the mean time of their samples and have the last Energy.
+#
+# Records are written straight into a memory map, the whole archive can be
+# read back the same way: Archive.merged() gives the run at the best
+# resolution still held for each part of it, which loads instantly.
+
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b"DP83XRRA"
+COLUMNS = ("vmin", "imin", "pmin", "vmax", "imax", "pmax", "v", "i", "p", "e")
+# (seconds per record, records), 0 is every sample: 36000 samples, then a day of 1 s,
+# 30 days of 1 min and a year of 1 h, 43 MB for three channels
+TIERS = ((0, 36000), (1, 86400), (60, 43200), (3600, 8760))
+
+
+def archiveHeader(idn, channels, start, tiers):
+    layout, row = [], 0
+    for resolution, slots in tiers:
+        layout.append({"resolution": resolution, "slots": slots, "row": row})
+        row += slots
+    meta = {"version": 1, "idn": ",".join([idn.get("company", ""), idn.get("model", ""), idn.get("serial", ""), idn.get("ver", "")]),
+            "model": idn.get("model", ""), "serial": idn.get("serial", ""), "start": start, "channels": list(channels),
+            "tiers": layout}
+    text = json.dumps(meta).encode("utf-8")
+    text += b" " * (-(len(MAGIC) + 4 + len(text)) % 8)
+    return MAGIC + struct.pack("<I", len(text)) + text, row
+
+
+class Tier(object):
+    """One ring of records and, for a consolidated tier, the bucket being filled"""
+
+    def __init__(self, resolution, rows, channels):
+        self.resolution = resolution
+        self.rows = rows
+        self.next = 0
+        self.bucket = None
+        self.count = 0
+        self.tsum = 0.0
+        self.low = np.empty((channels, 3))
+        self.high = np.empty((channels, 3))
+        self.total = np.empty((channels, 3))
+        self.energy = np.empty(channels)
+
+    def put(self, t, low, high, mean, energy):
+        row = self.rows[self.next]
+        row[0] = t
+        block = row[1:].reshape(len(energy), len(COLUMNS))
+        block[:, 0:3] = low
+        block[:, 3:6] = high
+        block[:, 6:9] = mean
+        block[:, 9] = energy
+        self.next = (self.next + 1) % len(self.rows)
+
+    def add(self, t, values):
+        """values is (channels, 4) V, I, P, Energy"""
+        vip = values[:, :3]
+        if self.resolution == 0:
+            self.put(t, vip, vip, vip, values[:, 3])
+            return
+        bucket = t // self.resolution
+        if self.count and bucket != self.bucket:
+            self.consolidate()
+        self.bucket = bucket
+        if self.count == 0:
+            self.low[:] = vip
+            self.high[:] = vip
+            self.total[:] = vip
+        else:
+            np.fmin(self.low, vip, out=self.low)
+            np.fmax(self.high, vip, out=self.high)
+            self.total += vip
+        self.energy[:] = values[:, 3]
+        self.tsum += t
+        self.count += 1
+
+    def consolidate(self):
+        """Write out the bucket being filled, if there is one"""
+        if self.count:
+            self.put(self.tsum / self.count, self.low, self.high, self.total / self.count, self.energy)
+        self.count = 0
+        self.tsum = 0.0
+
+
+class ArchiveLog(object):
+    """Round robin archive for one logging session, same interface as CaptureLog"""
+
+    def __init__(self, basename, idn, channels=("CH1", "CH2", "CH3"), tiers=TIERS, flushInterval=2.0, startTime=None):
+        os.makedirs(os.path.dirname(basename) or ".", exist_ok=True)
+        self.basename = basename
+        self.channels = list(channels)
+        self.flushInterval = flushInterval
+        self.lastFlush = time.monotonic()
+        width = 1 + len(COLUMNS)*len(self.channels)
+        header, rows = archiveHeader(idn, self.channels, time.time() if startTime is None else startTime, tiers)
+        with open(self.filename(), "wb") as file:
+            file.write(header)
+            file.truncate(len(header) + 8*width*rows)     # sparse, unwritten slots read as t = 0
+        self.map = np.memmap(self.filename(), dtype="<f8", mode="r+", offset=len(header), shape=(rows, width))
+        self.tiers = []
+        rows = self.map.view(np.ndarray)    # same memory, without memmap's slow indexing
+        row = 0
+        for resolution, slots in tiers:
+            self.tiers.append(Tier(resolution, rows[row:row + slots], len(self.channels)))
+            row += slots
+        self.values = np.empty((len(self.channels), 4))
+
+    def filename(self, channel=None):
+        return self.basename + ".rra"
+
+    def write(self, sample):
+        """Add one sample from the acquisition thread to every tier"""
+        for k, ch in enumerate(self.channels):
+            readings = sample["readings"].get(ch)
+            self.values[k] = np.nan if readings is None else (readings["v"], readings["i"], readings["p"], readings["e"])
+        for tier in self.tiers:
+            tier.add(sample["time"], self.values)
+
+        if time.monotonic() - self.lastFlush > self.flushInterval:
+            self.flush()
+
+    def flush(self):
+        self.map.flush()
+        self.lastFlush = time.monotonic()
+
+    def close(self):
+        # Part filled buckets are kept, they are still the best figures for the end of the run
+        for tier in self.tiers:
+            tier.consolidate()
+        self.map.flush()
+        del self.map
+        self.tiers = []
+
+
+class Archive(object):
+    """
+    Read an archive by memory mapping it.  tier(k) gives tier k's records oldest first,
+    merged() the whole run at the best resolution held for each part of it.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%s is not a DP83X archive" % filename)
+            (length,) = struct.unpack("<I", file.read(4))
+            self.meta = json.loads(file.read(length).decode("utf-8"))
+        self.channels = self.meta["channels"]
+        self.tiers = self.meta["tiers"]
+        rows = sum(tier["slots"] for tier in self.tiers)
+        width = 1 + len(COLUMNS)*len(self.channels)
+        self.data = np.memmap(filename, dtype="<f8", mode="r", offset=len(MAGIC) + 4 + length, shape=(rows, width))
+
+    def tier(self, k):
+        """Tier k's written records oldest first, as a (records, columns) array"""
+        rows = self.data[self.tiers[k]["row"]:self.tiers[k]["row"] + self.tiers[k]["slots"]]
+        written = np.flatnonzero(rows[:, 0] > 0)
+        return rows[written[np.argsort(rows[written, 0], kind="stable")]]
+
+    def merged(self):
+        """Every tier's records from before the next finer tier starts, oldest first"""
+        parts = []
+        until = np.inf
+        for k in range(len(self.tiers)):
+            rows = self.tier(k)
+            rows = rows[rows[:, 0] < until]
+            if len(rows):
+                parts.insert(0, rows)
+                until = rows[0, 0]
+        return np.concatenate(parts) if parts else np.zeros((0, self.data.shape[1]))
+
+    def channel(self, rows, channel):
+        """{"vmin", ..., "v", "i", "p", "e"} columns of rows from tier() or merged()"""
+        k = self.channels.index(channel)
+        return {name: rows[:, 1 + len(COLUMNS)*k + n] for n, name in enumerate(COLUMNS)}
+
+
+if __name__ == '__main__':
+    # python archive.py captures/DP832_..._YYYYMMDD_HHMMSS.rra   -> what each tier holds
+    import sys
+    for name in sys.argv[1:]:
+        arc = Archive(name)
+        print("%s  %s %s  %s" % (name, arc.meta["model"], arc.meta["serial"], ",".join(arc.channels)))
+        for k, tier in enumerate(arc.tiers):
+            rows = arc.tier(k)
+            span = "%s .. %s" % tuple(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t)) for t in (rows[0, 0], rows[-1, 0])) if len(rows) else "empty"
+            print("  %-8s %7d/%-7d %s" % ("%gs" % tier["resolution"] if tier["resolution"] else "full", len(rows), tier["slots"], span))
@@ -0,0 +1,225 @@
+# Benchmarks for acquisition, plotting and logging
+#
+# Runs headless against the simulated supply (or a real one with --connect) and
+# writes the numbers to a JSON file so runs can be compared, e.g.
+#   python bench.py
+#   python bench.py --connect "SIM::DP832::latency=15::jitter=3" --output before.json
+#   python bench.py --only latency,log
+#
+# acquisition  samples/second through the Acquisition thread at the fastest interval
+# schedule     sample interval jitter and late/missed polls at a fixed --interval under latency
+# latency      round trip of pollAll() and of the individual queries it replaces
+# redraw       DP83XGUI.redrawGraphs() frame time for several Points settings, and
+#              updateReadings() time per sample when a frame has many to take in
+# log          rows/second written by the CSV and binary capture logs
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from acquisition import Acquisition
+from capturelog import CaptureLog, BinaryCaptureLog
+from dp83x import DP83X
+
+CHANNELS = ("CH1", "CH2", "CH3")
+
+
+def percentiles(times):
+    """Summary of a list of durations in seconds, reported in mS"""
+    times = sorted(times)
+    if not times:
+        return {}
+    pick = lambda q: 1000.0*times[min(len(times) - 1, int(q*len(times)))]
+    return {"n": len(times), "mean_ms": 1000.0*sum(times)/len(times), "p50_ms": pick(0.5),
+            "p90_ms": pick(0.9), "p99_ms": pick(0.99), "max_ms": 1000.0*times[-1]}
+
+
+def connect(constr):
+    inst = DP83X()
+    inst.conn(constr)
+    inst.identify()
+    return inst
+
+
+def benchAcquisition(constr, duration):
+    inst = connect(constr)
+    batches = []
+    acq = Acquisition(inst, CHANNELS, interval=0, onSamples=batches.append)
+    start = time.monotonic()
+    acq.start()
+    time.sleep(duration)
+    acq.stop()
+    elapsed = time.monotonic() - start
+    samples = [s for b in batches for s in b]
+    gaps = [b["mono"] - a["mono"] for a, b in zip(samples, samples[1:])]
+    inst.dis()
+    return {"samples": len(samples), "seconds": elapsed, "samples_per_s": len(samples)/elapsed,
+            "interval": percentiles(gaps), "schedule": acq.stats()["poll"]}
+
+
+def benchSchedule(constr, duration, interval):
+    """Polls at a fixed interval, how close to it they land"""
+    inst = connect(constr)
+    batches = []
+    acq = Acquisition(inst, CHANNELS, interval=interval, onSamples=batches.append)
+    acq.start()
+    time.sleep(duration)
+    acq.stop()
+    samples = [s for b in batches for s in b]
+    gaps = [b["mono"] - a["mono"] for a, b in zip(samples, samples[1:])]
+    late = [(s["mono"] - samples[0]["mono"]) % (interval/1000.0) for s in samples]
+    inst.dis()
+    return {"interval_ms": interval, "samples": len(samples), "gaps": percentiles(gaps),
+            "phase": percentiles(late), "schedule": acq.stats()["poll"]}
+
+
+def benchLatency(constr, count):
+    inst = connect(constr)
+    result = {}
+
+    times = []
+    for _ in range(count):
+        t = time.perf_counter()
+        inst.pollAll(CHANNELS)
+        times.append(time.perf_counter() - t)
+    result["pollAll"] = percentiles(times)
+    result["pollAll"]["compound"] = inst.compound
+
+    # What one tick used to cost: MEAS:ALL? and OUTP? per channel
+    times = []
+    for _ in range(count):
+        t = time.perf_counter()
+        for ch in CHANNELS:
+            inst.readings(ch)
+            inst.state(ch)
+        times.append(time.perf_counter() - t)
+    result["individual"] = percentiles(times)
+
+    times = []
+    for _ in range(count):
+        t = time.perf_counter()
+        inst.readings("CH1")
+        times.append(time.perf_counter() - t)
+    result["single_query"] = percentiles(times)
+    inst.dis()
+    return result
+
+
+def benchRedraw(constr, pointsList, frames):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    os.chdir(tempfile.mkdtemp())        # the log written below goes in ./captures
+    import dpgui
+    from PySide6.QtCore import QSettings
+
+    app = dpgui.makeApplication()
+    QSettings().setValue('constring', constr)
+    window = dpgui.DP83XGUI()
+    window.show()
+    window.tryConnect()
+    # Only the drawing is being measured, stop everything that would feed the graphs
+    window.acq.pause(True)
+    window.session.displaytimer.stop()
+    for ch in window.waveforms.channels():
+        window.waveforms.set(ch, None)
+    for g in window.graphsettings:
+        for name in ("venabled", "ienabled", "penabled"):
+            g[name].setChecked(True)
+
+    result = {}
+    for points in pointsList:
+        for i in range(len(window.graphsettings)):
+            window.setPoints(i, points)
+            trace = window.traces[i]
+            for n in range(points):
+                trace.append(n, 5.0 + (n % 100)/100.0, 0.1, 0.5)
+        app.processEvents()
+        times = []
+        for n in range(frames):
+            for trace in window.traces:
+                trace.append(points + n, 5.0, 0.1, 0.5)
+            window.session.now = points + n        # as the display timer would
+            t = time.perf_counter()
+            window.redrawGraphs()
+            app.processEvents()         # includes the repaint
+            times.append(time.perf_counter() - t)
+        result[str(points)] = percentiles(times)
+
+    # updateReadings with a frame's worth of samples waiting, logging on
+    window.loggingPushButton.setChecked(True)
+    window.setLogging()
+    readings = {ch: {"v": 5.0, "i": 0.1, "p": 0.5, "e": 0.0, "state": "ON"} for ch in CHANNELS}
+    times = []
+    for n in range(frames):
+        window.acqBridge.push([{"time": time.time(), "mono": time.monotonic(), "readings": readings}] * 100)
+        t = time.perf_counter()
+        window.updateReadings()
+        times.append((time.perf_counter() - t) / 100)
+    result["updateReadings_per_sample"] = percentiles(times)
+    window.loggingPushButton.setChecked(False)
+    window.setLogging()
+
+    window.close()
+    return result
+
+
+def benchLog(rows):
+    sample = {"time": 0.0, "readings": {ch: {"v": 5.0, "i": 0.1, "p": 0.5, "e": 0.0} for ch in CHANNELS}}
+    idn = {"company": "RIGOL TECHNOLOGIES", "model": "DP832", "serial": "BENCH", "ver": "0"}
+    result = {}
+    with tempfile.TemporaryDirectory() as path:
+        for name, log in (("csv", CaptureLog(os.path.join(path, "bench"), CHANNELS)),
+                          ("bin", BinaryCaptureLog(os.path.join(path, "bench"), idn, CHANNELS))):
+            t = time.perf_counter()
+            for n in range(rows):
+                sample["time"] = n*0.01
+                log.write(sample)
+            log.close()
+            elapsed = time.perf_counter() - t
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path) if f.startswith("bench") and f.endswith(name))
+            result[name] = {"rows": rows, "seconds": elapsed, "rows_per_s": rows/elapsed, "bytes_per_row": size/rows}
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DP83X GUI benchmarks")
+    parser.add_argument("--connect", default="SIM::DP832::seed=1", help="connect string, default is the simulator with no latency")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--only", default="acquisition,schedule,latency,redraw,log")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds of acquisition")
+    parser.add_argument("--interval", type=int, default=50, help="mS between polls for the schedule test")
+    parser.add_argument("--count", type=int, default=200, help="queries per latency test")
+    parser.add_argument("--points", default="1000,4096,30000")
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args(argv)
+    args.output = os.path.abspath(args.output)     # benchRedraw changes directory
+
+    results = {"connect": args.connect, "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "python": platform.python_version(), "platform": platform.platform()}
+    only = args.only.split(",")
+    if "acquisition" in only:
+        results["acquisition"] = benchAcquisition(args.connect, args.duration)
+    if "schedule" in only:
+        results["schedule"] = benchSchedule(args.connect, args.duration, args.interval)
+    if "latency" in only:
+        results["latency"] = benchLatency(args.connect, args.count)
+    if "redraw" in only:
+        try:
+            results["redraw"] = benchRedraw(args.connect, [int(p) for p in args.points.split(",")], args.frames)
+        except ImportError as err:
+            results["redraw"] = {"skipped": str(err)}
+    if "log" in only:
+        results["log"] = benchLog(args.rows)
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
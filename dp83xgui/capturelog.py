@@ -0,0 +1,295 @@
+# Capture logging for the DP83X
+#
+# CSV logs are one file per channel, opened once when logging starts and kept
+# open until it stops.  Writes go through a large buffer which is flushed when
+# it fills up, every flushInterval seconds, and on close, so a crash loses at
+# most a few seconds of data rather than costing an open()/close() per sample.
+#
+# Binary logs (.bin) hold every channel in one file:
+#   8 bytes   b"DP83XCAP"
+#   uint32    header length n (little endian)
+#   n bytes   JSON {"version", "idn", "model", "serial", "start", "channels"},
+#             space padded so the records start on an 8 byte boundary
+#   records   float64 timestamp, then V, I, P, Energy per channel, little endian
+# so a file can be memory mapped straight into NumPy arrays, see BinaryCapture.
+# Energy is in Wh since the acquisition started, as integrated by Acquisition.
+#
+# Archives (.rra) are fixed size files for runs of any length, see archive.py.
+
+import json
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+PATHTOLOG = "captures"
+MAGIC = b"DP83XCAP"
+FIELDS = ("v", "i", "p", "e")
+
+
+def captureName(idn, path=PATHTOLOG, when=None):
+    """Prepare filename as captures/MODEL_SERIAL_YYYYMMDD_HHMMSS, the channel and extension get added per file"""
+    timestamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(when))
+    return os.path.join(path, idn["model"] + "_" + idn["serial"] + "_" + timestamp)
+
+
+class CaptureLog(object):
+    """CSV capture files for one logging session, Timestamp,Volts,Curr,Power,Energy per channel"""
+
+    HEADER = "Timestamp,Volts,Curr,Power,Energy\n"
+
+    def __init__(self, basename, channels=("CH1", "CH2", "CH3"), flushInterval=2.0, bufferSize=64*1024, startTime=None):
+        os.makedirs(os.path.dirname(basename) or ".", exist_ok=True)
+        self.basename = basename
+        self.flushInterval = flushInterval
+        self.lastFlush = time.monotonic()
+        self.startTime = startTime
+        self.files = {}
+        for ch in channels:
+            self.files[ch] = open(self.filename(ch), "w", buffering=bufferSize)
+            self.files[ch].write(self.HEADER)
+
+    def filename(self, channel):
+        return self.basename + "_" + channel + ".csv"
+
+    def write(self, sample):
+        """Log one sample from the acquisition thread, timestamps are relative to the first sample"""
+        if self.startTime is None:
+            self.startTime = sample["time"]
+        t = sample["time"] - self.startTime
+        for ch, file in self.files.items():
+            readings = sample["readings"].get(ch)
+            if readings is None:
+                continue
+            file.write("%f,%f,%f,%f,%f\n" % (t, readings["v"], readings["i"], readings["p"], readings["e"]))
+
+        if time.monotonic() - self.lastFlush > self.flushInterval:
+            self.flush()
+
+    def flush(self):
+        for file in self.files.values():
+            file.flush()
+        self.lastFlush = time.monotonic()
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+        self.files = {}
+
+
+class BinaryCaptureLog(object):
+    """Binary capture file for one logging session, same interface as CaptureLog"""
+
+    def __init__(self, basename, idn, channels=("CH1", "CH2", "CH3"), flushInterval=2.0, bufferSize=64*1024, startTime=None):
+        os.makedirs(os.path.dirname(basename) or ".", exist_ok=True)
+        self.basename = basename
+        self.channels = list(channels)
+        self.flushInterval = flushInterval
+        self.lastFlush = time.monotonic()
+        self.startTime = startTime
+        self.record = struct.Struct("<%dd" % (1 + len(FIELDS)*len(self.channels)))
+        self.file = open(self.filename(), "wb", buffering=bufferSize)
+        self.file.write(binaryHeader(idn, self.channels, time.time() if startTime is None else startTime))
+
+    def filename(self, channel=None):
+        return self.basename + ".bin"
+
+    def write(self, sample):
+        """Log one sample from the acquisition thread, timestamps are relative to the first sample"""
+        if self.startTime is None:
+            self.startTime = sample["time"]
+        row = [sample["time"] - self.startTime]
+        for ch in self.channels:
+            readings = sample["readings"].get(ch)
+            if readings is None:
+                row += [float("nan")] * len(FIELDS)
+            else:
+                row += [readings["v"], readings["i"], readings["p"], readings["e"]]
+        self.file.write(self.record.pack(*row))
+
+        if time.monotonic() - self.lastFlush > self.flushInterval:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        self.lastFlush = time.monotonic()
+
+    def close(self):
+        self.file.close()
+
+
+def binaryHeader(idn, channels, start):
+    meta = {"version": 1, "idn": ",".join([idn.get("company", ""), idn.get("model", ""), idn.get("serial", ""), idn.get("ver", "")]),
+            "model": idn.get("model", ""), "serial": idn.get("serial", ""), "start": start, "channels": list(channels)}
+    text = json.dumps(meta).encode("utf-8")
+    text += b" " * (-(len(MAGIC) + 4 + len(text)) % 8)
+    return MAGIC + struct.pack("<I", len(text)) + text
+
+
+def openCaptureLog(idn, fmt="csv", channels=("CH1", "CH2", "CH3"), path=PATHTOLOG, startTime=None, suffix=""):
+    """
+    Start a new capture in the given format, csv, bin or archive.  startTime (time.time()) names the
+    file and is t=0 in it, by default that is the first sample.  suffix goes on the end of the name.
+    """
+    basename = captureName(idn, path, startTime) + suffix
+    if fmt == "bin":
+        return BinaryCaptureLog(basename, idn, channels, startTime=startTime)
+    if fmt == "archive":
+        from archive import ArchiveLog
+        return ArchiveLog(basename, idn, channels, startTime=startTime)
+    return CaptureLog(basename, channels, startTime=startTime)
+
+
+class BinaryCapture(object):
+    """
+    Read a binary capture by memory mapping it, nothing is parsed or copied.
+    t is the timestamp array, channel("CH1") gives {"v", "i", "p", "e"} arrays.
+    A partly written last record (e.g. the logger was killed) is ignored.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%s is not a DP83X binary capture" % filename)
+            (length,) = struct.unpack("<I", file.read(4))
+            self.meta = json.loads(file.read(length).decode("utf-8"))
+        self.channels = self.meta["channels"]
+        offset = len(MAGIC) + 4 + length
+        width = 1 + len(FIELDS)*len(self.channels)
+        rows = (os.path.getsize(filename) - offset) // (8*width)
+        if rows > 0:
+            self.data = np.memmap(filename, dtype="<f8", mode="r", offset=offset, shape=(rows, width))
+        else:
+            self.data = np.zeros((0, width))
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @property
+    def t(self):
+        return self.data[:, 0]
+
+    def channel(self, channel):
+        k = self.channels.index(channel)
+        return {name: self.data[:, 1 + len(FIELDS)*k + n] for n, name in enumerate(FIELDS)}
+
+
+def splitCaptureName(filename):
+    """Return (basename, channel) for captures/MODEL_SERIAL_YYYYMMDD_HHMMSS_CH1.csv"""
+    base = os.path.splitext(filename)[0]
+    if base[-4:-1] == "_CH":
+        return base[:-4], base[-3:]
+    return base, None
+
+
+def readCsv(filename):
+    """Load a CSV capture as a (rows, columns) array, skipping any line that isn't numbers"""
+    with open(filename) as file:
+        lines = [line for line in file if line[:1] in "0123456789-."]
+    if not lines:
+        return np.zeros((0, 1 + len(FIELDS)))
+    return np.loadtxt(lines, delimiter=",", ndmin=2)
+
+
+def nameMeta(basename, channels):
+    """MODEL_SERIAL_YYYYMMDD_HHMMSS tells us most of what a binary header holds, returns (idn, start)"""
+    parts = os.path.basename(basename).split("_")
+    idn = {"model": parts[0], "serial": parts[1] if len(parts) > 1 else ""}
+    try:
+        start = time.mktime(time.strptime(parts[2] + parts[3], "%Y%m%d%H%M%S"))
+    except (IndexError, ValueError):
+        start = os.path.getmtime(basename + "_" + channels[0] + ".csv")
+    return idn, start
+
+
+def loadCapture(filename):
+    """
+    Load a .bin capture, or all the _CHn.csv files belonging to one CSV capture.
+    Returns (meta, {"CH1": {"t", "v", "i", "p", "e"}, ...}), binary captures stay memory mapped.
+    An archive (.rra) is loaded at the best resolution it has for each part of the run,
+    and its channels have "vmin", "vmax" etc. as well.
+    """
+    channels = {}
+    if filename.endswith(".rra"):
+        from archive import Archive
+        arc = Archive(filename)
+        rows = arc.merged()
+        for ch in arc.channels:
+            channels[ch] = arc.channel(rows, ch)
+            channels[ch]["t"] = rows[:, 0] - arc.meta["start"]
+        return arc.meta, channels
+
+    if filename.endswith(".bin"):
+        cap = BinaryCapture(filename)
+        for ch in cap.channels:
+            channels[ch] = cap.channel(ch)
+            channels[ch]["t"] = cap.t
+        return cap.meta, channels
+
+    basename = splitCaptureName(filename)[0]
+    for ch in ("CH1", "CH2", "CH3"):
+        if os.path.exists(basename + "_" + ch + ".csv"):
+            data = readCsv(basename + "_" + ch + ".csv")
+            channels[ch] = {"t": data[:, 0]}
+            for n, name in enumerate(FIELDS):
+                channels[ch][name] = data[:, n + 1] if data.shape[1] > n + 1 else np.full(len(data), np.nan)
+    if not channels:
+        raise FileNotFoundError("No %s_CHn.csv files" % basename)
+
+    idn, start = nameMeta(basename, list(channels))
+    meta = {"idn": "", "model": idn["model"], "serial": idn["serial"], "start": start, "channels": list(channels)}
+    return meta, channels
+
+
+def csvToBinary(basename, outname=None):
+    """
+    Combine basename_CH1.csv, _CH2.csv... into basename.bin.  Files written by older
+    versions have no Energy column, it is stored as NaN.
+    """
+    channels, columns = [], []
+    for ch in ("CH1", "CH2", "CH3"):
+        if os.path.exists(basename + "_" + ch + ".csv"):
+            channels.append(ch)
+            columns.append(readCsv(basename + "_" + ch + ".csv"))
+    if not channels:
+        raise FileNotFoundError("No %s_CHn.csv files" % basename)
+
+    rows = min(len(c) for c in columns)
+    data = np.full((rows, 1 + len(FIELDS)*len(channels)), np.nan)
+    data[:, 0] = columns[0][:rows, 0]
+    for k, c in enumerate(columns):
+        n = min(c.shape[1] - 1, len(FIELDS))
+        data[:, 1 + len(FIELDS)*k:1 + len(FIELDS)*k + n] = c[:rows, 1:1 + n]
+
+    idn, start = nameMeta(basename, channels)
+    outname = outname or basename + ".bin"
+    with open(outname, "wb") as file:
+        file.write(binaryHeader(idn, channels, start))
+        file.write(data.astype("<f8").tobytes())
+    return outname
+
+
+def binaryToCsv(filename, basename=None):
+    """Write a binary capture back out as basename_CHn.csv files in the CaptureLog layout"""
+    cap = BinaryCapture(filename)
+    basename = basename or os.path.splitext(filename)[0]
+    names = []
+    for ch in cap.channels:
+        d = cap.channel(ch)
+        names.append(basename + "_" + ch + ".csv")
+        np.savetxt(names[-1], np.column_stack((cap.t, d["v"], d["i"], d["p"], d["e"])),
+                   fmt="%f", delimiter=",", header=CaptureLog.HEADER.rstrip("\n"), comments="")
+    return names
+
+
+if __name__ == '__main__':
+    # python capturelog.py captures/DP831_..._CH1.csv  -> captures/DP831_....bin
+    # python capturelog.py captures/DP831_....bin      -> captures/DP831_..._CHn.csv
+    for name in sys.argv[1:]:
+        if name.endswith(".bin"):
+            print(binaryToCsv(name))
+        else:
+            print(csvToBinary(splitCaptureName(name)[0]))
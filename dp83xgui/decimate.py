@@ -0,0 +1,70 @@
+# Level of detail for big captures
+#
+# A MinMaxPyramid is built once per trace: level 1 holds the min and max of
+# every `block` samples, each level above that is `factor` times coarser.  To
+# draw, we pick the finest level that gives no more than ~1 min/max pair per
+# pixel over the visible range, so a zoomed out 24 h log costs about the same
+# to draw as a zoomed in few seconds, and peaks never disappear between points.
+#
+# Level 0 is the original array which isn't copied (it can be a memmap), with
+# the default block size the levels above add about a quarter of its size.
+# Data that is already min/max per point (an archive tier, see archive.py)
+# passes both arrays and is drawn as min to max lines at every level.
+
+import numpy as np
+
+
+class MinMaxPyramid(object):
+    """Min/max decimation of y against sorted x, or of y..ymax if each point is already a range"""
+
+    def __init__(self, x, y, block=16, factor=4, smallest=1024, ymax=None):
+        self.x = x
+        self.y = y
+        self.ymax = ymax
+        self.levels = []    # (x, ymin, ymax) coarsest last
+
+        lx, lmin, lmax, step = x, y, y if ymax is None else ymax, block
+        while len(lx) > smallest:
+            idx = np.arange(0, len(lx), step)
+            lx = lx[idx]
+            lmin = np.fmin.reduceat(lmin, idx)
+            lmax = np.fmax.reduceat(lmax, idx)
+            self.levels.append((lx, lmin, lmax))
+            step = factor
+
+    def __len__(self):
+        return len(self.x)
+
+    def bounds(self):
+        if len(self.x) == 0:
+            return 0.0, 1.0
+        return float(self.x[0]), float(self.x[-1])
+
+    def query(self, x0, x1, pixels):
+        """Return (x, y) covering x0..x1 with at most about 2 points per pixel"""
+        i0, i1 = self._slice(self.x, x0, x1)
+        if i1 - i0 <= 2*pixels or not self.levels:
+            if self.ymax is None:
+                return np.asarray(self.x[i0:i1]), np.asarray(self.y[i0:i1])
+            return self._lines(self.x, self.y, self.ymax, i0, i1)
+
+        for lx, lmin, lmax in self.levels:
+            i0, i1 = self._slice(lx, x0, x1)
+            if i1 - i0 <= pixels:
+                break
+
+        return self._lines(lx, lmin, lmax, i0, i1)
+
+    def _lines(self, lx, lmin, lmax, i0, i1):
+        # Draw each block as a vertical line from its min to its max
+        xs = np.repeat(lx[i0:i1], 2)
+        ys = np.empty(len(xs))
+        ys[0::2] = lmin[i0:i1]
+        ys[1::2] = lmax[i0:i1]
+        return xs, ys
+
+    def _slice(self, x, x0, x1):
+        # One extra point either side so the line runs off the edge of the view
+        i0 = max(int(np.searchsorted(x, x0)) - 1, 0)
+        i1 = min(int(np.searchsorted(x, x1, side="right")) + 1, len(x))
+        return i0, i1
@@ -1,5 +1,8 @@
 # pip install pyvisa-py
+import contextlib
 import os
+import select
+import time
 
 #Insert your serial number here / confirm via Ultra Sigma GUI
 # examples "TCPIP0::192.168.1.60::INSTR" 
@@ -8,29 +11,173 @@ import os
 CONNECTSTRING = "TCPIP0::172.16.0.125::INSTR"
 #CONNECTSTRING = "TCPIP0::192.168.1.60::INSTR"
 
+# The DP800 Timer function holds each group for 1s to 99999s, up to 2048 groups
+TIMERMINSTEP = 1.0
+TIMERMAXGROUPS = 2048
+
+def common(cmd):
+    """cmd with a leading colon, so it starts from the root in a compound message, unless it's *IDN? etc."""
+    cmd = cmd.strip()
+    return cmd if cmd.startswith("*") else ":" + cmd.lstrip(":")
+
+def joined(cmds):
+    """One compound message for cmds.  Each starts from the root, otherwise OUTP CH1,OFF
+    after :SOURce1:CURRent 1 would be taken as :SOURce1:OUTP"""
+    return ";".join(common(cmd) for cmd in cmds)
+
 # Implementation using char devices
 # e.g. Linux USBTMC kernel driver or RS-232
+#
+# Same interface as the pyvisa resource (write/read/query/clear/close, timeout
+# in mS), so DP83X doesn't care which it has.  Replies are read into one
+# preallocated buffer until the read termination turns up or timeout runs out.
+# The usbtmc driver only says a reply is ready by returning it from read(), so
+# there it's the driver's own timeout that applies; a serial port is waited on
+# with select().  Inside a `with inst.coalesce():` block writes are joined into
+# one compound message, sent when the block ends or before the next query.
+
+USBTMC_IOCTL_CLEAR = 0x5b02           # _IO('[', 2)
+USBTMC_IOCTL_SET_TIMEOUT = 0x40045b0a # _IOW('[', 10, __u32), Linux 4.19+
+
 class CharDevInst():
-    def __init__(self, path):
-        self.fd = os.open(path, os.O_RDWR)
+    def __init__(self, path, timeout=2000, read_termination="\n", write_termination="\n", bufsize=4096):
+        self.path = path
+        self.read_termination = read_termination
+        self.write_termination = write_termination
+        self.usbtmc = os.path.basename(path).startswith("usbtmc")
+        self.buffer = bytearray(bufsize)
+        self.view = memoryview(self.buffer)
+        self.count = 0          # bytes in buffer not returned yet, a serial port can run ahead of read()
+        self.pending = None     # writes held back by coalesce()
+        self.fd = os.open(path, os.O_RDWR | os.O_NOCTTY)
+        if os.isatty(self.fd):
+            import tty
+            tty.setraw(self.fd)
+        self.timeout = timeout
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        """mS, like pyvisa"""
+        self._timeout = timeout
+        if self.usbtmc:
+            import fcntl, struct
+            try:
+                fcntl.ioctl(self.fd, USBTMC_IOCTL_SET_TIMEOUT, struct.pack("I", int(timeout)))
+            except OSError:
+                pass            # older kernel, the driver's default of 5s applies
 
     def write(self, cmd):
-        os.write(self.fd, cmd.encode("ascii"))
+        if self.pending is not None:
+            self.pending.append(cmd)
+            return
+        os.write(self.fd, (cmd + self.write_termination).encode("ascii"))
+
+    def flush(self):
+        """Send any coalesced writes now"""
+        if self.pending:
+            cmds, self.pending = self.pending, []
+            os.write(self.fd, (joined(cmds) + self.write_termination).encode("ascii"))
+
+    @contextlib.contextmanager
+    def coalesce(self):
+        self.pending = []
+        try:
+            yield self
+            self.flush()
+        finally:
+            self.pending = None
+
+    def _take(self, end):
+        """Return the first end bytes of the buffer and keep the rest for the next read"""
+        reply = bytes(self.view[:end])
+        self.view[:self.count - end] = self.view[end:self.count]
+        self.count -= end
+        return reply.decode("ascii")
+
+    def read(self):
+        term = self.read_termination.encode("ascii")
+        deadline = time.monotonic() + self._timeout / 1000.0
+        while True:
+            end = self.buffer.find(term, 0, self.count)
+            if end >= 0:
+                return self._take(end + len(term))
+
+            if self.count == len(self.buffer):
+                self.view.release()
+                self.buffer.extend(bytes(len(self.buffer)))
+                self.view = memoryview(self.buffer)
+            if not self.usbtmc:
+                wait = deadline - time.monotonic()
+                if wait <= 0 or not select.select([self.fd], [], [], wait)[0]:
+                    raise IOError("Timeout reading %s, got %r"%(self.path, bytes(self.view[:self.count])))
+            try:
+                n = os.readv(self.fd, [self.view[self.count:]])
+            except TimeoutError:
+                raise IOError("Timeout reading %s"%self.path)
+            if n == 0:
+                raise IOError("%s closed"%self.path)
+            self.count += n
+            # usbtmc hands over a whole message per read, which needn't end in the terminator
+            if self.usbtmc and self.count < len(self.buffer) and self.buffer.find(term, 0, self.count) < 0:
+                return self._take(self.count)
 
     def query(self, cmd):
+        self.flush()
         self.write(cmd)
-        return os.read(self.fd, 4096).decode("ascii")
+        return self.read()
+
+    def clear(self):
+        """Throw away anything half read and ask the device to clear its buffers"""
+        self.count = 0
+        if self.pending is not None:
+            self.pending = []
+        if self.usbtmc:
+            import fcntl
+            try:
+                fcntl.ioctl(self.fd, USBTMC_IOCTL_CLEAR)
+            except OSError:
+                pass
+        elif os.isatty(self.fd):
+            import termios
+            termios.tcflush(self.fd, termios.TCIOFLUSH)
+
+    def close(self):
+        self.view.release()
+        os.close(self.fd)
 
 class DP83X(object):
     def __init__(self):
-        pass
+        # Set False if the firmware rejects semicolon joined queries, see pollAll()
+        self.compound = True
+        self.idn = None
+        self.expected = None    # the supply reconnect() must find, kept while attempts fail
+        self.timer = None
+        # Last commanded setpoints, {"CH1": {"v": 5.0, "i": 1.0, "state": "ON"}, ...}.  Only
+        # what we know is in here, anything missing gets written, see setpoint()
+        self.setpoints = {}
 
     def conn(self, constr):
         """Attempt to connect to instrument"""
+        self.constr = constr
+        self.idn = None
+        self.timer = None
+        self.setpoints = {}
         try:
             # /dev/usbtmc0, maybe TTY for RS-232
             if constr.startswith('/'):
                 self.inst = CharDevInst(constr)
+            # SIM::DP832 - no hardware needed, see dp83xsim.py
+            elif constr.startswith('SIM::'):
+                from dp83xsim import SimInst
+                self.inst = SimInst(constr)
+            # SHARE::127.0.0.1:5025 - a supply another program is sharing, see dp83xshare.py
+            elif constr.startswith('SHARE::'):
+                from dp83xshare import ShareInst
+                self.inst = ShareInst(constr)
             else:
                 import pyvisa as visa
                 rm = visa.ResourceManager()
@@ -40,11 +187,12 @@ class DP83X(object):
             raise err
   
     def identify(self):
-        """Return identify string which has serial number"""
-        resp = self.inst.query("*IDN?").rstrip("\n").split(',')
-        dr = {"company":resp[0], "model":resp[1], "serial":resp[2], "ver":resp[3]}
-        
-        return dr
+        """Return identify string which has serial number, only asks the instrument once per connection"""
+        if self.idn is None:
+            resp = self.inst.query("*IDN?").rstrip("\n").split(',')
+            self.idn = {"company":resp[0], "model":resp[1], "serial":resp[2], "ver":resp[3]}
+
+        return dict(self.idn)
 
     def readings(self, channel="CH1"):
         """Read voltage/current/power from CH1/CH2/CH3"""       
@@ -53,50 +201,261 @@ class DP83X(object):
         dr = {"v":float(resp[0]), "i":float(resp[1]), "p":float(resp[2])}
         return dr
 
+    def pollAll(self, channels=("CH1", "CH2", "CH3")):
+        """
+        Read voltage/current/power and output state for several channels in one round trip.
+        Returns {"CH1": {"v":..., "i":..., "p":..., "state":"ON"}, ...}
+        """
+        queries = self._pollQueries(channels)
+        if not self.compound:
+            return self._pollEach(channels, queries)
+        try:
+            resp = self.inst.query(":" + ";:".join(queries)).rstrip("\n").split(';')
+            return self._parsePoll(channels, resp)
+        except Exception as err:
+            failed = err
+        # A timeout or a reply we can't make sense of.  If the same readings one at a time
+        # work the firmware doesn't take compound queries, don't try them again.  If not
+        # it's the link, that raises and compound queries are tried again next time
+        if hasattr(self.inst, "clear"):
+            self.inst.clear()
+        dr = self._pollEach(channels, queries)
+        print("Compound query failed, using one query per reading: ", failed)
+        self.compound = False
+        return dr
+
+    def _pollEach(self, channels, queries):
+        # Can't pipeline these: SCPI throws away an unread reply when the next query arrives
+        resp = [self.inst.query(q).rstrip("\n") for q in queries]
+        return self._parsePoll(channels, resp)
+
+    def _pollQueries(self, channels):
+        queries = []
+        for channel in channels:
+            queries.append("MEAS:ALL? %s"%channel)
+            queries.append("OUTP? %s"%channel)
+        return queries
+
+    def _parsePoll(self, channels, resp):
+        if len(resp) != 2*len(channels):
+            raise ValueError("Expected %d replies, got %r"%(2*len(channels), resp))
+        dr = {}
+        for n, channel in enumerate(channels):
+            meas = resp[2*n].split(',')
+            dr[channel] = {"v":float(meas[0]), "i":float(meas[1]), "p":float(meas[2]), "state":resp[2*n+1].strip()}
+            self._checkState(channel, dr[channel]["state"])
+        return dr
+
+    def _checkState(self, channel, state):
+        """An output we didn't switch has been changed on the front panel (or tripped), forget that channel"""
+        cached = self.setpoints.get(channel, {}).get("state")
+        if cached is not None and cached != state.upper():
+            self.invalidate(channel)
+
+    def invalidate(self, channels=None, field=None):
+        """Forget cached setpoints, for channels (default all) and field "v", "i" or "state" (default all)"""
+        if isinstance(channels, str):
+            channels = [channels]
+        for channel in list(self.setpoints) if channels is None else channels:
+            if field is None:
+                self.setpoints.pop(channel, None)
+            else:
+                self.setpoints.get(channel, {}).pop(field, None)
+
+    def setpoint(self, channel, volts=None, current=None, state=None):
+        """
+        Set any of voltage, current and output state for channel ("CH1"), None leaves it alone.
+        Only values that differ from the last ones commanded are written, all in one message.
+        Returns the commands sent.
+        """
+        cmds, changes = self._setpointCommands(channel, volts, current, state)
+        if cmds:
+            self.send(cmds)
+        # Only after the write worked, an exception leaves the cache as it was
+        self.setpoints.setdefault(channel, {}).update(changes)
+        return cmds
+
+    def _setpointCommands(self, channel, volts, current, state):
+        """The commands setpoint() needs to send and the cache entries they change"""
+        cached = self.setpoints.get(channel, {})
+        changes = {}
+        if volts is not None and cached.get("v") != round(float(volts), 3):
+            changes["v"] = round(float(volts), 3)
+        if current is not None and cached.get("i") != round(float(current), 3):
+            changes["i"] = round(float(current), 3)
+        if state is not None and cached.get("state") != state.upper():
+            changes["state"] = state.upper()
+
+        cmds = []
+        if "v" in changes and "i" in changes:
+            cmds.append(":APPL %s,%.3f,%.3f"%(channel, changes["v"], changes["i"]))
+        elif "v" in changes:
+            cmds.append(":APPL %s,%.3f"%(channel, changes["v"]))
+        elif "i" in changes:
+            cmds.append(":SOURce%s:CURRent %.3f"%(channel[-1], changes["i"]))
+        if "state" in changes:
+            cmds.append(":OUTP %s,%s"%(channel, changes["state"]))
+        return cmds, changes
+
+    def checkSetpoints(self, channels=None):
+        """
+        Read back the setpoints of channels (default those cached) in one query and forget any
+        that were changed on the front panel.  Returns the channels that had changed.
+        """
+        channels = [ch for ch in (channels or list(self.setpoints)) if self.setpoints.get(ch)]
+        if not channels:
+            return []
+        queries = ["APPL? %s"%channel for channel in channels]
+        if self.compound:
+            resp = self.inst.query(":" + ";:".join(queries)).rstrip("\n").split(';')
+        else:
+            resp = [self.inst.query(q).rstrip("\n") for q in queries]
+        return self._checkReplies(channels, resp)
+
+    def _checkReplies(self, channels, resp):
+        changed = []
+        for channel, reply in zip(channels, resp):
+            # CH1:30V/3A,5.000,1.000
+            values = reply.split(",")
+            actual = {"v": round(float(values[-2]), 3), "i": round(float(values[-1]), 3)}
+            cached = self.setpoints[channel]
+            if any(field in cached and cached[field] != actual[field] for field in actual):
+                self.invalidate(channel)
+                changed.append(channel)
+        return changed
+
     def dis(self):
         self.inst.write(":SYSTEM:LOCAL")
+        if hasattr(self.inst, "close"):
+            self.inst.close()
         del self.inst
+
+    def reconnect(self):
+        """
+        Drop the connection and open it again with the same connect string.  Raises
+        IOError if something other than the supply we had answers.
+        """
+        self.expected = self.idn or self.expected
+        try:
+            if hasattr(self.inst, "close"):
+                self.inst.close()
+        except Exception:
+            pass            # it's the broken connection we're replacing
+        self.conn(self.constr)
+        # Compound queries may only have failed because the link was going down, try them again
+        self.compound = True
+        self._checkSame(self.identify())
+
+    def _checkSame(self, idn):
+        old = self.expected
+        if old is not None and (idn["model"], idn["serial"]) != (old["model"], old["serial"]):
+            self.idn = None     # so the next attempt still looks for the old one
+            raise IOError("Reconnected to %s %s, not %s %s"%(idn["model"], idn["serial"], old["model"], old["serial"]))
+
+    def coalesce(self):
+        """
+        Context manager that sends the writes made inside it as one message, if the
+        transport can (CharDevInst) and the firmware takes compound commands
+        """
+        if self.compound and hasattr(self.inst, "coalesce"):
+            return self.inst.coalesce()
+        return contextlib.nullcontext()
     
     def applyVoltage(self,channel, voltage):
-        self.inst.write(":APPL %s,%s"% (channel, voltage))
+        self.setpoint(channel, volts=voltage)
         
     def applyCurrent(self,channel, current):
-        print(":SOURce %s :CURRent %s"%(channel, current))
-        self.inst.write(":SOURce%s:CURRent %s"%(channel, current))
+        # channel can be the number on its own, "2" as well as "CH2"
+        self.setpoint("CH%s"%channel[-1], current=current)
 
     def queryVolt(self, channel):
-        return(float((self.inst.query(":APPL? %s ,VOLTage"%channel)).rstrip("\n")))
+        volts = float((self.inst.query(":APPL? %s ,VOLTage"%channel)).rstrip("\n"))
+        self.setpoints.setdefault(channel, {})["v"] = round(volts, 3)
+        return volts
     
     def queryCurr(self, channel):
-        return(float((self.inst.query(":APPL? %s ,CURRent"%channel)).rstrip("\n")))
+        current = float((self.inst.query(":APPL? %s ,CURRent"%channel)).rstrip("\n"))
+        self.setpoints.setdefault(channel, {})["i"] = round(current, 3)
+        return current
 
-    def off(self,channels=["Ch1","CH2","CH3"]):
+    def off(self,channels=("CH1","CH2","CH3")):
+        # Always written, whatever the cache thinks
+        self.send(["OUTP %s,OFF"%channel for channel in channels])
         for channel in channels:
-            self.inst.write("OUTP " + channel + ",OFF")
+            self.setpoints.setdefault(channel.upper(), {})["state"] = "OFF"
             
     def eStop(self):
         self.inst.write("OUTP ALL ,OFF")
+        self.invalidate(field="state")
         
     def allOn(self):
         self.inst.write("OUTP ALL ,ON")
+        self.invalidate(field="state")
             
     def on(self,channel="CH1"):
-        self.inst.write("OUTP " + channel + ",on")
-        print(channel)
+        self.setpoint(channel, state="ON")
             
     def state(self,channel="CH1"):
-        return((self.inst.query("OUTP? " + channel )).rstrip("\n"))
+        state = (self.inst.query("OUTP? " + channel )).rstrip("\n")
+        self.setpoints.setdefault(channel, {})["state"] = state.strip().upper()
+        return state
         
     def applyState(self,channel="CH1",state="OFF"):
-        print(channel)
-        print(state)
-        self.inst.write("OUTP %s,%s"%(channel, state))
+        self.setpoint(channel, state=state)
 
     def writing(self, command=""):
+        # Could be anything, so nothing cached can be trusted afterwards
         self.inst.write(command)
+        self.invalidate()
         
     def temperature(self):
         return((self.inst.query(":SYSTem:SELF:TEST:TEMP?")).rstrip("\n"))
+
+    def timerSupported(self):
+        """True if the firmware has the Timer function (answers :TIMEr:STATe?), only asks once per connection"""
+        if self.timer is None:
+            try:
+                self.timer = self.inst.query(":TIMEr:STATe?").strip().upper() in ("ON", "OFF")
+            except Exception as err:
+                print("No timer function: ", err)
+                self.timer = False
+                if hasattr(self.inst, "clear"):
+                    self.inst.clear()
+        return self.timer
+
+    def uploadTimer(self, channel, volts, current, dwell, cycles=0):
+        """
+        Load a voltage sequence into the supply's timer for channel, volts[n] is held for dwell[n] seconds.
+        cycles=0 repeats until timerOff().  Doesn't start it, see timerOn()
+        """
+        self.send(self._timerCommands(channel, volts, current, dwell, cycles))
+
+    def _timerCommands(self, channel, volts, current, dwell, cycles):
+        if not 0 < len(volts) <= TIMERMAXGROUPS:
+            raise ValueError("Timer takes 1 to %d groups, not %d"%(TIMERMAXGROUPS, len(volts)))
+        cmds = [":INST:NSEL %s"%channel[-1], ":TIMEr:STATe OFF", ":TIMEr:GROUPs %d"%len(volts)]
+        for n, (v, t) in enumerate(zip(volts, dwell)):
+            cmds.append(":TIMEr:PARAmeter %d,%.3f,%.3f,%g"%(n, v, current, max(t, TIMERMINSTEP)))
+        cmds.append(":TIMEr:CYCLEs I" if cycles == 0 else ":TIMEr:CYCLEs N,%d"%cycles)
+        cmds.append(":TIMEr:ENDState LAST")
+        return cmds
+
+    def timerOn(self, channel):
+        self.send([":INST:NSEL %s"%channel[-1], ":TIMEr:STATe ON"])
+        self.invalidate(channel)        # the timer is changing the setpoints now
+
+    def timerOff(self, channel):
+        self.send([":INST:NSEL %s"%channel[-1], ":TIMEr:STATe OFF"])
+        self.invalidate(channel)
+
+    def send(self, cmds, per=32):
+        """
+        Write several commands, up to per of them in one message if the firmware takes compound commands.
+        Doesn't touch the setpoint cache, invalidate() anything they change.
+        """
+        step = per if self.compound else 1
+        for n in range(0, len(cmds), step):
+            self.inst.write(joined(cmds[n:n+step]))
         
 if __name__ == '__main__':
     test = DP83X()
@@ -0,0 +1,346 @@
+# asyncio DP83X client, for one process polling several supplies at once
+#
+#   python dp83xasync.py TCPIP0::192.168.1.60::5555::SOCKET TCPIP0::192.168.1.61::5555::SOCKET
+#   python dp83xasync.py SIM::DP832::latency=50 SIM::DP832::latency=50 SIM::DP831::latency=50
+#
+# AsyncDP83X has the same methods as DP83X, but every one that talks to the
+# instrument is a coroutine, so while one supply is slow to answer the others
+# carry on.  Polling N supplies with gather() takes about as long as the slowest
+# one rather than the sum of them.
+#
+# Raw SCPI sockets (TCPIP0::host::5555::SOCKET, the DP800 listens on 5555) use
+# asyncio streams.  Anything else the synchronous driver can open (/dev/usbtmc*,
+# SIM::, VISA addresses) runs on its own worker thread, one per instrument, so
+# a blocking read only ever holds up the instrument it belongs to.
+
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import time
+
+from dp83x import DP83X, CharDevInst, joined
+
+TIMEOUT = 2.0       # seconds to wait for a reply
+
+
+class SocketTransport(object):
+    """SCPI over a raw TCP socket with asyncio streams"""
+
+    def __init__(self, host, port, timeout=TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.lock = asyncio.Lock()      # a query's write and read must not interleave with another's
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+
+    async def write(self, cmd):
+        async with self.lock:
+            self.writer.write((cmd + "\n").encode("ascii"))
+            await self.writer.drain()
+
+    async def query(self, cmd):
+        async with self.lock:
+            self.writer.write((cmd + "\n").encode("ascii"))
+            await self.writer.drain()
+            try:
+                reply = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            except asyncio.TimeoutError:
+                # The reply may still turn up, it mustn't be taken for the next query's
+                await self._reopen()
+                raise IOError("Timeout, no reply to %r from %s:%d" % (cmd, self.host, self.port))
+            if not reply:
+                raise IOError("%s:%d closed the connection" % (self.host, self.port))
+            return reply.decode("ascii")
+
+    async def clear(self):
+        """Throw away any reply buffered or still on its way"""
+        async with self.lock:
+            await self._reopen()
+
+    async def _reopen(self):
+        # A reply in flight goes to the old connection, there's no telling how late it is
+        try:
+            self.writer.close()
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+        try:
+            await self.open()
+        except Exception as err:
+            print("Reconnecting to %s:%d failed: %s" % (self.host, self.port, err))
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+
+
+class ThreadTransport(object):
+    """Runs a blocking instrument (CharDevInst, SimInst, a pyvisa resource) on its own worker thread"""
+
+    def __init__(self, opener):
+        self.opener = opener
+        self.inst = None
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def open(self):
+        self.inst = await self._run(self.opener)
+
+    async def write(self, cmd):
+        await self._run(self.inst.write, cmd)
+
+    async def query(self, cmd):
+        return await self._run(self.inst.query, cmd)
+
+    async def clear(self):
+        if hasattr(self.inst, "clear"):
+            await self._run(self.inst.clear)
+
+    async def close(self):
+        if hasattr(self.inst, "close"):
+            await self._run(self.inst.close)
+        self.executor.shutdown(wait=False)
+
+
+def transport(constr):
+    """Pick the transport for a connect string, same strings as DP83X.conn() plus ::SOCKET ones"""
+    parts = constr.split("::")
+    if constr.upper().startswith("TCPIP") and parts[-1].upper() == "SOCKET":
+        return SocketTransport(parts[1], int(parts[2]))
+    if constr.startswith('/'):
+        return ThreadTransport(lambda: CharDevInst(constr))
+    if constr.startswith('SIM::'):
+        from dp83xsim import SimInst
+        return ThreadTransport(lambda: SimInst(constr))
+    if constr.startswith('SHARE::'):
+        from dp83xshare import ShareInst
+        return ThreadTransport(lambda: ShareInst(constr))
+
+    def openVisa():
+        import pyvisa as visa
+        return visa.ResourceManager().open_resource(constr)
+    return ThreadTransport(openVisa)
+
+
+class AsyncDP83X(DP83X):
+    """
+    DP83X with coroutines for everything that does I/O, the setpoint cache and
+    reply parsing are shared with the synchronous driver.
+    """
+
+    async def conn(self, constr):
+        """Attempt to connect to instrument"""
+        self.idn = None
+        self.timer = None
+        self.setpoints = {}
+        self.constr = constr
+        try:
+            self.inst = transport(constr)
+            await self.inst.open()
+        except Exception as err:
+            print("Failed to connect to ", constr, ": ", err)
+            raise err
+
+    async def identify(self):
+        """Return identify string which has serial number, only asks the instrument once per connection"""
+        if self.idn is None:
+            resp = (await self.inst.query("*IDN?")).rstrip("\n").split(',')
+            self.idn = {"company":resp[0], "model":resp[1], "serial":resp[2], "ver":resp[3]}
+
+        return dict(self.idn)
+
+    async def readings(self, channel="CH1"):
+        """Read voltage/current/power from CH1/CH2/CH3"""
+        resp = (await self.inst.query("MEAS:ALL? %s"%channel)).split(',')
+        return {"v":float(resp[0]), "i":float(resp[1]), "p":float(resp[2])}
+
+    async def pollAll(self, channels=("CH1", "CH2", "CH3")):
+        """Same as DP83X.pollAll()"""
+        queries = self._pollQueries(channels)
+        if not self.compound:
+            return await self._pollEach(channels, queries)
+        try:
+            resp = (await self.inst.query(":" + ";:".join(queries))).rstrip("\n").split(';')
+            return self._parsePoll(channels, resp)
+        except Exception as err:
+            failed = err
+        await self.inst.clear()
+        dr = await self._pollEach(channels, queries)
+        print("Compound query failed, using one query per reading: ", failed)
+        self.compound = False
+        return dr
+
+    async def _pollEach(self, channels, queries):
+        resp = [(await self.inst.query(q)).rstrip("\n") for q in queries]
+        return self._parsePoll(channels, resp)
+
+    async def dis(self):
+        await self.inst.write(":SYSTEM:LOCAL")
+        await self.inst.close()
+        del self.inst
+
+    async def reconnect(self):
+        """Same as DP83X.reconnect()"""
+        self.expected = self.idn or self.expected
+        try:
+            await self.inst.close()
+        except Exception:
+            pass            # it's the broken connection we're replacing
+        await self.conn(self.constr)
+        self.compound = True
+        self._checkSame(await self.identify())
+
+    def coalesce(self):
+        """Nothing to hold back, send() already makes one message of each call"""
+        return contextlib.nullcontext()
+
+    async def setpoint(self, channel, volts=None, current=None, state=None):
+        """Same as DP83X.setpoint()"""
+        cmds, changes = self._setpointCommands(channel, volts, current, state)
+        if cmds:
+            await self.send(cmds)
+        self.setpoints.setdefault(channel, {}).update(changes)
+        return cmds
+
+    async def checkSetpoints(self, channels=None):
+        """Same as DP83X.checkSetpoints()"""
+        channels = [ch for ch in (channels or list(self.setpoints)) if self.setpoints.get(ch)]
+        if not channels:
+            return []
+        queries = ["APPL? %s"%channel for channel in channels]
+        if self.compound:
+            resp = (await self.inst.query(":" + ";:".join(queries))).rstrip("\n").split(';')
+        else:
+            resp = [(await self.inst.query(q)).rstrip("\n") for q in queries]
+        return self._checkReplies(channels, resp)
+
+    async def applyVoltage(self, channel, voltage):
+        await self.setpoint(channel, volts=voltage)
+
+    async def applyCurrent(self, channel, current):
+        await self.setpoint("CH%s"%channel[-1], current=current)
+
+    async def applyState(self, channel="CH1", state="OFF"):
+        await self.setpoint(channel, state=state)
+
+    async def on(self, channel="CH1"):
+        await self.setpoint(channel, state="ON")
+
+    async def queryVolt(self, channel):
+        volts = float((await self.inst.query(":APPL? %s ,VOLTage"%channel)).rstrip("\n"))
+        self.setpoints.setdefault(channel, {})["v"] = round(volts, 3)
+        return volts
+
+    async def queryCurr(self, channel):
+        current = float((await self.inst.query(":APPL? %s ,CURRent"%channel)).rstrip("\n"))
+        self.setpoints.setdefault(channel, {})["i"] = round(current, 3)
+        return current
+
+    async def state(self, channel="CH1"):
+        state = (await self.inst.query("OUTP? " + channel)).rstrip("\n")
+        self.setpoints.setdefault(channel, {})["state"] = state.strip().upper()
+        return state
+
+    async def off(self, channels=("CH1", "CH2", "CH3")):
+        await self.send(["OUTP %s,OFF"%channel for channel in channels])
+        for channel in channels:
+            self.setpoints.setdefault(channel, {})["state"] = "OFF"
+
+    async def eStop(self):
+        await self.inst.write("OUTP ALL ,OFF")
+        self.invalidate(field="state")
+
+    async def allOn(self):
+        await self.inst.write("OUTP ALL ,ON")
+        self.invalidate(field="state")
+
+    async def writing(self, command=""):
+        await self.inst.write(command)
+        self.invalidate()
+
+    async def temperature(self):
+        return (await self.inst.query(":SYSTem:SELF:TEST:TEMP?")).rstrip("\n")
+
+    async def timerSupported(self):
+        """Same as DP83X.timerSupported()"""
+        if self.timer is None:
+            try:
+                self.timer = (await self.inst.query(":TIMEr:STATe?")).strip().upper() in ("ON", "OFF")
+            except Exception as err:
+                print("No timer function: ", err)
+                self.timer = False
+                await self.inst.clear()
+        return self.timer
+
+    async def uploadTimer(self, channel, volts, current, dwell, cycles=0):
+        """Same as DP83X.uploadTimer()"""
+        await self.send(self._timerCommands(channel, volts, current, dwell, cycles))
+
+    async def timerOn(self, channel):
+        await self.send([":INST:NSEL %s"%channel[-1], ":TIMEr:STATe ON"])
+        self.invalidate(channel)
+
+    async def timerOff(self, channel):
+        await self.send([":INST:NSEL %s"%channel[-1], ":TIMEr:STATe OFF"])
+        self.invalidate(channel)
+
+    async def send(self, cmds, per=32):
+        """Same as DP83X.send()"""
+        step = per if self.compound else 1
+        for n in range(0, len(cmds), step):
+            await self.inst.write(joined(cmds[n:n+step]))
+
+
+async def connectAll(constrs):
+    """Connect to and identify several supplies at once, returns the AsyncDP83Xs in the same order"""
+    insts = [AsyncDP83X() for _ in constrs]
+    await asyncio.gather(*(inst.conn(constr) for inst, constr in zip(insts, constrs)))
+    await asyncio.gather(*(inst.identify() for inst in insts))
+    return insts
+
+
+async def pollMany(insts, channels=("CH1", "CH2", "CH3")):
+    """pollAll() every supply concurrently, exceptions are returned in place of that supply's readings"""
+    return await asyncio.gather(*(inst.pollAll(channels) for inst in insts), return_exceptions=True)
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="Poll several DP83X supplies concurrently")
+    parser.add_argument("connect", nargs="+", help="connect strings, TCPIP0::host::5555::SOCKET, /dev/usbtmc*, SIM::DP832 or VISA")
+    parser.add_argument("--interval", type=int, default=1000, help="mS between polls")
+    parser.add_argument("--count", type=int, default=10, help="polls to take, 0 runs until Ctrl-C")
+    args = parser.parse_args(argv)
+
+    insts = await connectAll(args.connect)
+    try:
+        n = 0
+        while args.count == 0 or n < args.count:
+            start = time.monotonic()
+            results = await pollMany(insts)
+            elapsed = time.monotonic() - start
+            for inst, result in zip(insts, results):
+                if isinstance(result, Exception):
+                    print("%-14s %s" % (inst.idn["serial"], result))
+                else:
+                    print("%-14s %s" % (inst.idn["serial"], "  ".join("%s %.3fV %.3fA %s" % (ch, r["v"], r["i"], r["state"])
+                                                                    for ch, r in result.items())))
+            print("%d supplies in %.1f mS" % (len(insts), 1000*elapsed))
+            n += 1
+            await asyncio.sleep(max(0, args.interval/1000.0 - elapsed))
+    finally:
+        await asyncio.gather(*(inst.dis() for inst in insts), return_exceptions=True)
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
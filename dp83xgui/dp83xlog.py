@@ -0,0 +1,106 @@
+# Headless DP83X logger, for soak tests on a machine without a display
+#
+#   python dp83xlog.py TCPIP0::192.168.1.60::INSTR --interval 500 --duration 3600
+#   python dp83xlog.py /dev/usbtmc0 --channels CH1,CH2 --format bin
+#   python dp83xlog.py SIM::DP832 --interval 5000 --trigger CH1:v:falling:4.5 --pre 10 --post 10
+#   python dp83xlog.py SIM::DP832 --interval 100 --limit CH1:i:1.5 --limit CH2:p:20 --max-temp 50
+#
+# Writes the same captures/ files as the GUI's Log button.  Deliberately doesn't
+# import Qt, pyqtgraph or anything else GUI related, keep it that way.
+
+import argparse
+import sys
+import time
+
+from acquisition import Acquisition
+from capturelog import PATHTOLOG, openCaptureLog
+from dp83x import CONNECTSTRING, DP83X
+from protection import Watchdog, describe, tripLogName
+from trigger import BurstCapture, Trigger
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Log DP83X readings to captures/ without the GUI")
+    parser.add_argument("connect", nargs="?", default=CONNECTSTRING, help="VISA address, /dev/usbtmc* or SIM::DP832")
+    parser.add_argument("--channels", default="CH1,CH2,CH3")
+    parser.add_argument("--interval", type=int, default=1000, help="mS between readings")
+    parser.add_argument("--duration", type=float, default=0, help="seconds to log for, 0 runs until Ctrl-C")
+    parser.add_argument("--format", choices=("csv", "bin", "archive"), default="csv",
+                        help="archive is a fixed size file for runs of any length, see archive.py")
+    parser.add_argument("--path", default=PATHTOLOG, help="directory for the capture files")
+    parser.add_argument("--trigger", help="also save a fast capture around each event, e.g. CH1:v:falling:4.5, CH1:v:falling:4.5:0.1 (hysteresis) or CH1:state")
+    parser.add_argument("--pre", type=float, default=5, help="seconds kept before a trigger")
+    parser.add_argument("--post", type=float, default=5, help="seconds captured after a trigger")
+    parser.add_argument("--burst-interval", type=int, default=0, help="mS between readings after a trigger, 0 is as fast as possible")
+    parser.add_argument("--limit", action="append", default=[], help="E-STOP when exceeded, e.g. CH1:i:1.5 (A), CH1:p:20 (W) or CH1:e:5 (Wh)")
+    parser.add_argument("--max-temp", type=float, help="E-STOP above this temperature, degC")
+    args = parser.parse_args(argv)
+
+    channels = args.channels.upper().split(",")
+    inst = DP83X()
+    inst.conn(args.connect)
+    idn = inst.identify()
+    log = openCaptureLog(idn, args.format, channels, args.path)
+    print("Logging %s %s %s to %s" % (idn["model"], idn["serial"], ",".join(channels), log.filename(channels[0])))
+
+    counts = {"samples": 0, "errors": 0}
+
+    def onSamples(samples):
+        for sample in samples:
+            log.write(sample)
+        counts["samples"] += len(samples)
+
+    def onError(msg):
+        counts["errors"] += 1
+        print("Error:", msg, file=sys.stderr)
+
+    burst = None
+    if args.trigger:
+        try:
+            trigger = Trigger.parse(args.trigger)
+        except ValueError as err:
+            parser.error(str(err))
+        burst = BurstCapture(trigger, idn, channels, args.pre, args.post, args.burst_interval, args.format, args.path,
+                             onCapture=lambda filename, trigger: print("Triggered on %s, saved %s" % (trigger.describe(), filename)),
+                             onError=onError)
+        print("Armed: %s" % trigger.describe())
+
+    watchdog = None
+    if args.limit or args.max_temp is not None:
+        limits = {}
+        for spec in args.limit:
+            try:
+                channel, field, limit = Watchdog.parseLimit(spec)
+            except ValueError as err:
+                parser.error(str(err))
+            limits.setdefault(channel, {})[field] = limit
+        watchdog = Watchdog(limits, args.max_temp, tripLogName(idn, args.path),
+                            onTrip=lambda event: print("E-STOP:", describe(event), file=sys.stderr))
+        print("Protected, trips go to %s" % watchdog.logFile)
+
+    acq = Acquisition(inst, channels, args.interval, onSamples=onSamples, onError=onError,
+                      tempInterval=None if args.max_temp is None else 1000, batchInterval=max(args.interval, 200),
+                      burst=burst, watchdog=watchdog)
+    start = time.monotonic()
+    acq.start()
+    try:
+        while True:
+            elapsed = time.monotonic() - start
+            if args.duration > 0 and elapsed >= args.duration:
+                break
+            time.sleep(10 if args.duration <= 0 else min(10, args.duration - elapsed))
+            stats = acq.stats()
+            poll, link = stats["poll"], stats["link"]
+            print("%8.0f s  %d samples  %.2f/s  %d late  %d missed  %d errors  %d reconnects%s" % (time.monotonic() - start,
+                  counts["samples"], poll["rate"] or 0, poll["overruns"], poll["missed"], counts["errors"], link["reconnects"],
+                  "" if link["connected"] else "  LINK DOWN"))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        acq.stop()
+        log.close()
+        inst.dis()
+
+
+if __name__ == '__main__':
+    main()
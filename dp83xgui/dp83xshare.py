@@ -0,0 +1,360 @@
+# Share one DP83X between several programs
+#
+#   python dp83xshare.py TCPIP0::192.168.1.60::INSTR --interval 200
+#   python dp83xshare.py /dev/usbtmc0 --unix /tmp/dp83x.sock
+#
+# The server owns the connection and polls it with an Acquisition like the GUI
+# does.  Clients connect with SHARE::host:port (default SHARE::127.0.0.1:5025)
+# or SHARE::/path/to/socket wherever a connect string is taken, so dpgui.py,
+# dp83xlog.py and test scripts using DP83X work unchanged, and however many
+# there are the supply only sees the server's queries.
+#
+# Clients speak SCPI, one command per line.  The queries the driver polls with
+# (MEAS:ALL?, OUTP?, the temperature and *IDN?) are answered from the latest
+# poll, compound ones included, and the APPL? setpoint checks from the server's
+# own, read every SETPOINTINTERVAL seconds.  Any other query and every write is
+# passed to the instrument by the acquisition thread, so they are serialised
+# with the polls and with each other.  After a write nothing is answered from a
+# poll taken before it went out.  A line mixing writes and queries has the
+# writes passed on first and gets one reply, to its queries.  A reply starting
+# with "!" is an error.
+#
+# Sending SHARE:STREAM turns a connection into a stream of every sample the
+# server takes, one JSON object per line, see samples().
+
+import argparse
+import concurrent.futures
+import json
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+from acquisition import Acquisition
+from dp83x import CONNECTSTRING, DP83X, joined
+
+ADDRESS = "127.0.0.1:5025"
+STREAM = "SHARE:STREAM"
+TIMEOUT = 5.0           # seconds a client waits for a passed on query
+STREAMBACKLOG = 10000   # samples a stream client can fall behind by before it is dropped
+SETPOINTINTERVAL = 2.0  # seconds between the server's APPL? reads, the same as a client's Acquisition checks them
+IGNORED = ("SYSTEM:LOCAL", "SYST:LOC")      # a client disconnecting mustn't hand the supply back to the front panel
+
+
+def normalise(cmd):
+    return cmd.strip().lstrip(":").upper().replace(" ", "")
+
+
+def openSocket(address, timeout):
+    if address.startswith("/"):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(address)
+        return sock
+    host, port = address.rsplit(":", 1)
+    sock = socket.create_connection((host, int(port)), timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+class ShareInst(object):
+    """Client side, SHARE::host:port or SHARE::/path, with the same write()/query() as the other transports"""
+
+    def __init__(self, constr, timeout=TIMEOUT):
+        self.address = constr[len("SHARE::"):] or ADDRESS
+        self.sock = openSocket(self.address, timeout)
+        self.file = self.sock.makefile("rwb")
+
+    def write(self, cmd):
+        self.file.write((cmd + "\n").encode("ascii"))
+        self.file.flush()
+
+    def query(self, cmd):
+        self.write(cmd)
+        reply = self.file.readline().decode("ascii")
+        if not reply:
+            raise IOError("%s closed the connection" % self.address)
+        if reply.startswith("!"):
+            raise IOError(reply[1:].strip())
+        return reply
+
+    def clear(self):
+        pass
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+def samples(address=ADDRESS):
+    """Yield every sample the server at address takes, as Acquisition sample dicts"""
+    sock = openSocket(address, None)
+    with sock, sock.makefile("rwb") as file:
+        file.write((STREAM + "\n").encode("ascii"))
+        file.flush()
+        for line in file:
+            yield json.loads(line)
+
+
+class InstrumentShare(object):
+    """Polls inst and answers clients' queries from the latest poll where it can"""
+
+    def __init__(self, inst, channels=("CH1", "CH2", "CH3"), interval=1000, **kwargs):
+        self.inst = inst
+        self.channels = list(channels)
+        self.idn = inst.identify()
+        self.lock = threading.Lock()
+        self.cache = {}         # normalised query -> reply, from the latest poll
+        self.pending = 0        # writes not passed on yet, polls before they are aren't cached
+        self.applied = {}       # normalised APPL? query -> reply, see _readSetpoints()
+        self.appliedAt = None   # monotonic time applied was read, None to read it after the next poll
+        self.reading = False    # a _readSetpoints() is queued
+        self.temp = None
+        self.streams = []       # a queue per SHARE:STREAM client
+        self.counts = {"cached": 0, "forwarded": 0, "writes": 0, "samples": 0, "clients": 0}
+        idn = self.idn
+        self.idnReply = ",".join((idn["company"], idn["model"], idn["serial"], idn["ver"]))
+        self.acq = Acquisition(inst, self.channels, interval, onSamples=self._samples, onError=self._error,
+                               batchInterval=0, **kwargs)
+
+    def start(self):
+        self.acq.start()
+
+    def stop(self):
+        self.acq.stop()
+        with self.lock:
+            for stream in list(self.streams):
+                self._drop(stream)
+
+    def _drop(self, stream):
+        # With the lock held, the client's stream() sees None next and returns
+        self.streams.remove(stream)
+        with stream.mutex:
+            stream.queue.clear()
+        stream.put_nowait(None)
+
+    def _error(self, msg):
+        print("Error:", msg, file=sys.stderr)
+
+    def _samples(self, batch):
+        # On the acquisition thread, straight after each poll
+        cache = {"*IDN?": self.idnReply}
+        for ch, r in batch[-1]["readings"].items():
+            cache["MEAS:ALL?" + ch] = "%s,%s,%s" % (r["v"], r["i"], r["p"])
+            cache["OUTP?" + ch] = cache["OUTPUT?" + ch] = r["state"]
+        for sample in batch:
+            if "temp" in sample:
+                self.temp = sample["temp"]
+        if self.temp is not None:
+            cache["SYSTEM:SELF:TEST:TEMP?"] = cache["SYST:SELF:TEST:TEMP?"] = self.temp
+
+        with self.lock:
+            cache.update(self.applied)
+            if not self.pending:
+                self.cache = cache
+            if not self.reading and (self.appliedAt is None or time.monotonic() - self.appliedAt >= SETPOINTINTERVAL):
+                self.reading = True
+                self.acq.submit(self._readSetpoints)
+            self.counts["samples"] += len(batch)
+            for stream in list(self.streams):
+                try:
+                    for sample in batch:
+                        stream.put_nowait(sample)
+                except queue.Full:
+                    self._drop(stream)      # too far behind, it gets disconnected
+
+    def _readSetpoints(self):
+        # On the acquisition thread, one APPL? per channel for all the clients' setpoint checks
+        try:
+            queries = ["APPL? %s" % ch for ch in self.channels]
+            if self.inst.compound:
+                replies = self.inst.inst.query(joined(queries)).rstrip("\n").split(";")
+            else:
+                replies = [self.inst.inst.query(q).rstrip("\n") for q in queries]
+            applied = {}
+            for ch, reply in zip(self.channels, replies):
+                # CH1:30V/3A,5.000,1.000
+                values = reply.split(",")
+                applied["APPL?" + ch] = reply
+                for field in ("VOLT", "VOLTAGE"):
+                    applied["APPL?%s,%s" % (ch, field)] = values[-2]
+                for field in ("CURR", "CURRENT"):
+                    applied["APPL?%s,%s" % (ch, field)] = values[-1]
+            with self.lock:
+                if not self.pending:
+                    self.applied = applied
+                    self.cache.update(applied)
+                    self.appliedAt = time.monotonic()
+        finally:
+            self.reading = False
+
+    def call(self, func, *args):
+        """Run func(*args) on the acquisition thread and wait for the result"""
+        future = concurrent.futures.Future()
+
+        def run():
+            try:
+                future.set_result(func(*args))
+            except Exception as err:
+                future.set_exception(err)
+        self.acq.submit(run)
+        return future.result(TIMEOUT)
+
+    def query(self, cmd):
+        """Reply to a (compound) query, from the cache for whatever was in the latest poll"""
+        parts = cmd.split(";")
+        with self.lock:
+            cache = self.cache if self.acq.health["connected"] else {}
+            replies = [cache.get(normalise(part)) for part in parts]
+        missing = [k for k, reply in enumerate(replies) if reply is None]
+        if missing:
+            forward = joined(parts[k] for k in missing)
+            resp = self.call(lambda: self.inst.inst.query(forward)).rstrip("\n").split(";")
+            if len(resp) != len(missing):
+                raise IOError("Expected %d replies to %r, got %r" % (len(missing), forward, resp))
+            for k, reply in zip(missing, resp):
+                replies[k] = reply
+        with self.lock:
+            self.counts["forwarded"] += len(missing)
+            self.counts["cached"] += len(parts) - len(missing)
+        return ";".join(replies)
+
+    def write(self, cmd):
+        """Pass a write on to the instrument, outputs being turned off jump the queue"""
+        cmd = ";".join(part for part in cmd.split(";") if part.strip() and normalise(part) not in IGNORED)
+        if not cmd:
+            return
+        urgent = ",OFF" in normalise(cmd)
+        with self.lock:
+            # It could change anything, queries go to the instrument until a poll after it
+            self.cache = {"*IDN?": self.idnReply}
+            self.applied = {}
+            self.appliedAt = None
+            self.pending += 1
+            self.counts["writes"] += 1
+        self.acq.submit(self.inst.writing, cmd, urgent=urgent)
+        self.acq.submit(self._written, urgent=urgent)
+
+    def _written(self):
+        # On the acquisition thread, after the write and before the next poll
+        with self.lock:
+            self.pending -= 1
+
+    def stream(self, wfile):
+        """Send every sample to wfile as JSON lines until the client goes away"""
+        samples = queue.Queue(STREAMBACKLOG)
+        with self.lock:
+            self.streams.append(samples)
+        try:
+            while True:
+                sample = samples.get()
+                if sample is None:
+                    return
+                wfile.write((json.dumps(sample) + "\n").encode("ascii"))
+                if samples.empty():
+                    wfile.flush()
+        finally:
+            with self.lock:
+                if samples in self.streams:
+                    self.streams.remove(samples)
+
+
+class ShareHandler(socketserver.StreamRequestHandler):
+    """One client connection, a thread each"""
+
+    def handle(self):
+        share = self.server.share
+        with share.lock:
+            share.counts["clients"] += 1
+        try:
+            for line in self.rfile:
+                cmd = line.decode("ascii", "replace").strip()
+                if not cmd:
+                    continue
+                if normalise(cmd) == STREAM:
+                    share.stream(self.wfile)
+                    return
+                parts = cmd.split(";")
+                writes = [part for part in parts if "?" not in part]
+                queries = [part for part in parts if "?" in part]
+                if writes:
+                    share.write(";".join(writes))
+                if not queries:
+                    continue
+                try:
+                    reply = share.query(";".join(queries))
+                except Exception as err:
+                    reply = "!%s" % (err or type(err).__name__)
+                self.wfile.write((reply.rstrip("\n") + "\n").encode("ascii"))
+                self.wfile.flush()
+        except (ConnectionError, BrokenPipeError):
+            pass
+        finally:
+            with share.lock:
+                share.counts["clients"] -= 1
+
+
+class TCPShareServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class UnixShareServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(share, address=ADDRESS):
+    """Start a server for share on host:port or a Unix socket path, returns it running on its own thread"""
+    if address.startswith("/"):
+        if os.path.exists(address):
+            os.unlink(address)
+        server = UnixShareServer(address, ShareHandler)
+    else:
+        host, port = address.rsplit(":", 1)
+        server = TCPShareServer((host, int(port)), ShareHandler)
+    server.share = share
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Share one DP83X between several clients")
+    parser.add_argument("connect", nargs="?", default=CONNECTSTRING, help="VISA address, /dev/usbtmc* or SIM::DP832")
+    parser.add_argument("--channels", default="CH1,CH2,CH3")
+    parser.add_argument("--interval", type=int, default=200, help="mS between polls")
+    parser.add_argument("--listen", default=ADDRESS, help="host:port to listen on, clients use SHARE::host:port")
+    parser.add_argument("--unix", help="listen on this Unix socket instead, clients use SHARE::/path")
+    args = parser.parse_args(argv)
+
+    inst = DP83X()
+    inst.conn(args.connect)
+    share = InstrumentShare(inst, args.channels.upper().split(","), args.interval)
+    share.start()
+    address = args.unix or args.listen
+    server = serve(share, address)
+    print("Sharing %s %s on SHARE::%s" % (share.idn["model"], share.idn["serial"], address))
+    start = time.monotonic()
+    try:
+        while True:
+            time.sleep(10)
+            poll = share.acq.stats()["poll"]
+            counts = dict(share.counts)
+            print("%8.0f s  %d samples  %.2f/s  %d clients  %d queries from cache  %d passed on  %d writes" % (
+                  time.monotonic() - start, counts["samples"], poll["rate"] or 0, counts["clients"],
+                  counts["cached"], counts["forwarded"], counts["writes"]))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        share.stop()
+        inst.dis()
+        if args.unix and os.path.exists(args.unix):
+            os.unlink(args.unix)
+
+
+if __name__ == '__main__':
+    main()
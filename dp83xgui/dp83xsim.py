@@ -0,0 +1,274 @@
+# Simulated DP83X for testing and benchmarking without a power supply
+#
+# Connect with "SIM::DP832" (or DP831/DP832A) in place of a VISA address, and
+# optionally add ::key=value settings, e.g.
+#   SIM::DP832::latency=20::jitter=5::load=10,open,0.5A
+#
+#   latency   mS per message, the round trip for a query (default 0)
+#   jitter    mS, uniform +/- jitter added to latency (default 0)
+#   rise/fall output slew rate in V/s (default 285/85, roughly what a DP832 does into no load)
+#   load      per channel: ohms, "open" or a constant current such as "0.5A" (default 100 ohm)
+#   noise     standard deviation of the measurement noise in volts/amps (default 0.0005)
+#   compound  0 makes semicolon joined messages time out like older firmware might
+#   seed      random seed so runs are reproducible
+#   timer     0 hides the :TIMEr function, as on firmware without it
+#   drop      START,LENGTH in seconds: from START seconds after this connect string
+#             was first opened, for LENGTH seconds, the link is down - every message
+#             and reconnect attempt fails, as if the network had gone
+#
+# Only the SCPI the driver uses is understood, an unknown query raises IOError
+# the same way a VISA timeout would.
+
+import random
+import re
+import threading
+import time
+
+# Connect string -> monotonic time it was first opened, so drop= carries on across reconnects
+OPENED = {}
+# Connect string -> serial number, so a reconnect finds the same supply
+SERIALS = {}
+
+MODELS = {
+    "DP832":  [(30, 3), (30, 3), (5, 3)],
+    "DP832A": [(30, 3), (30, 3), (5, 3)],
+    "DP831":  [(8, 5), (30, 2), (30, 2)],
+}
+
+
+class SimChannel(object):
+    def __init__(self, maxV, maxI, load):
+        self.maxV = maxV
+        self.maxI = maxI
+        self.load = load
+        self.setV = 0.0
+        self.setI = maxI
+        self.on = False
+        self.vout = 0.0
+        # Timer function, groups are (volts, amps, seconds)
+        self.groups = []
+        self.cycles = 0
+        self.timerOn = False
+        self.timerStart = 0.0
+
+    def runTimer(self, now):
+        """Apply whichever timer group is due at now"""
+        if not self.timerOn or not self.groups:
+            return
+        total = sum(g[2] for g in self.groups)
+        elapsed = now - self.timerStart
+        if self.cycles and elapsed >= total*self.cycles:
+            self.timerOn = False
+            return
+        elapsed %= total
+        for v, i, t in self.groups:
+            if elapsed < t:
+                self.setV, self.setI = min(v, self.maxV), min(i, self.maxI)
+                return
+            elapsed -= t
+
+    def update(self, dt, rise, fall):
+        """Slew the output towards the setpoint, dt seconds since the last update"""
+        target = self.setV if self.on else 0.0
+        if target > self.vout:
+            self.vout = min(target, self.vout + rise*dt)
+        else:
+            self.vout = max(target, self.vout - fall*dt)
+
+    def measure(self):
+        """Returns (v, i) at the output terminals, dropping into constant current if the load wants too much"""
+        v = self.vout
+        if not self.on or self.load == "open":
+            return v, 0.0
+        if isinstance(self.load, str):
+            i = float(self.load[:-1])           # "0.5A" constant current load
+            if i > self.setI:
+                return 0.0, self.setI
+            return v, i
+        i = v / self.load
+        if i > self.setI:
+            return self.setI * self.load, self.setI
+        return v, i
+
+
+class SimInst(object):
+    """Stands in for the pyvisa resource, write()/query()/clear() only"""
+
+    def __init__(self, constr="SIM::DP832"):
+        parts = constr.split("::")
+        self.model = parts[1] if len(parts) > 1 and parts[1] else "DP832"
+        if self.model not in MODELS:
+            raise ValueError("Unknown simulated model %s, try one of %s" % (self.model, ", ".join(MODELS)))
+
+        opts = dict(p.split("=", 1) for p in parts[2:] if "=" in p)
+        self.latency = float(opts.get("latency", 0)) / 1000.0
+        self.jitter = float(opts.get("jitter", 0)) / 1000.0
+        self.rise = float(opts.get("rise", 285))
+        self.fall = float(opts.get("fall", 85))
+        self.noise = float(opts.get("noise", 0.0005))
+        self.compound = opts.get("compound", "1") != "0"
+        self.hasTimer = opts.get("timer", "1") != "0"
+        self.drop = [float(x) for x in opts["drop"].split(",")] if "drop" in opts else None
+        self.opened = OPENED.setdefault(constr, time.monotonic())
+        self._checkLink()
+        self.random = random.Random(opts.get("seed"))
+
+        loads = opts.get("load", "").split(",")
+        self.channels = []
+        for n, (maxV, maxI) in enumerate(MODELS[self.model]):
+            load = loads[n] if n < len(loads) and loads[n] else "100"
+            if load != "open" and not load.endswith("A"):
+                load = float(load)
+            self.channels.append(SimChannel(maxV, maxI, load))
+
+        self.serial = SERIALS.setdefault(constr, "DPSIM%08d" % self.random.randrange(10**8))
+        self.lock = threading.Lock()
+        self.lastUpdate = time.monotonic()
+        self.selected = self.channels[0]
+        self.commands = 0
+
+    def _checkLink(self):
+        if self.drop is not None:
+            elapsed = time.monotonic() - self.opened
+            if self.drop[0] <= elapsed < self.drop[0] + self.drop[1]:
+                raise IOError("Timeout (simulated link down for another %.1fs)" % (self.drop[0] + self.drop[1] - elapsed))
+
+    def _wait(self):
+        delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _update(self):
+        now = time.monotonic()
+        for ch in self.channels:
+            ch.runTimer(now)
+            ch.update(now - self.lastUpdate, self.rise, self.fall)
+        self.lastUpdate = now
+
+    def write(self, cmd):
+        self._checkLink()
+        self._wait()
+        with self.lock:
+            self._message(cmd, False)
+
+    def query(self, cmd):
+        self._checkLink()
+        self._wait()
+        with self.lock:
+            return self._message(cmd, True)
+
+    def clear(self):
+        pass
+
+    def _message(self, cmd, isQuery):
+        msgs = [m.strip() for m in cmd.strip().split(";") if m.strip()]
+        if len(msgs) > 1 and not self.compound:
+            raise IOError("Timeout (simulated firmware without compound messages)")
+        self._update()
+        replies = []
+        for msg in msgs:
+            self.commands += 1
+            reply = self._command(msg.lstrip(":"))
+            if reply is not None:
+                replies.append(reply)
+        if isQuery:
+            if not replies:
+                raise IOError("Timeout, no reply to %r" % cmd)
+            return ";".join(replies) + "\n"
+
+    def _timer(self, head, args):
+        """:TIMEr commands, they work on the channel picked with :INST:NSEL"""
+        ch = self.selected
+        if head in ("TIMER:STATE?", "TIME:STAT?", "TIMER?", "TIME?"):
+            return "ON" if ch.timerOn else "OFF"
+        if head in ("TIMER:STATE", "TIME:STAT", "TIMER", "TIME"):
+            ch.timerOn = args.upper() == "ON"
+            ch.timerStart = time.monotonic()
+            return None
+        if head in ("TIMER:GROUPS", "TIME:GROU"):
+            ch.groups = [(0.0, 0.0, 1.0)] * int(args)
+            return None
+        if head in ("TIMER:PARAMETER", "TIME:PARA"):
+            n, v, i, t = args.split(",")
+            ch.groups[int(n)] = (float(v), float(i), float(t))
+            return None
+        if head in ("TIMER:CYCLES", "TIME:CYCLE"):
+            parts = args.upper().split(",")
+            ch.cycles = 0 if parts[0].startswith("I") else int(parts[1])
+            return None
+        return None
+
+    def _channel(self, name):
+        name = name.strip().upper()
+        if name.startswith("CH"):
+            name = name[2:]
+        return self.channels[int(name) - 1]
+
+    def _command(self, msg):
+        """Handle one SCPI message, returns the reply for a query or None"""
+        head, _, args = msg.partition(" ")
+        head = head.upper()
+        args = args.strip()
+
+        if head == "*IDN?":
+            return "RIGOL TECHNOLOGIES,%s,%s,00.01.16" % (self.model, self.serial)
+
+        if head == "MEAS:ALL?":
+            v, i = self._channel(args or "CH1").measure()
+            v += self.random.gauss(0, self.noise)
+            i += self.random.gauss(0, self.noise)
+            return "%.4f,%.4f,%.4f" % (v, i, v*i)
+
+        if head == "APPL":
+            parts = [p.strip() for p in args.split(",")]
+            ch = self._channel(parts[0])
+            ch.setV = min(max(float(parts[1]), 0.0), ch.maxV)
+            if len(parts) > 2:
+                ch.setI = min(max(float(parts[2]), 0.0), ch.maxI)
+            return None
+
+        if head == "APPL?":
+            parts = [p.strip().upper() for p in args.split(",")]
+            ch = self._channel(parts[0])
+            if len(parts) > 1 and parts[1].startswith("VOLT"):
+                return "%.3f" % ch.setV
+            if len(parts) > 1 and parts[1].startswith("CURR"):
+                return "%.3f" % ch.setI
+            return "%s:%dV/%dA,%.3f,%.3f" % (parts[0], ch.maxV, ch.maxI, ch.setV, ch.setI)
+
+        if head in ("OUTP", "OUTPUT"):
+            parts = [p.strip().upper() for p in args.split(",")]
+            channels = self.channels if parts[0] == "ALL" else [self._channel(parts[0])]
+            for ch in channels:
+                ch.on = parts[1] == "ON"
+            return None
+
+        if head in ("OUTP?", "OUTPUT?"):
+            return "ON" if self._channel(args or "CH1").on else "OFF"
+
+        source = re.match(r"SOUR(?:CE)?(\d?):(CURR|VOLT)", head)
+        if source:
+            # :SOURce2:CURRent 1.5 or :SOURce2:VOLTage 12
+            ch = self._channel(source.group(1) or "1")
+            if source.group(2) == "CURR":
+                ch.setI = min(max(float(args), 0.0), ch.maxI)
+            else:
+                ch.setV = min(max(float(args), 0.0), ch.maxV)
+            return None
+
+        if head == "SYSTEM:SELF:TEST:TEMP?":
+            return "%.1f" % (30.0 + 0.5*sum(v*i for v, i in (ch.measure() for ch in self.channels)))
+
+        if head == "SYSTEM:LOCAL":
+            return None
+
+        if head in ("INST:NSEL", "INSTRUMENT:NSELECT", "INST", "INSTRUMENT"):
+            self.selected = self._channel(args)
+            return None
+
+        if self.hasTimer and head.startswith("TIME"):
+            return self._timer(head, args)
+
+        if head.endswith("?"):
+            raise IOError("Timeout, simulated %s doesn't know %r" % (self.model, msg))
+        return None
@@ -7,7 +7,9 @@
 # pip install pyside6
 # pip install pyqtgraph
 # pip install pyvisa-py
-# pip install matplotlib
+# pip install qt-material
+#
+# For logging without the GUI see dp83xlog.py
 
 #"TCPIP0::192.168.1.60::INSTR"  <- If using TCPIP then point browser to your IP address and it will reveal the "VISA TCP/IP String"
 #"USB0::0x1AB1::0x0E11::DPXXXXXXXXXXX::INSTR"
@@ -18,13 +20,14 @@
 CONNECTSTRING = "TCPIP0::172.16.0.125::INSTR"
 #CONNECTSTRING = "TCPIP0::192.168.1.60::INSTR"
 
+DISPLAYINTERVAL = 33   # mS, graphs and readouts refresh at most ~30 times a second however fast we sample
+STATSINTERVAL = 0.25   # seconds between refreshes of the statistics panels, the stats themselves keep up with every sample
+
 import os
 import sys
+import threading
 import time
 
-import math
-import matplotlib.pyplot as plt
-
 import numpy as np
 
 
@@ -36,15 +39,96 @@ from PySide6 import QtCore, QtGui
 
 from qt_material import apply_stylesheet
 
-try:
-    import pyqtgraph as pg
-    import pyqtgraph.parametertree.parameterTypes as pTypes
-    from pyqtgraph.parametertree import Parameter, ParameterTree, ParameterItem, registerParameterType
-except ImportError:
-    print ("Install pyqtgraph from http://www.pyqtgraph.org")
-    raise
-
 from dp83x import DP83X
+from acquisition import Acquisition
+from ringbuffer import RingBuffer
+from capturelog import openCaptureLog, loadCapture
+from decimate import MinMaxPyramid
+from waveform import Waveform, WaveformEngine, builtinTables, loadTable
+from trigger import BurstCapture, Trigger
+from protection import Watchdog, describe, tripLogName
+from runstats import FIELDS as STATSFIELDS, ChannelStats
+
+# pyqtgraph is slow to import, it is loaded when the first graph is built
+pg = None
+
+def importPyqtgraph():
+    global pg
+    if pg is None:
+        try:
+            import pyqtgraph
+        except ImportError:
+            print ("Install pyqtgraph from http://www.pyqtgraph.org")
+            raise
+        pg = pyqtgraph
+    return pg
+
+class AcquisitionBridge(QObject):
+    """
+    Hands samples and errors from the acquisition thread to the GUI thread.
+    Samples pile up in pending until the GUI timer takes them, rather than being
+    signalled one batch at a time, so a slow redraw can't flood the event loop.
+    """
+    error = Signal(str)
+    captured = Signal(str)      # a triggered capture was saved, see trigger.py
+    tripped = Signal(object)    # the protection watchdog turned the outputs off, see protection.py
+    timerFailed = Signal(str, str)  # channel, why its function couldn't go on the supply's timer
+
+    def __init__(self):
+        super(AcquisitionBridge, self).__init__()
+        self.lock = threading.Lock()
+        self.pending = []
+
+    def push(self, samples):
+        """Called from the acquisition thread"""
+        with self.lock:
+            self.pending.extend(samples)
+
+    def take(self):
+        with self.lock:
+            samples, self.pending = self.pending, []
+        return samples
+
+class Session(QObject):
+    """
+    What the DP83XGUI windows in one app share, one per supply: the time base the
+    graphs are drawn against, so traces from different supplies line up, and a
+    single display timer that takes in every connected window's samples.
+    Graphs are drawn in seconds before now, now being the same for every window.
+    """
+
+    def __init__(self):
+        super(Session, self).__init__()
+        self.t0 = time.monotonic()
+        self.now = 0.0          # seconds since t0 at the last display tick
+        self.windows = []       # every open window, so they aren't garbage collected
+        self.connected = []     # the ones with an acquisition running
+        self.displaytimer = QtCore.QTimer()
+        self.displaytimer.setInterval(DISPLAYINTERVAL)
+        self.displaytimer.timeout.connect(self.updateReadings)
+
+    def newWindow(self):
+        window = DP83XGUI(self)
+        window.show()
+        return window
+
+    def attach(self, window):
+        if window not in self.connected:
+            self.connected.append(window)
+        if not self.displaytimer.isActive():
+            self.displaytimer.start()
+
+    def detach(self, window):
+        if window in self.connected:
+            self.connected.remove(window)
+        if not self.connected:
+            self.displaytimer.stop()
+
+    def updateReadings(self):
+        # A window with nothing new returns straight away, so idle supplies cost next to nothing
+        self.now = time.monotonic() - self.t0
+        for window in self.connected:
+            window.updateReadings()
 
 class GraphWidget(QWidget):
     """
@@ -52,6 +136,7 @@ class GraphWidget(QWidget):
     """
 
     def __init__(self):
+        importPyqtgraph()
         #pg.setConfigOption('background', 'w')
         #pg.setConfigOption('foreground', 'k')
 
@@ -65,6 +150,21 @@ class GraphWidget(QWidget):
         vb = self.pw.getPlotItem().getViewBox()
         vb.setMouseMode(vb.RectMode)
 
+        # Only draw what is on screen, and at most ~2 points per pixel column
+        self.pw.setClipToView(True)
+        self.pw.setDownsampling(auto=True, mode='peak')
+
+        # Curves are created once and updated with setData, see setTrace()
+        self.curves = {}
+        for name, pen in (("v", 'b'), ("i", 'r'), ("p", 'g')):
+            self.curves[name] = self.pw.plot(pen=pen)
+        self.xaxis = np.arange(0)
+        self.xSpan = None
+
+        # Traces from a capture file, redrawn from their MinMaxPyramid as the view changes
+        self.pyramids = {}
+        vb.sigXRangeChanged.connect(self.updatePyramids)
+
         layout.addWidget(self.pw)
 
         self.setLayout(layout)
@@ -135,16 +235,101 @@ class GraphWidget(QWidget):
         """Lock Y axis, such it doesn't change with new data"""
         self.pw.getPlotItem().getViewBox().enableAutoRange(pg.ViewBox.YAxis, ~enabled)
 
-    def passTrace(self, trace, startoffset=0, pen='b', clear=True):
-        if clear:
-            self.pw.clear()
-        xaxis = range(startoffset, len(trace)+startoffset)
-        self.pw.plot(xaxis, trace, pen=pen)
+    def setTrace(self, name, trace, xaxis=None):
+        """Replace the data of the "v", "i" or "p" curve, x defaults to the sample number"""
+        if xaxis is None:
+            if len(self.xaxis) < len(trace):
+                self.xaxis = np.arange(max(len(trace), 2*len(self.xaxis)))
+            xaxis = self.xaxis[:len(trace)]
+        self.curves[name].setData(xaxis, trace)
+
+    def setXSpan(self, span):
+        """
+        Fix the X axis at -span..0 for live traces drawn relative to now.  Only touched
+        when span changes, so the axis isn't laid out again every frame as it scrolls.
+        """
+        if span != self.xSpan:
+            self.xSpan = span
+            vb = self.pw.getPlotItem().getViewBox()
+            vb.enableAutoRange(pg.ViewBox.XAxis, False)
+            vb.setXRange(-span, 0, padding=0)
+
+    def setPyramid(self, name, pyramid):
+        """Show a big trace decimated to the visible range, the X axis is then only scaled by the user"""
+        self.pyramids[name] = pyramid
+        lower, upper = pyramid.bounds()
+        for p in self.pyramids.values():
+            lower, upper = min(lower, p.bounds()[0]), max(upper, p.bounds()[1])
+        # Auto range would chase the extra point either side of each query, so fit the whole capture once instead
+        vb = self.pw.getPlotItem().getViewBox()
+        vb.enableAutoRange(pg.ViewBox.XAxis, False)
+        self.setXRange(lower, upper)
+        self.updatePyramids()
+
+    def updatePyramids(self, *args):
+        if not self.pyramids:
+            return
+        lower, upper = self.xRange()
+        pixels = max(self.pw.width(), 100)
+        for name, pyramid in self.pyramids.items():
+            if self.traceVisible(name):
+                self.curves[name].setData(*pyramid.query(lower, upper, pixels))
+
+    def showTrace(self, name, visible):
+        self.curves[name].setVisible(visible)
+        if visible and name in self.pyramids:
+            self.updatePyramids()
+
+    def traceVisible(self, name):
+        return self.curves[name].isVisible()
+
+class CaptureViewer(QMainWindow):
+    """
+    Shows a capture from captures/ (CSV or BIN), one graph per channel with their
+    time axes linked.  Traces are drawn from a min/max pyramid built when the file
+    is opened, so zooming around a multi-million sample log stays quick.
+    """
+
+    def __init__(self, filename):
+        super(CaptureViewer, self).__init__()
+        meta, channels = loadCapture(filename)
+
+        root = QWidget()
+        layout = QVBoxLayout()
+        self.graphlist = []
+        for ch, data in channels.items():
+            row = QHBoxLayout()
+            row.addWidget(QLabel("%s  %d samples"%(ch, len(data["t"]))))
+            graph = GraphWidget()
+            graph.pw.setLabel('top', ch)
+            graph.pw.setLabel('bottom', 'Time [s]')
+            for name, text in (("v", "Plot V"), ("i", "Plot I"), ("p", "Plot P")):
+                button = QPushButton(text)
+                button.setCheckable(True)
+                button.setChecked(name == "v")
+                button.toggled.connect(lambda on, graph=graph, name=name: graph.showTrace(name, on))
+                row.addWidget(button)
+                graph.showTrace(name, name == "v")
+                # Archives have each point's min and max too
+                graph.setPyramid(name, MinMaxPyramid(data["t"], data.get(name + "min", data[name]), ymax=data.get(name + "max")))
+            if self.graphlist:
+                graph.pw.setXLink(self.graphlist[0].pw)
+            self.graphlist.append(graph)
+            layout.addLayout(row)
+            layout.addWidget(graph)
+
+        root.setLayout(layout)
+        self.setCentralWidget(root)
+        self.setWindowTitle("%s %s  %s"%(meta["model"], meta["serial"], os.path.basename(filename)))
+        self.resize(1200, 800)
 
 class DP83XGUI(QMainWindow):
+    """One supply's window, more can be opened with Add Supply, they share a Session"""
 
-    def __init__(self):
+    def __init__(self, session=None):
         super(DP83XGUI, self).__init__()
+        self.session = Session() if session is None else session
+        self.session.windows.append(self)
         self.setWindowIcon(QtGui.QIcon('frog1.bmp'))
         root = QWidget()
         mainLayout = QVBoxLayout()
@@ -153,6 +338,15 @@ class DP83XGUI(QMainWindow):
         self.container = QWidget()
         layout = QVBoxLayout()
         self.drawDone = False
+        self.acq = None
+        self.acqBridge = AcquisitionBridge()
+        self.acqBridge.error.connect(lambda msg: self.statusBar().showMessage(msg))
+        self.acqBridge.captured.connect(self.triggerCaptured)
+        self.acqBridge.tripped.connect(self.protectionTripped)
+        self.acqBridge.timerFailed.connect(self.hardwareFunctionFailed)
+        # Achieved sample rate and any late/missed polls or function steps, from Acquisition.stats()
+        self.lblTiming = QLabel()
+        self.statusBar().addPermanentWidget(self.lblTiming)
 
         settings = QSettings()
 
@@ -166,10 +360,24 @@ class DP83XGUI(QMainWindow):
         self.dispb = QPushButton("Disconnect")
         self.dispb.clicked.connect(self.dis)
 
+        self.pbOpenCapture = QPushButton("Open Capture")
+        self.pbOpenCapture.clicked.connect(self.openCapture)
+        self.viewers = []
+
+        self.pbNewWindow = QPushButton("Add Supply")
+        self.pbNewWindow.clicked.connect(self.session.newWindow)
+
         self.loggingPushButton = QPushButton("Log On/Off")
         self.loggingPushButton.setCheckable(True)
         self.loggingPushButton.clicked.connect(self.setLogging)
 
+        self.cbLogFormat = QComboBox()
+        self.cbLogFormat.addItem("CSV")
+        self.cbLogFormat.addItem("BIN")     # one compact file for all channels, see capturelog.py
+        self.cbLogFormat.addItem("ARCHIVE") # fixed size, full rate recently and 1 s/1 min/1 h before, see archive.py
+        self.cbLogFormat.setCurrentText(settings.value('logformat', "CSV"))
+        self.cbLogFormat.currentTextChanged.connect(lambda fmt: QSettings().setValue('logformat', fmt))
+
         self.cbNumDisplays = QSpinBox()
         self.cbNumDisplays.setMinimum(1)
         self.cbNumDisplays.setMaximum(3)
@@ -188,6 +396,59 @@ class DP83XGUI(QMainWindow):
         self.pbPauseTimer.setCheckable(True)
         self.pbPauseTimer.clicked.connect(self.tryPauseTimer)
 
+        # Run SIN/SQR/SAW on the supply's own Timer function rather than sending every step
+        self.pbHWTimer = QPushButton("HW Timer")
+        self.pbHWTimer.setCheckable(True)
+        self.hwFunction = set()     # channels whose function is running on the supply's timer
+
+        # Triggered captures: a few seconds either side of an event at the fastest rate, see trigger.py
+        self.pbTrigger = QPushButton("Trigger")
+        self.pbTrigger.setCheckable(True)
+        self.pbTrigger.clicked.connect(self.setTrigger)
+        self.cbTrigChannel = QComboBox()
+        self.cbTrigChannel.addItems(["CH1", "CH2", "CH3"])
+        self.cbTrigField = QComboBox()
+        self.cbTrigField.addItems(["V", "I", "P", "STATE"])
+        self.cbTrigEdge = QComboBox()
+        self.cbTrigEdge.addItems(["falling", "rising", "either"])
+        self.sbTrigLevel = QDoubleSpinBox()
+        self.sbTrigLevel.setDecimals(3)
+        self.sbTrigLevel.setMaximum(30)
+        self.sbTrigLevel.setPrefix("Level ")
+        self.sbTrigHyst = QDoubleSpinBox()
+        self.sbTrigHyst.setDecimals(3)
+        self.sbTrigHyst.setMaximum(30)
+        self.sbTrigHyst.setPrefix("Hyst ")
+        self.sbTrigPre = QDoubleSpinBox()
+        self.sbTrigPre.setRange(0, 600)
+        self.sbTrigPre.setValue(5)
+        self.sbTrigPre.setPrefix("Pre ")
+        self.sbTrigPre.setSuffix(" s")
+        self.sbTrigPost = QDoubleSpinBox()
+        self.sbTrigPost.setRange(0.1, 600)
+        self.sbTrigPost.setValue(5)
+        self.sbTrigPost.setPrefix("Post ")
+        self.sbTrigPost.setSuffix(" s")
+        for widget in (self.cbTrigChannel, self.cbTrigField, self.cbTrigEdge):
+            widget.currentTextChanged.connect(self.setTrigger)
+        for widget in (self.sbTrigLevel, self.sbTrigHyst, self.sbTrigPre, self.sbTrigPost):
+            widget.valueChanged.connect(self.setTrigger)
+        self.lblTrigger = QLabel()
+
+        # Host side protection, per channel limits are set under each graph, see protection.py
+        self.pbProtect = QPushButton("Protect")
+        self.pbProtect.setCheckable(True)
+        self.pbProtect.clicked.connect(self.setProtection)
+        self.sbMaxTemp = QDoubleSpinBox()
+        self.sbMaxTemp.setRange(0, 100)
+        self.sbMaxTemp.setDecimals(1)
+        self.sbMaxTemp.setValue(50)
+        self.sbMaxTemp.setSpecialValueText("Max Temp Off")
+        self.sbMaxTemp.setPrefix("Max ")
+        self.sbMaxTemp.setSuffix(" degC")
+        self.sbMaxTemp.valueChanged.connect(self.setProtection)
+        self.lblProtect = QLabel()
+
         self.leTemp = QLineEdit("---")
         self.leTemp.setObjectName("leTemp")
         
@@ -200,9 +461,13 @@ class DP83XGUI(QMainWindow):
         self.layoutcon.addWidget(self.conpb)
         self.layoutcon.addWidget(self.dispb)
         self.layoutcon.addWidget(self.cbNumDisplays)
+        self.layoutcon.addWidget(self.pbOpenCapture)
+        self.layoutcon.addWidget(self.pbNewWindow)
         self.setGeometry(30, 60, 500, 100)
 
         layout.addLayout(self.layoutcon)
+        self.layouttrig = QHBoxLayout()     # filled in on connect
+        layout.addLayout(self.layouttrig)
 
         self.channelSpecsDP83x = []
         
@@ -215,15 +480,15 @@ class DP83XGUI(QMainWindow):
         self.chLineEdits =[]
         self.chConfig = []
         self.cbList = []
-        self.edata = [0,0,0]
+        self.edata = [0,0,0]        # latest Wh per graph from the acquisition thread
+        self.energyZero = [0,0,0]   # edata when CLEAR ENERGY was pressed
         
-        self.vdata = [[],[],[]]
-        self.idata = [[],[],[]]
-        self.pdata = [[],[],[]]
-        self.filename = ""
-        self.startLogTime = time.time() 
+        self.traces = []    # RingBuffer per graph
+        self.stats = []     # ChannelStats per graph, fed the same samples as traces
+        self.statLabels = []
+        self.lastStats = 0.0
+        self.log = None
 
-        self.degree = 0
         self.temperatureWarningToggle = False
         
         # suspect it is 60mS is the fastest it can up date
@@ -231,21 +496,8 @@ class DP83XGUI(QMainWindow):
         #neg slope 30 - 0V ~ 355mS
         
         self.numSamples = 100  #100 samples equals a period of 6.002 sec
-        A = 1
-        F = 1
-        P = (self.numSamples/2)/F
-        x = np.arange(self.numSamples)
-
-        self.sawX = []
-        for i in range(self.numSamples):
-            self.sawX.append((A/P) * (P - abs(i % (2*P) - P)) )
-
-        sinX = np.sin((2*np.pi*F)*(x/self.numSamples))
-
-        self.sqrX = np.where(x < self.numSamples/2, 0, 1)
-
-        self.absSinX = (sinX +1)/2
-        shiftedAbsSinX = (np.sin((2*np.pi*F)*((x+(3/4)*(self.numSamples))/self.numSamples) )+1)/2
+        self.tables = builtinTables(self.numSamples)
+        self.waveforms = WaveformEngine()   # stepped by the acquisition thread, see waveform.py
 
         self.container.setLayout(layout)
         scroll.setWidget(self.container)
@@ -257,6 +509,8 @@ class DP83XGUI(QMainWindow):
 
     def closeEvent(self, event):
         self.dis()
+        if self in self.session.windows:
+            self.session.windows.remove(self)
         event.accept()
 
     def addGraphs(self, graphnum):
@@ -286,9 +540,8 @@ class DP83XGUI(QMainWindow):
 
         self.graphsettings.append({"channel":"CH%d"%(graphnum+1), "points":4096})
 
-        self.vdata.append([-1])#*self.graphsettings[-1]["points"])
-        self.idata.append([-1])#*self.graphsettings[-1]["points"])
-        self.pdata.append([-1])#*self.graphsettings[-1]["points"])
+        self.traces.append(RingBuffer(self.graphsettings[-1]["points"]))
+        self.stats.append(ChannelStats(self.graphsettings[-1]["points"]))
 
         self.sbPoints = QSpinBox()
         self.sbPoints.setMinimum(10)
@@ -352,6 +605,33 @@ class DP83XGUI(QMainWindow):
         self.cbFunction.addItem("SIN")
         self.cbFunction.addItem("SQR")
         self.cbFunction.addItem("SAW")
+        self.cbFunction.addItem("ARB")      # table from leArb
+
+        # ARB table, a CSV file or a NumPy expression of x (0..1 over the period)
+        self.leArb = QLineEdit("np.sin(2*np.pi*x)**2")
+        self.leArb.setObjectName("leArb")
+
+        self.sbPeriod = QDoubleSpinBox()
+        self.sbPeriod.setSuffix(" [s]")
+        self.sbPeriod.setDecimals(2)
+        self.sbPeriod.setMinimum(0.12)
+        self.sbPeriod.setMaximum(86400)
+        self.sbPeriod.setValue(6.0)
+        self.sbPeriod.setObjectName("sbPeriod")
+
+        self.sbOffset = QDoubleSpinBox()
+        self.sbOffset.setSuffix(" [V]")
+        self.sbOffset.setDecimals(3)
+        self.sbOffset.setMaximum(self.channelSpecsDP83x[graphnum][self.leModel.text()]["maxV"])
+        self.sbOffset.setSingleStep(0.01)
+        self.sbOffset.setObjectName("sbOffset")
+
+        self.sbPhase = QDoubleSpinBox()
+        self.sbPhase.setSuffix(" [deg]")
+        self.sbPhase.setDecimals(1)
+        self.sbPhase.setMaximum(359.9)
+        self.sbPhase.setWrapping(True)
+        self.sbPhase.setObjectName("sbPhase")
 
         self.sbVolts = QDoubleSpinBox()
         self.sbVolts.setAccelerated(True)
@@ -429,7 +709,8 @@ class DP83XGUI(QMainWindow):
         self.ckFunction.setObjectName("ckFunction")
 
         self.chConfig.append({"ckState":self.ckState,"ckVoltage":self.ckVoltage,"ckCurrent":self.ckCurrent,"ckFunction":self.ckFunction, \
-        "cbState":self.cbState,"sbVolts":self.sbVolts,"sbCurrent":self.sbCurrent,"cbFunction":self.cbFunction,"pbPause":self.pbPause,"pbClearPlot":self.pbClearPlot,"pbClearEnergy":self.pbClearEnergy})
+        "cbState":self.cbState,"sbVolts":self.sbVolts,"sbCurrent":self.sbCurrent,"cbFunction":self.cbFunction,"pbPause":self.pbPause,"pbClearPlot":self.pbClearPlot,"pbClearEnergy":self.pbClearEnergy, \
+        "leArb":self.leArb,"sbPeriod":self.sbPeriod,"sbOffset":self.sbOffset,"sbPhase":self.sbPhase})
         
         self.gridLayoutChannel.addWidget(self.chConfig[-1]["pbPause"], 2, 0, 1, 1)
         self.gridLayoutChannel.addWidget(self.chConfig[-1]["pbClearPlot"], 2, 1, 1, 1)
@@ -444,16 +725,66 @@ class DP83XGUI(QMainWindow):
         self.gridLayoutChannel.addWidget(self.chConfig[-1]["sbVolts"], 4, 3, 1, 1)        
         self.gridLayoutChannel.addWidget(self.chConfig[-1]["sbCurrent"], 5, 3, 1, 1)
         self.gridLayoutChannel.addWidget(self.chConfig[-1]["cbFunction"], 6, 3, 1, 1)
+
+        self.lblPeriod = QLabel()
+        self.lblPeriod.setObjectName("lblPeriod")
+        self.lblOffset = QLabel()
+        self.lblOffset.setObjectName("lblOffset")
+        self.gridLayoutChannel.addWidget(self.lblPeriod, 8, 0, 1, 1)
+        self.gridLayoutChannel.addWidget(self.chConfig[-1]["sbPeriod"], 8, 1, 1, 1)
+        self.gridLayoutChannel.addWidget(self.lblOffset, 8, 2, 1, 1)
+        self.gridLayoutChannel.addWidget(self.chConfig[-1]["sbOffset"], 8, 3, 1, 1)
+        self.gridLayoutChannel.addWidget(self.chConfig[-1]["sbPhase"], 9, 0, 1, 1)
+        self.gridLayoutChannel.addWidget(self.chConfig[-1]["leArb"], 9, 1, 1, 3)
+
+        # Protection limits, 0 is off.  Energy is against the readout, so CLEAR ENERGY starts it again
+        self.lblLimits = QLabel()
+        self.lblLimits.setObjectName("lblLimits")
+        self.gridLayoutChannel.addWidget(self.lblLimits, 10, 0, 1, 1)
+        for col, (name, suffix, maximum) in enumerate((("sbMaxI", " [A]", 10), ("sbMaxP", " [W]", 200), ("sbMaxE", " [Wh]", 1e6))):
+            spinbox = QDoubleSpinBox()
+            spinbox.setObjectName(name)
+            spinbox.setDecimals(3)
+            spinbox.setMaximum(maximum)
+            spinbox.setPrefix("Max ")
+            spinbox.setSuffix(suffix)
+            spinbox.setSpecialValueText("Off")
+            spinbox.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
+            spinbox.valueChanged.connect(self.setProtection)
+            self.chConfig[-1][name] = spinbox
+            self.gridLayoutChannel.addWidget(spinbox, 10, col + 1, 1, 1)
+
+        # Any change to the function settings recompiles that channel's waveform
+        self.ckFunction.toggled.connect(lambda x: self.updateFunction(graphnum))
+        self.cbFunction.currentTextChanged.connect(lambda x: self.updateFunction(graphnum))
+        self.leArb.editingFinished.connect(lambda : self.updateFunction(graphnum))
+        for widget in (self.sbVolts, self.sbPeriod, self.sbOffset, self.sbPhase):
+            widget.valueChanged.connect(lambda x: self.updateFunction(graphnum))
         
         self.graphlist.append(GraphWidget())
-        self.gridLayoutChannel.addWidget(self.graphlist[-1], 0, 4,8,1)
+        self.graphlist[-1].pw.setLabel('bottom', 'Time [s]')
+        # Min/max/mean/RMS/p-p over the points window and the whole session, see runstats.py
+        self.lblStats = QLabel()
+        self.lblStats.setObjectName("lblStats")
+        self.lblStats.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.lblStats.setAlignment(Qt.AlignLeft | Qt.AlignTop)
+        self.statLabels.append(self.lblStats)
+        self.gridLayoutChannel.addWidget(self.lblStats, 0, 4, 11, 1)
+
+        self.gridLayoutChannel.addWidget(self.graphlist[-1], 0, 5,11,1)
+
+        # Plot V/I/P just show/hide the graph's curves
+        for name in ("v", "i", "p"):
+            button = self.graphsettings[-1][name + "enabled"]
+            self.graphlist[-1].showTrace(name, button.isChecked())
+            button.toggled.connect(lambda on, name=name: self.showTrace(graphnum, name, on))
 
         gb.setLayout(self.gridLayoutChannel)
         self.gridLayoutChannel.setColumnStretch(0, 1)
         self.gridLayoutChannel.setColumnStretch(1, 1)
         self.gridLayoutChannel.setColumnStretch(2, 1)
         self.gridLayoutChannel.setColumnStretch(3, 1)
-        self.gridLayoutChannel.setColumnStretch(4, 10)
+        self.gridLayoutChannel.setColumnStretch(5, 10)
         layout.addWidget(gb)
 
         self.retranslateUi(QMainWindow)
@@ -486,12 +817,15 @@ class DP83XGUI(QMainWindow):
         self.ckVoltage.setText(_translate("MainWindow", "Voltage [V]:"))
         self.ckCurrent.setText(_translate("MainWindow", "Current [I]:"))
         self.ckFunction.setText(_translate("MainWindow", "Func [V]:"))
+        self.lblPeriod.setText(_translate("MainWindow", "Period [s]:"))
+        self.lblOffset.setText(_translate("MainWindow", "Offset [V]:"))
+        self.sbPhase.setPrefix(_translate("MainWindow", "Phase "))
+        self.lblLimits.setText(_translate("MainWindow", "Limits:"))
 
     def tryOn(self, channum, buttOn ):
-        if buttOn:
-            self.inst.writing(":OUTP "+self.graphsettings[channum]["channel"]+",ON")
-        else:
-            self.inst.writing(":OUTP "+self.graphsettings[channum]["channel"]+",OFF")
+        if self.acq is None:
+            return
+        self.acq.submit(self.inst.applyState, self.graphsettings[channum]["channel"], "ON" if buttOn else "OFF")
 
     def tryPausePlot(self, channum ):
         """
@@ -499,26 +833,50 @@ class DP83XGUI(QMainWindow):
         #print (channum)
     def clearPlot(self,graphnum):
         #arrayToClear = int(self.graphsettings[graphnum]["channel"][-1]) - 1
-        self.vdata[graphnum] = []
-        self.idata[graphnum] = []
-        self.pdata[graphnum] = []
+        self.traces[graphnum].clear()
+        self.stats[graphnum].clearWindow()
 
     def clearEnergy(self,graphnum):
         #arrayToClear = int(self.graphsettings[graphnum]["channel"][-1]) - 1
-        self.edata[graphnum] = 0
+        # Only the readout is zeroed, the log keeps counting from when the acquisition started
+        self.energyZero[graphnum] = self.edata[graphnum]
+        self.setProtection()
 
         
     def tryPauseTimer(self):
-        if(self.pbPauseTimer.isChecked()):
-            self.readtimer.stop()
-        else:
-            self.readtimer.start()
+        if self.acq is None:
+            return
+        # The waveforms are stepped by the acquisition thread so they pause with it
+        self.acq.pause(self.pbPauseTimer.isChecked())
 
     def dis(self):
         #print (self.cbChannel.currentText())
-        self.readtimer.stop()
+        if self.acq is None:
+            return
+        self.session.detach(self)
+        for channel in self.waveforms.channels():
+            self.waveforms.set(channel, None)
+        for channel in self.hwFunction:
+            self.acq.submit(self.inst.timerOff, channel)
+        self.hwFunction.clear()
+        self.acq.stop()
+        self.acq = None
+        self.updateReadings()       # anything still queued goes to the log before it is closed
+        self.stopLogging()
         self.inst.dis()
 
+    def openCapture(self):
+        filename, _ = QFileDialog.getOpenFileName(self, "Open Capture", "captures", "Captures (*.csv *.bin *.rra)")
+        if not filename:
+            return
+        try:
+            viewer = CaptureViewer(filename)
+        except (OSError, ValueError) as err:
+            self.statusBar().showMessage(str(err))
+            return
+        self.viewers.append(viewer)
+        viewer.show()
+
     def tryConnect(self):
         constr = self.constr.text()
         QSettings().setValue('constring', constr)
@@ -531,15 +889,24 @@ class DP83XGUI(QMainWindow):
             return
 
         self.leModel.setText(self.inst.identify()["model"]) 
+        self.setWindowTitle("DP83X GUI  %s %s"%(self.inst.identify()["model"], self.inst.identify()["serial"]))
 
         self.layoutcon.addWidget(self.loggingPushButton)
+        self.layoutcon.addWidget(self.cbLogFormat)
         self.layoutcon.addWidget(self.sbReadingsInterval)
         self.layoutcon.addWidget(self.pbPauseTimer)
+        self.layoutcon.addWidget(self.pbHWTimer)
         self.layoutcon.addWidget(QLabel("Temperature:"))
         self.layoutcon.addWidget(self.leTemp)
         self.layoutcon.addWidget(QLabel("Model:"))
         self.layoutcon.addWidget(self.leModel)
 
+        for widget in (self.pbProtect, self.sbMaxTemp, self.lblProtect,
+                       self.pbTrigger, self.cbTrigChannel, self.cbTrigField, self.cbTrigEdge,
+                       self.sbTrigLevel, self.sbTrigHyst, self.sbTrigPre, self.sbTrigPost, self.lblTrigger):
+            self.layouttrig.addWidget(widget)
+        self.layouttrig.addStretch()
+
         if self.drawDone == False:
             #self.addGraphs(self.cbNumDisplays.value()) # <- it can not be done this way.  It results in all functions refering to CH3 only
             for i in range (0,self.cbNumDisplays.value()):
@@ -548,63 +915,142 @@ class DP83XGUI(QMainWindow):
             self.resize(1200,800)
             self.drawDone = True
 
-        self.readtimer = QtCore.QTimer()
-        self.readtimer.setInterval(self.sbReadingsInterval.value())
-
-        self.readtimer.timeout.connect(self.updateReadings)
-        self.readtimer.start()
-
-        self.readDegCtimer = QtCore.QTimer()
-        self.readDegCtimer.setInterval(1000)
+        # From here on only the acquisition thread talks to the instrument
+        self.acq = Acquisition(self.inst, interval=self.sbReadingsInterval.value(),
+                               onSamples=self.acqBridge.push,
+                               onError=self.acqBridge.error.emit,
+                               waveform=self.waveforms)
+        self.acq.start()
+        # The new acquisition counts energy from 0, carry on from what the readouts showed
+        self.energyZero = [zero - e for e, zero in zip(self.edata, self.energyZero)]
+        self.edata = [0,0,0]
+        for graphnum in range(len(self.chConfig)):
+            self.updateFunction(graphnum)
+        self.setLogging()
+        self.setTrigger()
+        self.setProtection()
 
-        self.readDegCtimer.timeout.connect(self.updateSystTemperature)
-        self.readDegCtimer.start()
+        # No instrument I/O here any more, the session's display timer picks up whatever the acquisition thread has read
+        self.session.attach(self)
 
     def setInterval(self, interval):
-        self.readtimer.setInterval(self.sbReadingsInterval.value())
+        if self.acq is None:
+            return
+        self.acq.setInterval(self.sbReadingsInterval.value())
 
     def eStop(self, graphnum):
-        self.inst.off()
+        if self.acq is None:
+            return
+        self.acq.submit(self.inst.off, urgent=True)
 
     def setupChannel(self, graphnum):
+        if self.acq is None:
+            return
         #self.chConfig.append({"ckState":self.ckState,"ckVoltage":self.ckVoltage,"ckCurrent":self.ckCurrent,"cbState":self.cbState,"sbVolts":self.sbVolts,"sbCurrent":self.sbCurrent})
         #so the channel we want to change is pointed to by -> self.graphsettings[graphnum]["channel"] 
-        if(self.chConfig[graphnum]["ckVoltage"].isChecked()):
-            self.inst.applyVoltage(self.graphsettings[graphnum]["channel"], self.chConfig[graphnum]["sbVolts"].value())
-        if(self.chConfig[graphnum]["ckCurrent"].isChecked()):
-            self.inst.applyCurrent(self.graphsettings[graphnum]["channel"][-1], self.chConfig[graphnum]["sbCurrent"].value())  #pass the chan number not the chan str. i.e send 2 not CH2
+        # One message with whatever actually changed, the driver drops values it has already set
+        volts = self.chConfig[graphnum]["sbVolts"].value() if self.chConfig[graphnum]["ckVoltage"].isChecked() else None
+        current = self.chConfig[graphnum]["sbCurrent"].value() if self.chConfig[graphnum]["ckCurrent"].isChecked() else None
+        state = self.chConfig[graphnum]["cbState"].currentText() if self.chConfig[graphnum]["ckState"].isChecked() else None
+        self.acq.submit(self.inst.setpoint, self.graphsettings[graphnum]["channel"], volts, current, state)
+
+        self.setupHardwareFunction(graphnum)
+
+    def functionTable(self, ch):
+        function = self.chConfig[ch]["cbFunction"].currentText()
+        if function == "ARB":
+            return loadTable(self.chConfig[ch]["leArb"].text(), self.numSamples)
+        return self.tables[function]
+
+    def makeWaveform(self, ch):
+        """The channel's function settings as a Waveform, raises ValueError if the ARB table is no good"""
+        config = self.chConfig[ch]
+        try:
+            table = self.functionTable(ch)
+        except Exception as err:        # a bad expression can raise just about anything
+            raise ValueError("ARB table: %s"%err)
+        return Waveform("CH%d"% (ch+1), table, config["sbPeriod"].value(), config["sbVolts"].value(),
+                        config["sbOffset"].value(), config["sbPhase"].value(),
+                        self.channelSpecsDP83x[ch][self.leModel.text()]["maxV"])
+
+    def updateFunction(self, ch):
+        """Recompile and restart the channel's waveform, or stop it if Func is unchecked"""
+        channel = "CH%d"% (ch+1)
+        if self.acq is None:
+            return
+        if channel in self.hwFunction:
+            self.setupHardwareFunction(ch)      # upload it again, or stop the timer
+            return
+        waveform = None
+        if self.chConfig[ch]["ckFunction"].isChecked():
+            try:
+                waveform = self.makeWaveform(ch)
+            except ValueError as err:
+                self.statusBar().showMessage(str(err))
+        self.waveforms.set(channel, waveform)
+
+    def setupHardwareFunction(self, ch):
+        """
+        Start or stop the function on the supply's timer.
+        If it can't be done there the WaveformEngine carries on stepping it from here.
+        """
+        channel = "CH%d"% (ch+1)
+        sequence = None
+        if self.pbHWTimer.isChecked() and self.chConfig[ch]["ckFunction"].isChecked():
+            try:
+                sequence = self.makeWaveform(ch).timerSequence()
+            except ValueError as err:
+                self.statusBar().showMessage("%s, sending the %s steps from here instead"%(err, channel))
+
+        if sequence is None:
+            if channel in self.hwFunction:
+                self.hwFunction.discard(channel)
+                self.acq.submit(self.inst.timerOff, channel)
+                self.updateFunction(ch)
+            return
 
-        if(self.chConfig[graphnum]["ckState"].isChecked()):
-            self.inst.applyState(self.graphsettings[graphnum]["channel"],self.chConfig[graphnum]["cbState"].currentText())
+        # hwFunction and the WaveformEngine only change here on the GUI thread, the
+        # acquisition thread just does the SCPI and says if it didn't work
+        self.hwFunction.add(channel)
+        self.waveforms.set(channel, None)
+        volts, dwell = sequence
+        self.acq.submit(self.startHardwareFunction, channel, volts, dwell, self.chConfig[ch]["sbCurrent"].value())
+
+    def startHardwareFunction(self, channel, volts, dwell, current):
+        """Runs on the acquisition thread"""
+        try:
+            if not self.inst.timerSupported():
+                raise IOError("No timer function on this supply")
+            self.inst.uploadTimer(channel, volts, current, dwell)
+            self.inst.timerOn(channel)
+        except Exception as err:
+            self.acqBridge.timerFailed.emit(channel, "%s, sending the %s steps from here instead"%(err, channel))
+
+    def hardwareFunctionFailed(self, channel, msg):
+        self.statusBar().showMessage(msg)
+        if channel in self.hwFunction:
+            self.hwFunction.discard(channel)
+            self.updateFunction(int(channel[-1]) - 1)
 
     def setChannel(self, graphnum, channelstr):
         self.graphsettings[graphnum]["channel"] = channelstr
+        self.stats[graphnum].clear()        # the figures so far are another channel's
+        self.setProtection()
+
+    def showTrace(self, graphnum, name, visible):
+        self.graphlist[graphnum].showTrace(name, visible)
+        if visible:
+            self.drawTrace(graphnum, name)
 
     def setPoints(self, graphnum, points):
         self.graphsettings[graphnum]["points"] = points
+        self.traces[graphnum].resize(points)
+        self.stats[graphnum].resize(self.traces[graphnum])
 
     def setVolts(self, graphnum, V):
         """
         """
 
-    def doFunction(self):
-        y = 0
-        for ch in range(3):
-            if((self.chConfig[ch]["ckFunction"].isChecked())):
-                if(self.chConfig[ch]["cbFunction"].currentText() == "SIN"):
-                    y = self.absSinX[self.degree] * self.chConfig[ch]["sbVolts"].value()
-
-                if(self.chConfig[ch]["cbFunction"].currentText() == "SQR"):
-                    y = self.sqrX[self.degree] * self.chConfig[ch]["sbVolts"].value()
-
-                if(self.chConfig[ch]["cbFunction"].currentText() == "SAW"):
-                    y = self.sawX[self.degree] * self.chConfig[ch]["sbVolts"].value()
-                self.inst.applyVoltage("CH%d"% (ch+1),"%.3f"%y)
-
-        self.degree += 1
-        if(self.degree == self.numSamples):
-            self.degree = 0
-
     def setCurr(self, graphnum, mA):
         """
         print(graphnum)
@@ -612,107 +1058,201 @@ class DP83XGUI(QMainWindow):
         """
 
     def setLogging(self):
-        """
-        """
-        #print(self.loggingPushButton.isChecked())
-
-    def logData(self):#,readings,graphnum):
-        path_to_log = "captures/"
-        file_format = "csv"
-        try:
-            os.makedirs(path_to_log)
-        except FileExistsError:
-            pass
-
-        if (self.loggingPushButton.isChecked()):
-            if(self.filename ==""):
-                self.startLogTime = time.time() 
-                
-                # Prepare filename as C:\MODEL_SERIAL_YYYY-MM-DD_HH.MM.SS
-                timestamp = time.strftime("%Y%m%d_%H%M%S", time.localtime())
-                self.filename = path_to_log + self.inst.identify()["model"] + "_" +  self.inst.identify()["serial"] + "_" + timestamp
-                header = b"Timestamp,Volts,Curr,Power,Energy\n"
-
-                for ch in ["CH1","CH2","CH3"]:
-                    file = open(self.filename + "_" + ch + "." + file_format, "ab")
-                    file.write(header) 
-                    file.close
-            for ch in ["CH1","CH2","CH3"]:
-                readings = self.inst.readings(ch)
-                file = open(self.filename + "_" + ch + "." + file_format, "ab")
-                file.write(("%f,%f,%f,%f,%f\n" % (time.time() - self.startLogTime,readings["v"], readings["i"], readings["p"], readings["p"]*5000/(60*60*1000))).encode("utf-8"))
-                file.close
+        """Start a new set of capture files, or close the current ones"""
+        if self.loggingPushButton.isChecked() and self.acq is not None:
+            if self.log is None:
+                # identify() was cached at connect, so this doesn't wait on the instrument
+                self.log = openCaptureLog(self.inst.identify(), self.cbLogFormat.currentText().lower())
         else:
-            self.filename = ""
+            self.stopLogging()
 
-    def updateSystTemperature(self):
-        degC = self.inst.temperature()
+    def setTrigger(self):
+        """(Re)arm the triggered capture with the current settings, or stop it"""
+        if self.acq is None:
+            return
+        if not self.pbTrigger.isChecked():
+            self.acq.setBurst(None)
+            self.setText(self.lblTrigger, "")
+            return
+        field = self.cbTrigField.currentText().lower()
+        trigger = Trigger(self.cbTrigChannel.currentText(), field, self.cbTrigEdge.currentText(), self.sbTrigLevel.value(),
+                          self.sbTrigHyst.value())
+        self.cbTrigEdge.setEnabled(field != "state")
+        self.sbTrigLevel.setEnabled(field != "state")
+        self.sbTrigHyst.setEnabled(field != "state")
+        burst = BurstCapture(trigger, self.inst.identify(), pre=self.sbTrigPre.value(), post=self.sbTrigPost.value(),
+                             fmt=self.cbLogFormat.currentText().lower(),
+                             onCapture=lambda filename, trigger: self.acqBridge.captured.emit(filename),
+                             onError=self.acqBridge.error.emit)
+        self.acq.setBurst(burst)
+        self.armedText = "Armed: %s" % trigger.describe()
+        self.setText(self.lblTrigger, self.armedText)
+
+    def setProtection(self):
+        """Hand the acquisition thread a Watchdog with the current limits, or stop protecting"""
+        if self.acq is None:
+            return
+        if not self.pbProtect.isChecked():
+            self.acq.setWatchdog(None)
+            self.setText(self.lblProtect, "")
+            return
+        limits = {}
+        for graphnum, config in enumerate(self.chConfig):
+            maxE = config["sbMaxE"].value()
+            limits[self.graphsettings[graphnum]["channel"]] = {"i": config["sbMaxI"].value() or None,
+                                                             "p": config["sbMaxP"].value() or None,
+                                                             "e": maxE + self.energyZero[graphnum] if maxE else None}
+        watchdog = Watchdog(limits, self.sbMaxTemp.value() or None, tripLogName(self.inst.identify()),
+                            onTrip=self.acqBridge.tripped.emit)
+        self.acq.setWatchdog(watchdog)
+        self.setText(self.lblProtect, "Protected")
+
+    def protectionTripped(self, event):
+        self.setText(self.lblProtect, "TRIPPED %s" % describe(event))
+        self.statusBar().showMessage("E-STOP: %s" % describe(event))
+
+    def triggerCaptured(self, filename):
+        self.setText(self.lblTrigger, "%s, last saved %s" % (self.armedText, os.path.basename(filename)))
+        self.statusBar().showMessage("Triggered capture saved to %s" % filename)
+
+    def stopLogging(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    def logData(self, sample):
+        if self.log is not None:
+            self.log.write(sample)
+
+    def updateSystTemperature(self, degC):
         if(float(degC) > 40):
             if(self.temperatureWarningToggle):
                 self.temperatureWarningToggle = False
-                self.leTemp.setStyleSheet("QLineEdit"
+                style = ("QLineEdit"
                                 "{"
                                 "color: black;"
                                 "background : pink;"
                                 "}")
             else:
                 self.temperatureWarningToggle = True
-                self.leTemp.setStyleSheet("QLineEdit"
+                style = ("QLineEdit"
                                 "{"
                                 "color: black;"
                                 "background : white;"
                                 "}")
         else:
-                self.leTemp.setStyleSheet("QLineEdit"
+                style = ("QLineEdit"
                                 "{"
                                 "color: black;"
                                 "background : lightgreen;"
                                 "}")        
-            
-        self.leTemp.setText(degC)
-    
+
+        # setStyleSheet restyles the widget, don't do it unless something changed
+        if self.leTemp.styleSheet() != style:
+            self.leTemp.setStyleSheet(style)
+        self.setText(self.leTemp, degC)
+
+    def setText(self, lineEdit, text):
+        """Only touch the QLineEdit (or QLabel) if the text changed, every setText costs a repaint"""
+        if lineEdit.text() != text:
+            lineEdit.setText(text)
+
     def updateReadings(self):
-        #print(self.inst.state())
-        #self.updateSystTemperature(self.inst.temperature())
-        self.logData()
-        self.doFunction()
+        """
+        Called in the GUI thread by the session's displaytimer. Every sample taken since the last
+        call goes into the traces and log, the readouts and graphs are redrawn once.
+        """
+        samples = self.acqBridge.take()
+        if not samples:
+            self.updateTiming()     # e.g. counting down to a reconnect
+            return
+
+        for sample in samples:
+            self.logData(sample)
+
+            for i, gs in enumerate(self.graphsettings):
+                readings = sample["readings"][gs["channel"]]
+                self.traces[i].append(sample["mono"] - self.session.t0, readings["v"], readings["i"], readings["p"])
+                self.stats[i].add(readings["v"], readings["i"], readings["p"])
+
+        temps = [sample["temp"] for sample in samples if "temp" in sample]
+        if temps:
+            self.updateSystTemperature(temps[-1])
+
+        latest = samples[-1]["readings"]
         for i, gs in enumerate(self.graphsettings):
-            readings = self.inst.readings(gs["channel"])
-            self.vdata[i].append(readings["v"])
-            self.idata[i].append(readings["i"])
-            self.pdata[i].append(readings["p"])
-            self.edata[i] = self.edata[i] + (readings["v"] * readings["i"] * self.sbReadingsInterval.value() / (60 * 60 * 1000))
-        
-            self.chLineEdits[i]["state"].setText(self.inst.state("CH%d"% (i+1)))
-            self.chLineEdits[i]["volts"].setText(str(readings["v"]))
-            self.chLineEdits[i]["current"].setText(str(readings["i"]))
-            self.chLineEdits[i]["power"].setText(str(readings["p"]))
-            self.chLineEdits[i]["energy"].setText(str("%.3f"%self.edata[i]) )
-            while len(self.vdata[i]) > gs["points"]:
-                self.vdata[i].pop(0)
-
-            while len(self.idata[i]) > gs["points"]:
-                self.idata[i].pop(0)
-
-            while len(self.pdata[i]) > gs["points"]:
-                self.pdata[i].pop(0)
-        
+            readings = latest[gs["channel"]]
+            self.setText(self.chLineEdits[i]["state"], readings["state"])
+            self.setText(self.chLineEdits[i]["volts"], str(readings["v"]))
+            self.setText(self.chLineEdits[i]["current"], str(readings["i"]))
+            self.setText(self.chLineEdits[i]["power"], str(readings["p"]))
+            self.edata[i] = readings["e"]
+            self.setText(self.chLineEdits[i]["energy"], str("%.3f"%(self.edata[i] - self.energyZero[i])) )
+
+        now = time.monotonic()
+        if now - self.lastStats >= STATSINTERVAL:
+            self.lastStats = now
+            for i in range(len(self.stats)):
+                self.setText(self.statLabels[i], self.statsText(i))
+
+        self.updateTiming()
         self.redrawGraphs()
 
+    def statsText(self, graphnum):
+        lines = ["        min       max      mean       rms       p-p"]
+        for title, stats in (("Window", self.stats[graphnum].window), ("Session", self.stats[graphnum].session)):
+            lines.append(title)
+            for name in STATSFIELDS:
+                summary = stats[name].summary()
+                if summary is not None:
+                    lines.append("%s %s" % (name.upper(), " ".join("%9.4f" % summary[k] for k in ("min", "max", "mean", "rms", "pp"))))
+        return "\n".join(lines)
+
+    def updateTiming(self):
+        if self.acq is None:
+            return
+        stats = self.acq.stats()
+        poll = stats["poll"]
+        link = stats["link"]
+        missed = sum(s["missed"] for s in stats.get("waveform", {}).values())
+        if "reconnectIn" in link:
+            text = "Link down, reconnecting in %.0f s" % link["reconnectIn"]
+        else:
+            text = "%.2f samples/s" % poll["rate"] if poll["rate"] else ""
+            if link["rtt"] is not None:
+                text += "  RTT %.0f mS" % (1000 * link["rtt"])
+        if poll["overruns"] or poll["missed"]:
+            text += "  %d late, %d missed" % (poll["overruns"], poll["missed"])
+        if missed:
+            text += "  %d func steps missed" % missed
+        if link["errors"] or link["reconnects"]:
+            text += "  %d errors, %d reconnects" % (link["errors"], link["reconnects"])
+        self.setText(self.lblTiming, text)
+
     def redrawGraphs(self):
         for i,g in enumerate(self.graphlist):
             if not (self.chConfig[i]["pbPause"].isChecked()):
-                clear = True
-                
-                if self.graphsettings[i]["venabled"].isChecked():
-                    g.passTrace(self.vdata[i], pen='b')
-                    clear = False
-
-                if self.graphsettings[i]["ienabled"].isChecked():
-                    g.passTrace(self.idata[i], pen='r', clear=clear)
-
-                if self.graphsettings[i]["penabled"].isChecked():
-                    g.passTrace(self.pdata[i], pen='g', clear=clear)
+                for name in ("v", "i", "p"):
+                    if g.traceVisible(name):
+                        self.drawTrace(i, name)
+
+    def drawTrace(self, graphnum, name):
+        # In seconds before the session's now, which is the same for every supply so their graphs line up
+        t = self.traces[graphnum].view("t")
+        if len(t):
+            # The whole buffer once it has filled, until then rounded up so the axis only changes now and again
+            full = self.graphsettings[graphnum]["points"] * self.sbReadingsInterval.value() / 1000.0
+            self.graphlist[graphnum].setXSpan(min(full, niceCeil(self.session.now - t[0])))
+        self.graphlist[graphnum].setTrace(name, self.traces[graphnum].view(name), t - self.session.now)
+
+def niceCeil(x):
+    """x rounded up to 1, 2 or 5 times a power of ten"""
+    if x <= 0:
+        return 1.0
+    power = 10.0 ** np.floor(np.log10(x))
+    for m in (1, 2, 5, 10):
+        if x <= m * power:
+            return m * power
 
 def makeApplication():
     # Create the Qt Application
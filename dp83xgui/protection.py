@@ -0,0 +1,94 @@
+# Host side over-current/power/energy/temperature protection for the DP83X
+#
+# The Watchdog is checked by the acquisition thread against every sample as
+# soon as the readings arrive, before they are batched for the GUI or logged,
+# and a breach is answered with DP83X.eStop() there and then.  The reaction
+# time is therefore at most one poll interval plus a couple of round trips,
+# whatever the GUI is doing, and each trip records how long it actually took:
+#   age       from the poll that saw the breach being sent to the outputs being off
+#   reaction  from its reply arriving to the outputs being off
+#
+# Only channels whose output is ON can trip, so once the outputs are off the
+# watchdog is quiet until something turns one back on.  Trips are appended to
+# captures/MODEL_SERIAL_trips.csv with their timestamps.
+
+import os
+import time
+
+from capturelog import PATHTOLOG
+
+FIELDS = ("i", "p", "e")
+UNITS = {"i": "A", "p": "W", "e": "Wh", "temp": "degC"}
+
+
+def tripLogName(idn, path=PATHTOLOG):
+    return os.path.join(path, idn["model"] + "_" + idn["serial"] + "_trips.csv")
+
+
+def describe(event):
+    """One line for a trip event, e.g. CH1 I 1.234 > 1 A, off in 3.2 mS"""
+    text = ", ".join("%s %s %.3f > %g %s" % (b["channel"], b["field"].upper(), b["value"], b["limit"], UNITS[b["field"]])
+                     for b in event["breaches"])
+    return "%s  %s, off in %.1f mS" % (time.strftime("%H:%M:%S", time.localtime(event["time"])), text, 1000 * event["age"])
+
+
+class Watchdog(object):
+    """
+    limits is {channel: {"i": A, "p": W, "e": Wh}}, a limit left out or None isn't checked.
+    maxTemp (degC) is checked whenever a sample has a temperature in it.
+    onTrip(event) is called from the acquisition thread after the outputs have been turned off.
+    """
+
+    def __init__(self, limits=None, maxTemp=None, logFile=None, onTrip=None):
+        self.limits = {ch: {f: v for f, v in chLimits.items() if v is not None} for ch, chLimits in (limits or {}).items()}
+        self.maxTemp = maxTemp
+        self.logFile = logFile
+        self.onTrip = onTrip
+        self.trips = []
+
+    @classmethod
+    def parseLimit(cls, spec):
+        """CHANNEL:FIELD:LIMIT, e.g. CH1:i:1.5, returns (channel, field, limit)"""
+        parts = spec.split(":")
+        if len(parts) != 3 or parts[1].lower() not in FIELDS:
+            raise ValueError("Limit %r should look like CH1:i:1.5, the field is one of %s" % (spec, ", ".join(FIELDS)))
+        return parts[0].upper(), parts[1].lower(), float(parts[2])
+
+    def check(self, sample):
+        """Returns the limits sample breaches as a list of {"channel", "field", "value", "limit"}, usually empty"""
+        breaches = []
+        readings = sample["readings"]
+        for ch, chLimits in self.limits.items():
+            r = readings.get(ch)
+            if r is None or r["state"].upper() != "ON":
+                continue
+            for field, limit in chLimits.items():
+                if r[field] > limit:
+                    breaches.append({"channel": ch, "field": field, "value": r[field], "limit": limit})
+        if self.maxTemp is not None and "temp" in sample:
+            temp = float(sample["temp"])
+            if temp > self.maxTemp and any(r["state"].upper() == "ON" for r in readings.values()):
+                breaches.append({"channel": "", "field": "temp", "value": temp, "limit": self.maxTemp})
+        return breaches
+
+    def record(self, sample, breaches, received, off):
+        """Note a trip once the outputs are off, received and off are monotonic_ns() times"""
+        event = {"time": sample["time"], "mono": sample["mono"], "breaches": breaches,
+                 "age": off / 1e9 - sample["mono"], "reaction": (off - received) / 1e9}
+        self.trips.append(event)
+        if self.logFile is not None:
+            self._log(event)
+        if self.onTrip is not None:
+            self.onTrip(event)
+        return event
+
+    def _log(self, event):
+        os.makedirs(os.path.dirname(self.logFile) or ".", exist_ok=True)
+        header = not os.path.exists(self.logFile)
+        with open(self.logFile, "a") as file:
+            if header:
+                file.write("Time,Timestamp,Channel,Field,Value,Limit,Age_ms,Reaction_ms\n")
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(event["time"])) + ".%03d" % (event["time"] % 1 * 1000)
+            for b in event["breaches"]:
+                file.write("%s,%f,%s,%s,%f,%f,%.3f,%.3f\n" % (stamp, event["time"], b["channel"], b["field"], b["value"],
+                                                            b["limit"], 1000 * event["age"], 1000 * event["reaction"]))
@@ -0,0 +1,70 @@
+# Fixed size trace buffers for the graphs
+#
+# Every sample is written twice, at idx and idx+capacity, so the newest
+# `capacity` samples are always one contiguous slice of the backing array.
+# That makes append O(1) and the ordered view a plain NumPy slice (no copy).
+
+import numpy as np
+
+
+class RingBuffer(object):
+    """Timestamp, voltage, current and power history for one channel"""
+
+    FIELDS = ("t", "v", "i", "p")
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.data = np.zeros((len(self.FIELDS), 2*self.capacity), dtype=np.float64)
+        self.idx = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, t, v, i, p):
+        col = (t, v, i, p)
+        self.data[:, self.idx] = col
+        self.data[:, self.idx + self.capacity] = col
+        self.idx += 1
+        if self.idx == self.capacity:
+            self.idx = 0
+        if self.count < self.capacity:
+            self.count += 1
+
+    def clear(self):
+        self.idx = 0
+        self.count = 0
+
+    def resize(self, capacity):
+        """Change the capacity, keeping as much of the most recent history as fits"""
+        keep = self.view()[:, -int(capacity):].copy() if self.count else None
+        self.__init__(capacity)
+        if keep is not None:
+            n = keep.shape[1]
+            self.data[:, :n] = keep
+            self.data[:, self.capacity:self.capacity+n] = keep
+            self.idx = n % self.capacity
+            self.count = n
+
+    def view(self, field=None):
+        """Oldest to newest samples, as a view into the buffer. Don't hold on to it across appends"""
+        start = self.idx + self.capacity - self.count
+        if field is None:
+            return self.data[:, start:start+self.count]
+        return self.data[self.FIELDS.index(field), start:start+self.count]
+
+    @property
+    def t(self):
+        return self.view("t")
+
+    @property
+    def v(self):
+        return self.view("v")
+
+    @property
+    def i(self):
+        return self.view("i")
+
+    @property
+    def p(self):
+        return self.view("p")
@@ -0,0 +1,134 @@
+# Running statistics for the readouts
+#
+# Min, max, mean, RMS and peak to peak, kept up to date one sample at a time
+# so the cost per sample is the same for a 10 point window as for a 30000 point
+# one or a week long session.
+#
+# SessionStats keeps counts and sums.  WindowStats covers the last capacity
+# samples, the same ones a graph's RingBuffer holds: sums are updated as
+# samples come in and drop out, and min/max come from monotonic deques whose
+# fronts are always the window's extremes.  Subtracting samples that drop out
+# slowly accumulates rounding error, so the sums are recomputed from the window
+# once every capacity samples, which is still O(1) per sample on average.
+
+import collections
+import math
+
+FIELDS = ("v", "i", "p")
+
+
+def summary(count, lo, hi, total, squares):
+    if not count:
+        return None
+    return {"min": lo, "max": hi, "mean": total / count, "rms": math.sqrt(max(0.0, squares / count)), "pp": hi - lo}
+
+
+class SessionStats(object):
+    """Min/max/mean/RMS/peak to peak over everything added since the last clear()"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.total = 0.0
+        self.squares = 0.0
+
+    def add(self, x):
+        self.count += 1
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        self.total += x
+        self.squares += x*x
+
+    def summary(self):
+        """{"min", "max", "mean", "rms", "pp"}, None if nothing has been added"""
+        return summary(self.count, self.min, self.max, self.total, self.squares)
+
+
+class WindowStats(object):
+    """Min/max/mean/RMS/peak to peak over the last capacity values added"""
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.clear()
+
+    def clear(self):
+        self.values = collections.deque()
+        self.lows = collections.deque()     # (n, x), x increasing, front is the window min
+        self.highs = collections.deque()    # (n, x), x decreasing, front is the window max
+        self.n = 0                          # values added since clear()
+        self.total = 0.0
+        self.squares = 0.0
+
+    def resize(self, capacity, values=()):
+        """Change the capacity and start again from values (oldest first), e.g. a resized RingBuffer's view"""
+        self.capacity = int(capacity)
+        self.clear()
+        for x in values[-self.capacity:] if len(values) else ():
+            self.add(float(x))
+
+    def add(self, x):
+        n = self.n
+        self.n += 1
+        self.values.append(x)
+        self.total += x
+        self.squares += x*x
+
+        while self.lows and self.lows[-1][1] >= x:
+            self.lows.pop()
+        self.lows.append((n, x))
+        while self.highs and self.highs[-1][1] <= x:
+            self.highs.pop()
+        self.highs.append((n, x))
+
+        if len(self.values) > self.capacity:
+            old = self.values.popleft()
+            self.total -= old
+            self.squares -= old*old
+            oldest = self.n - self.capacity
+            if self.lows[0][0] < oldest:
+                self.lows.popleft()
+            if self.highs[0][0] < oldest:
+                self.highs.popleft()
+
+        if self.n % self.capacity == 0:
+            self.total = math.fsum(self.values)
+            self.squares = math.fsum(v*v for v in self.values)
+
+    def summary(self):
+        """{"min", "max", "mean", "rms", "pp"}, None if the window is empty"""
+        if not self.values:
+            return None
+        return summary(len(self.values), self.lows[0][1], self.highs[0][1], self.total, self.squares)
+
+
+class ChannelStats(object):
+    """V, I and P statistics for one graph, over its points window and over the whole session"""
+
+    def __init__(self, capacity):
+        self.window = {f: WindowStats(capacity) for f in FIELDS}
+        self.session = {f: SessionStats() for f in FIELDS}
+
+    def add(self, v, i, p):
+        for f, x in zip(FIELDS, (v, i, p)):
+            self.window[f].add(x)
+            self.session[f].add(x)
+
+    def clearWindow(self):
+        for stats in self.window.values():
+            stats.clear()
+
+    def clear(self):
+        self.clearWindow()
+        for stats in self.session.values():
+            stats.clear()
+
+    def resize(self, ringbuffer):
+        """Follow a RingBuffer that has just been resized"""
+        for f in FIELDS:
+            self.window[f].resize(ringbuffer.capacity, ringbuffer.view(f))
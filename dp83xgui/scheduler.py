@@ -0,0 +1,126 @@
+# Fixed rate scheduling on the monotonic clock
+#
+# A Schedule hands out absolute deadlines, start + n*period on
+# time.monotonic_ns(), rather than sleeping for an interval after the work is
+# done.  Time spent polling or writing therefore doesn't stretch the period, and
+# a late slot is noticed and counted instead of silently shifting everything
+# after it.  When a slot is missed altogether the schedule either skips to the
+# next slot still in the future (the default) or catches up by running the
+# missed ones back to back, up to maxCatchup of them.
+#
+# Backoff spaces out retries, e.g. reconnecting to a supply that has dropped off
+# the network.
+
+import collections
+import time
+
+SKIP = "skip"
+CATCHUP = "catchup"
+
+
+class Schedule(object):
+    """Deadlines every interval seconds, interval 0 is as fast as possible"""
+
+    def __init__(self, interval, policy=SKIP, maxCatchup=10, window=100, start=None):
+        if policy not in (SKIP, CATCHUP):
+            raise ValueError("policy must be %r or %r" % (SKIP, CATCHUP))
+        self.policy = policy
+        self.maxCatchup = maxCatchup
+        self.period = int(interval * 1e9)
+        self.start = time.monotonic_ns() if start is None else start
+        self.slot = 0
+        self.ticks = collections.deque(maxlen=window)     # when recent slots actually ran
+        self.reset()
+
+    def reset(self):
+        """Clear the counters, the deadlines carry on as they were"""
+        self.count = 0
+        self.overruns = 0       # slots run after the following slot was already due
+        self.missed = 0         # slots skipped altogether
+        self.maxLate = 0        # ns
+        self.ticks.clear()
+
+    def restart(self, now=None):
+        """Start the deadlines again from now, e.g. after a pause, the rate is measured afresh too"""
+        self.start = time.monotonic_ns() if now is None else now
+        self.slot = 0
+        self.ticks.clear()
+
+    def deadline(self):
+        """monotonic_ns() time the current slot is due"""
+        return self.start + self.slot * self.period
+
+    def timeout(self, now=None):
+        """Seconds until the current slot is due, 0 if it already is"""
+        now = time.monotonic_ns() if now is None else now
+        return max(0, self.deadline() - now) / 1e9
+
+    def due(self, now=None):
+        now = time.monotonic_ns() if now is None else now
+        return now >= self.deadline()
+
+    def tick(self, now=None):
+        """
+        Call when the work for the current slot has been done (or started), moves on
+        to the next slot.  Returns the number of slots skipped to get there.
+        """
+        now = time.monotonic_ns() if now is None else now
+        self.count += 1
+        self.ticks.append(now)
+        if self.period <= 0:
+            return 0
+        self.maxLate = max(self.maxLate, now - self.deadline())
+
+        self.slot += 1
+        behind = (now - self.deadline()) // self.period + 1    # slots due already, this one included
+        if behind <= 0:
+            return 0
+        self.overruns += 1
+        skip = behind if self.policy == SKIP else max(0, behind - self.maxCatchup)
+        self.slot += skip
+        self.missed += skip
+        return skip
+
+    def setInterval(self, interval, now=None):
+        """
+        Change the period, the next slot is one new period after the last one that was due.
+        Coming from interval 0 there were no deadlines to speak of, it's one period after now.
+        """
+        now = time.monotonic_ns() if now is None else now
+        if self.period <= 0:
+            self.period = int(interval * 1e9)
+            self.start = now + self.period
+        else:
+            last = min(self.deadline() - self.period, now) if self.slot else self.start
+            self.period = int(interval * 1e9)
+            self.start = last + self.period if self.slot else last
+        self.slot = 0
+
+    def rate(self):
+        """Achieved slots per second over the recent window, None until there are two"""
+        if len(self.ticks) < 2 or self.ticks[-1] == self.ticks[0]:
+            return None
+        return (len(self.ticks) - 1) * 1e9 / (self.ticks[-1] - self.ticks[0])
+
+    def stats(self):
+        return {"interval": self.period / 1e9, "rate": self.rate(), "count": self.count,
+                "overruns": self.overruns, "missed": self.missed, "maxLate": self.maxLate / 1e9}
+
+
+class Backoff(object):
+    """Exponentially longer waits between retries: initial, initial*factor, ... up to maximum seconds"""
+
+    def __init__(self, initial=1.0, maximum=60.0, factor=2.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.reset()
+
+    def reset(self):
+        self.delay = self.initial
+
+    def next(self):
+        """The wait before the next retry, in seconds"""
+        delay = self.delay
+        self.delay = min(self.delay * self.factor, self.maximum)
+        return delay
@@ -0,0 +1,186 @@
+# Triggered burst captures for the DP83X
+#
+# A Trigger watches one channel's readings for a threshold crossing on V, I or
+# P, or for the output state (OUTP?) changing.  A BurstCapture keeps the last
+# pre seconds of samples in a ring buffer; when its trigger fires it asks for
+# polling at burst interval (0 is as fast as the link allows) for post seconds,
+# then writes pre + post samples to their own capture file, named
+# captures/MODEL_SERIAL_YYYYMMDD_HHMMSS_TRIG*, and re-arms.
+#
+# Both run on the acquisition thread, see Acquisition.setBurst(), so the faster
+# polling starts with the very next poll after the one that triggered.  Event
+# files are written by a thread of the BurstCapture's own, so the acquisition
+# thread never waits on the disk.
+#
+#   Trigger.parse("CH1:v:falling:4.5")      CH1 volts dropping through 4.5 V
+#   Trigger.parse("CH2:i:rising:0.8")       CH2 current going over 0.8 A
+#   Trigger.parse("CH1:v:falling:4.5:0.1")  as the first, re-armed once back over 4.6 V
+#   Trigger.parse("CH3:state")              CH3 output turned on or off
+#
+# A level trigger only arms once the value has been beyond the level by more
+# than the hysteresis, so noise on a supply sitting at the level doesn't fire
+# it over and over.
+
+import collections
+import queue
+import threading
+
+from capturelog import PATHTOLOG, openCaptureLog
+
+RISING = "rising"
+FALLING = "falling"
+EITHER = "either"
+FIELDS = ("v", "i", "p", "state")
+
+
+class Trigger(object):
+    """
+    Fires on channel's field crossing level in the edge direction, field "state" fires on any change.
+    After firing, the value has to go back beyond level by more than hysteresis before it can fire again.
+    """
+
+    def __init__(self, channel="CH1", field="v", edge=FALLING, level=0.0, hysteresis=0.0):
+        if field not in FIELDS:
+            raise ValueError("Trigger field must be one of %s" % ", ".join(FIELDS))
+        if edge not in (RISING, FALLING, EITHER):
+            raise ValueError("Trigger edge must be %r, %r or %r" % (RISING, FALLING, EITHER))
+        if hysteresis < 0:
+            raise ValueError("Trigger hysteresis can't be negative")
+        self.channel = channel
+        self.field = field
+        self.edge = edge
+        self.level = level
+        self.hysteresis = hysteresis
+        self.last = None        # the last output state, for a "state" trigger
+        self.armed = set()      # edges that can fire, the value has been far enough the other side of level
+
+    @classmethod
+    def parse(cls, spec):
+        """CHANNEL:FIELD[:EDGE:LEVEL[:HYSTERESIS]], e.g. CH1:v:falling:4.5 or CH3:state"""
+        parts = spec.split(":")
+        if len(parts) == 2 and parts[1].lower() == "state":
+            return cls(parts[0].upper(), "state", EITHER)
+        if len(parts) not in (4, 5):
+            raise ValueError("Trigger %r should look like CH1:v:falling:4.5, CH1:v:falling:4.5:0.1 or CH1:state" % spec)
+        return cls(parts[0].upper(), parts[1].lower(), parts[2].lower(), float(parts[3]), float(parts[4]) if len(parts) == 5 else 0.0)
+
+    def describe(self):
+        if self.field == "state":
+            return "%s output state change" % self.channel
+        if self.hysteresis:
+            return "%s %s %s %g (hysteresis %g)" % (self.channel, self.field.upper(), self.edge, self.level, self.hysteresis)
+        return "%s %s %s %g" % (self.channel, self.field.upper(), self.edge, self.level)
+
+    def rearm(self):
+        """Disarm, so the next sample can't fire and the value has to leave the level again first"""
+        self.last = None
+        self.armed.clear()
+
+    def check(self, readings):
+        """Feed one sample's readings, True if the trigger fires on it"""
+        reading = readings.get(self.channel)
+        if reading is None:
+            return False
+        value = reading[self.field]
+        if self.field == "state":
+            last, self.last = self.last, value
+            return last is not None and value != last
+        if value > self.level + self.hysteresis:
+            self.armed.add(FALLING)
+        if value < self.level - self.hysteresis:
+            self.armed.add(RISING)
+        if self.edge != RISING and FALLING in self.armed and value <= self.level:
+            self.armed.discard(FALLING)
+            return True
+        if self.edge != FALLING and RISING in self.armed and value >= self.level:
+            self.armed.discard(RISING)
+            return True
+        return False
+
+
+class BurstCapture(object):
+    """
+    Pre-trigger ring buffer and post-trigger capture for one Trigger.  add() every
+    sample in order, interval is the poll interval in mS wanted while active.
+    onCapture(filename, trigger) is called from the writer thread after each event is saved,
+    onError(str) if saving one fails.
+    """
+
+    def __init__(self, trigger, idn, channels=("CH1", "CH2", "CH3"), pre=5.0, post=5.0, interval=0,
+                 fmt="bin", path=PATHTOLOG, onCapture=None, onError=None):
+        self.trigger = trigger
+        self.idn = idn
+        self.channels = list(channels)
+        self.pre = pre
+        self.post = post
+        self.interval = interval
+        self.fmt = fmt if fmt in ("csv", "bin") else "bin"     # not an archive per event
+        self.path = path
+        self.onCapture = onCapture
+        self.onError = onError
+        self.buffer = collections.deque()
+        self.samples = None     # the event being captured, None while armed
+        self.triggeredAt = None # monotonic seconds of the sample that fired
+        self.count = 0          # events captured, the last may still be being written
+        self.events = queue.Queue()     # (number, samples) for the writer thread
+        self.writer = None
+
+    @property
+    def active(self):
+        return self.samples is not None
+
+    def add(self, sample):
+        """Returns True while samples are wanted at the burst interval"""
+        fired = self.trigger.check(sample["readings"])
+        if self.samples is not None:
+            self.samples.append(sample)
+            if sample["mono"] - self.triggeredAt >= self.post:
+                self._save()
+            return self.samples is not None
+
+        self.buffer.append(sample)
+        while sample["mono"] - self.buffer[0]["mono"] > self.pre:
+            self.buffer.popleft()
+        if fired:
+            self.triggeredAt = sample["mono"]
+            self.samples = list(self.buffer)
+            self.buffer.clear()
+        return fired
+
+    def flush(self):
+        """Save an event still being captured, e.g. when stopping"""
+        if self.samples is not None:
+            self._save()
+
+    def wait(self):
+        """Block until every event captured so far is on disk"""
+        self.events.join()
+
+    def _save(self):
+        samples, self.samples = self.samples, None
+        self.trigger.rearm()
+        self.count += 1
+        if self.writer is None:
+            self.writer = threading.Thread(target=self._write, daemon=True)
+            self.writer.start()
+        self.events.put((self.count, samples))
+
+    def _write(self):
+        while True:
+            number, samples = self.events.get()
+            try:
+                log = openCaptureLog(self.idn, self.fmt, self.channels, self.path, samples[0]["time"], "_TRIG%d" % number)
+                try:
+                    for sample in samples:
+                        log.write(sample)
+                finally:
+                    log.close()
+                if self.onCapture is not None:
+                    self.onCapture(log.filename(self.channels[0]), self.trigger)
+            except Exception as err:
+                if self.onError is not None:
+                    self.onError("Triggered capture failed: %s" % err)
+                else:
+                    print("Triggered capture failed:", err)
+            finally:
+                self.events.task_done()
@@ -0,0 +1,197 @@
+# Function generator waveforms for the DP83X
+#
+# Tables hold one period of a waveform scaled 0..1, a Waveform turns one into
+# volts with its amplitude/offset/phase/period and compiles the :APPL command
+# for every step up front.  The WaveformEngine is stepped by the acquisition
+# thread off a Schedule per channel, so each step costs one write of prepared
+# strings however many channels are running.
+
+import ast
+import operator
+import threading
+
+import numpy as np
+
+from dp83x import TIMERMINSTEP, TIMERMAXGROUPS
+from scheduler import Schedule
+
+MINSTEP = 0.06      # seconds, about as fast as a DP83X will follow a new setpoint
+
+# What an ARB expression may use, see evalTable()
+FUNCTIONS = ("sin", "cos", "tan", "arcsin", "arccos", "arctan", "sinh", "cosh", "tanh", "exp", "log", "log2",
+             "log10", "sqrt", "abs", "sign", "floor", "ceil", "round", "minimum", "maximum", "clip", "where", "mod")
+CONSTANTS = {"pi": np.pi, "e": np.e}
+OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+             ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+             ast.USub: operator.neg, ast.UAdd: operator.pos,
+             ast.Lt: operator.lt, ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge}
+
+
+def builtinTables(numSamples=100):
+    """The original SIN/SQR/SAW tables, numSamples per period"""
+    x = np.arange(numSamples)
+    return {
+        "SIN": (np.sin(2*np.pi*x/numSamples) + 1)/2,
+        "SQR": np.where(x < numSamples/2, 0.0, 1.0),
+        "SAW": 1 - np.abs(x % numSamples - numSamples/2)/(numSamples/2),
+    }
+
+
+def evalTable(expression, x):
+    """
+    Evaluate an ARB expression of x without eval(): only numbers, x, pi, arithmetic,
+    comparisons and np.<one of FUNCTIONS>(...) are allowed, anything else raises ValueError
+    """
+    def value(node):
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            return float(node.value)    # floats overflow instead of growing forever, e.g. 9**9**9
+        if isinstance(node, ast.Name) and node.id == "x":
+            return x
+        if isinstance(node, ast.Name) and node.id in CONSTANTS:
+            return CONSTANTS[node.id]
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == "np" \
+                and node.attr in CONSTANTS:
+            return CONSTANTS[node.attr]
+        if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+            return OPERATORS[type(node.op)](value(node.left), value(node.right))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in OPERATORS:
+            return OPERATORS[type(node.op)](value(node.operand))
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in OPERATORS:
+            return OPERATORS[type(node.ops[0])](value(node.left), value(node.comparators[0]))
+        if isinstance(node, ast.Call) and not node.keywords and isinstance(node.func, ast.Attribute) \
+                and isinstance(node.func.value, ast.Name) and node.func.value.id == "np" and node.func.attr in FUNCTIONS:
+            return getattr(np, node.func.attr)(*[value(arg) for arg in node.args])
+        raise ValueError("%r isn't allowed in a waveform expression" % ast.get_source_segment(expression, node))
+
+    expression = expression.strip()
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as err:
+        raise ValueError("Bad waveform expression: %s" % err.msg)
+    with np.errstate(all="ignore"):
+        return value(tree.body)
+
+
+def loadTable(source, numSamples=100):
+    """
+    Make a table from a CSV file (the last number on each line) or a NumPy expression
+    of x, which runs 0..1 over the period, e.g. "np.sin(2*np.pi*x)**2".
+    Tables are used as they are, scale them 0..1 to match the built in ones.
+    """
+    if source.lower().endswith(".csv"):
+        values = []
+        with open(source) as file:
+            for line in file:
+                try:
+                    values.append(float(line.strip().split(",")[-1]))
+                except ValueError:
+                    pass        # header or blank line
+        table = np.array(values)
+    else:
+        x = np.arange(numSamples)/numSamples
+        table = np.broadcast_to(evalTable(source, x), x.shape)
+    if len(table) < 2:
+        raise ValueError("A waveform table needs at least 2 samples")
+    return np.asarray(table, dtype=float)
+
+
+def timerSequence(table, amplitude, period, minStep=TIMERMINSTEP, maxGroups=TIMERMAXGROUPS, offset=0.0, maxV=None):
+    """
+    Resample one period of table into groups for the supply's Timer function, volts clamped to 0..maxV.
+    Returns (volts, dwell), raises ValueError if the period is too short for at least two groups.
+    Samples are picked rather than interpolated so square edges stay square.
+    """
+    steps = min(len(table), int(period // minStep), maxGroups)
+    if steps < 2:
+        raise ValueError("A %.2fs period is too short for the timer, it needs at least %gs"%(period, 2*minStep))
+    pick = (np.arange(steps) * len(table)) // steps
+    volts = np.clip(offset + np.asarray(table, dtype=float)[pick] * amplitude, 0.0, np.inf if maxV is None else maxV)
+    return [float(v) for v in volts], [period/steps] * steps
+
+
+class Waveform(object):
+    """One channel's waveform: volts = offset + amplitude*table, phase in degrees, clamped to 0..maxV"""
+
+    def __init__(self, channel, table, period, amplitude, offset=0.0, phase=0.0, maxV=None):
+        self.channel = channel
+        self.table = np.asarray(table, dtype=float)
+        self.period = period
+        self.amplitude = amplitude
+        self.offset = offset
+        self.phase = phase
+        self.maxV = maxV
+
+        # No point stepping faster than the table changes or the supply can follow
+        self.steps = max(1, min(len(self.table), int(period // MINSTEP)))
+        self.step = period / self.steps
+        self.volts = self._volts()
+        self.commands = [":APPL %s,%.3f"%(channel, v) for v in self.volts]
+        # Same as commands, but None where the setpoint doesn't change from the step before
+        self.changes = [None if self.commands[k] == self.commands[k-1] else cmd for k, cmd in enumerate(self.commands)]
+
+    def _volts(self):
+        start = self.phase/360.0 * len(self.table)
+        pick = (start + np.arange(self.steps) * len(self.table) / self.steps).astype(int) % len(self.table)
+        volts = self.offset + self.amplitude * self.table[pick]
+        return np.clip(volts, 0.0, self.maxV if self.maxV is not None else np.inf)
+
+    def timerSequence(self):
+        return timerSequence(np.roll(self.table, -int(self.phase/360.0 * len(self.table))), self.amplitude, self.period,
+                             offset=self.offset, maxV=self.maxV)
+
+
+class WaveformEngine(object):
+    """
+    Steps any number of Waveforms.  set() runs in the GUI thread and swaps in a
+    new schedule, nextTime()/due() run in the acquisition thread with times from
+    time.monotonic_ns().  A late tick jumps to the step that is due now rather
+    than stretching the period, stats() says how many steps were missed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = {}       # channel -> (waveform, Schedule)
+
+    def set(self, channel, waveform):
+        """Start (or restart with new settings) channel's waveform, None stops it"""
+        with self.lock:
+            if waveform is None:
+                self.running.pop(channel, None)
+            else:
+                self.running[channel] = (waveform, Schedule(waveform.step))
+
+    def restart(self):
+        """Start every waveform again from its first step now, e.g. after a pause, rather than catching up"""
+        with self.lock:
+            for channel, (wf, schedule) in list(self.running.items()):
+                self.running[channel] = (wf, Schedule(wf.step))
+
+    def channels(self):
+        return list(self.running)
+
+    def nextTime(self):
+        """monotonic_ns() time of the next step, None if nothing is running"""
+        with self.lock:
+            times = [schedule.deadline() for wf, schedule in self.running.values()]
+        return min(times) if times else None
+
+    def due(self, now):
+        """Returns the commands for every step due at now, for DP83X.send() to write as one message"""
+        cmds = []
+        with self.lock:
+            for wf, schedule in self.running.values():
+                if not schedule.due(now):
+                    continue
+                first = schedule.count == 0
+                skipped = schedule.tick(now)
+                k = (schedule.slot - 1) % wf.steps
+                # After a skipped step send the setpoint whether it changed or not
+                cmd = wf.commands[k] if first or skipped else wf.changes[k]
+                if cmd is not None:
+                    cmds.append(cmd)
+        return cmds
+
+    def stats(self):
+        """Schedule.stats() for each running channel"""
+        with self.lock:
+            return {channel: schedule.stats() for channel, (wf, schedule) in self.running.items()}
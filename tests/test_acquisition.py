@@ -0,0 +1,78 @@
+# Acquisition against the simulator: python -m pytest tests
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "dp83xgui"))
+
+from acquisition import Acquisition
+from dp83x import DP83X
+from protection import Watchdog
+from waveform import Waveform, WaveformEngine
+
+
+def start(constr="SIM::DP832", interval=0, **kwargs):
+    inst = DP83X()
+    inst.conn(constr)
+    acq = Acquisition(inst, interval=interval, onSamples=lambda batch: None, **kwargs)
+    acq.start()
+    return inst, acq
+
+
+def test_stop_runs_queued_commands():
+    for interval in (0, 100):
+        inst, acq = start("SIM::DP832::latency=10", interval)
+        sim = inst.inst
+        acq.submit(inst.uploadTimer, "CH1", [1.0, 2.0], 1.0, [1.0, 1.0])
+        acq.submit(inst.timerOn, "CH1")
+        time.sleep(0.2)
+        assert sim.channels[0].timerOn
+        acq.submit(inst.timerOff, "CH1")
+        acq.stop()
+        assert not acq.is_alive()
+        assert not sim.channels[0].timerOn
+
+
+def test_pause_restarts_waveform():
+    engine = WaveformEngine()
+    engine.set("CH1", Waveform("CH1", np.linspace(0, 1, 20), 2.0, 5))
+    inst, acq = start(interval=100, waveform=engine)
+    time.sleep(0.3)
+    acq.pause(True)
+    time.sleep(1.0)
+    acq.pause(False)
+    time.sleep(0.3)
+    acq.stop()
+    assert engine.stats()["CH1"]["missed"] == 0
+
+
+def test_no_energy_across_pause():
+    inst, acq = start("SIM::DP832::load=10", interval=20)
+    acq.submit(inst.setpoint, "CH1", 5.0, 1.0, "ON")
+    time.sleep(0.3)
+    acq.pause(True)
+    time.sleep(1.0)
+    acq.pause(False)
+    time.sleep(0.3)
+    acq.stop()
+    # 2.5 W for about 0.6 s running, not the 1.6 s since it was turned on
+    assert 0 < acq.energy["CH1"] < 2.5 * 1.0 / 3600
+
+
+def test_watchdog_trips_while_paused():
+    watchdog = Watchdog({"CH1": {"i": 0.2}})
+    inst, acq = start("SIM::DP832::load=10", interval=50, watchdog=watchdog)
+    batches = []
+    acq.onSamples = batches.append
+    acq.pause(True)
+    time.sleep(0.1)
+    del batches[:]
+    acq.submit(inst.setpoint, "CH1", 5.0, 1.0, "ON")
+    time.sleep(0.5)
+    acq.stop()
+    assert len(watchdog.trips) == 1
+    assert not inst.inst.channels[0].on
+    assert not batches
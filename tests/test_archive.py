@@ -0,0 +1,83 @@
+# python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "dp83xgui"))
+
+from archive import Archive, ArchiveLog
+from capturelog import loadCapture
+
+IDN = {"company": "RIGOL TECHNOLOGIES", "model": "DP832", "serial": "DP8C000001", "ver": "00.01.16"}
+START = 1700000000.0
+TIERS = ((0, 20), (1, 10), (10, 5))
+
+
+def writeRun(basename, seconds, rate=4):
+    log = ArchiveLog(basename, IDN, ("CH1", "CH2"), tiers=TIERS, startTime=START)
+    for n in range(seconds*rate):
+        readings = {"CH1": {"v": float(n), "i": 0.5, "p": 0.5*n, "state": "ON", "e": n/1000},
+                    "CH2": {"v": -float(n), "i": 0.0, "p": 0.0, "state": "OFF", "e": 0.0}}
+        log.write({"time": START + n/rate, "readings": readings})
+    log.close()
+    return log.filename()
+
+
+def test_tier_roll_up(tmp_path):
+    arc = Archive(writeRun(str(tmp_path / "run"), 40))
+    assert arc.meta["serial"] == "DP8C000001" and arc.channels == ["CH1", "CH2"]
+
+    # Every sample, the last 20 of 160
+    full = arc.tier(0)
+    ch1 = arc.channel(full, "CH1")
+    assert np.array_equal(full[:, 0], START + np.arange(140, 160) / 4)
+    assert np.array_equal(ch1["vmin"], ch1["v"]) and np.array_equal(ch1["vmax"], ch1["v"])
+    assert np.array_equal(ch1["v"], np.arange(140, 160))
+
+    # 1 s buckets of 4 samples, the ring of 10 holds the last 10 s
+    seconds = arc.tier(1)
+    s = np.arange(30, 40)
+    ch1 = arc.channel(seconds, "CH1")
+    assert np.array_equal(seconds[:, 0], START + s + 0.375)
+    assert np.array_equal(ch1["vmin"], 4*s) and np.array_equal(ch1["vmax"], 4*s + 3)
+    assert np.array_equal(ch1["v"], 4*s + 1.5) and np.array_equal(ch1["pmax"], 0.5*(4*s + 3))
+    assert np.array_equal(ch1["e"], (4*s + 3) / 1000)
+    assert np.array_equal(arc.channel(seconds, "CH2")["vmin"], -(4*s + 3))
+
+    # 10 s buckets of 40, only 4 of the 5 slots written
+    tens = arc.tier(2)
+    b = np.arange(4)
+    ch1 = arc.channel(tens, "CH1")
+    assert np.array_equal(tens[:, 0], START + 10*b + 4.875)
+    assert np.array_equal(ch1["vmin"], 40*b) and np.array_equal(ch1["vmax"], 40*b + 39)
+    assert np.array_equal(ch1["v"], 40*b + 19.5)
+
+
+def test_merged(tmp_path):
+    arc = Archive(writeRun(str(tmp_path / "run"), 40))
+    rows = arc.merged()
+    # 10 s buckets until the 1 s tier starts at 30 s, then 1 s until the full rate tier starts at 35 s
+    assert len(rows) == 3 + 5 + 20
+    assert np.all(np.diff(rows[:, 0]) > 0)
+    assert np.array_equal(rows[:3, 0], START + np.array([4.875, 14.875, 24.875]))
+    assert np.array_equal(rows[3:8, 0], START + np.arange(30, 35) + 0.375)
+    assert np.array_equal(rows[8:, 0], arc.tier(0)[:, 0])
+    vmax = arc.channel(rows, "CH1")["vmax"]
+    assert vmax[2] == 119 and vmax[7] == 139 and vmax[-1] == 159
+
+    meta, channels = loadCapture(arc.filename)
+    assert meta["model"] == "DP832"
+    assert np.array_equal(channels["CH1"]["t"], rows[:, 0] - START)
+    assert np.array_equal(channels["CH2"]["vmin"], arc.channel(rows, "CH2")["vmin"])
+
+
+def test_wraps_in_place(tmp_path):
+    filename = writeRun(str(tmp_path / "short"), 2)
+    size = os.path.getsize(filename)
+    arc = Archive(filename)
+    assert len(arc.tier(0)) == 8 and len(arc.tier(1)) == 2 and len(arc.tier(2)) == 1
+    assert len(arc.merged()) == 8           # all still held at full rate
+    # A run twenty times as long takes the same space
+    assert os.path.getsize(writeRun(str(tmp_path / "long"), 40)) == size
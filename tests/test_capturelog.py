@@ -0,0 +1,81 @@
+# python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "dp83xgui"))
+
+from capturelog import BinaryCapture, BinaryCaptureLog, CaptureLog, binaryToCsv, csvToBinary, readCsv
+
+IDN = {"company": "RIGOL TECHNOLOGIES", "model": "DP831", "serial": "DP8B000001", "ver": "00.01.14"}
+CHANNELS = ("CH1", "CH2", "CH3")
+
+
+def samples(n):
+    for k in range(n):
+        readings = {}
+        for c, ch in enumerate(CHANNELS):
+            readings[ch] = {"v": 5.0 + c + k/8, "i": 0.25*c + k/64, "p": 0.5*k, "state": "ON", "e": k/1000}
+        yield {"time": 1000.0 + k/4, "readings": readings}
+
+
+def test_csv_log(tmp_path):
+    log = CaptureLog(str(tmp_path / "DP831_DP8B000001_20240102_030405"), CHANNELS, flushInterval=0)
+    for sample in samples(3):
+        log.write(sample)
+    # flushInterval=0, every write is on disk straight away
+    assert len(np.loadtxt(log.filename("CH2"), delimiter=",", skiprows=1, ndmin=2)) == 3
+    for sample in samples(10):
+        sample["time"] += 0.75
+        log.write(sample)
+    log.close()
+
+    data = np.loadtxt(str(tmp_path / "DP831_DP8B000001_20240102_030405_CH2.csv"), delimiter=",", skiprows=1)
+    assert data.shape == (13, 5)
+    assert list(data[:4, 0]) == [0.0, 0.25, 0.5, 0.75]
+    assert data[1, 1] == 6.125 and data[1, 2] == 0.265625 and data[1, 3] == 0.5
+    assert data[1, 4] == 0.001
+
+
+def test_binary_round_trip(tmp_path):
+    log = BinaryCaptureLog(str(tmp_path / "cap"), IDN, CHANNELS)
+    for sample in samples(100):
+        if sample["time"] == 1010.0:
+            del sample["readings"]["CH3"]
+        log.write(sample)
+    log.close()
+    with open(log.filename(), "ab") as file:
+        file.write(b"\0" * 12)      # half a record from a logger that was killed
+
+    cap = BinaryCapture(log.filename())
+    assert len(cap) == 100
+    assert cap.meta["model"] == "DP831" and cap.meta["serial"] == "DP8B000001"
+    assert cap.channels == list(CHANNELS)
+    assert np.array_equal(cap.t, np.arange(100) / 4)
+    ch2 = cap.channel("CH2")
+    assert np.array_equal(ch2["v"], 6.0 + np.arange(100) / 8)
+    assert np.array_equal(ch2["i"], 0.25 + np.arange(100) / 64)
+    assert np.array_equal(ch2["p"], 0.5 * np.arange(100))
+    assert np.array_equal(ch2["e"], np.arange(100) / 1000)
+    assert np.isnan(cap.channel("CH3")["v"][40]) and cap.channel("CH3")["v"][41] == 7.0 + 41/8
+
+
+def test_csv_binary_conversion(tmp_path):
+    basename = str(tmp_path / "DP831_DP8B000001_20240102_030405")
+    log = CaptureLog(basename, CHANNELS)
+    for sample in samples(50):
+        log.write(sample)
+    log.close()
+
+    cap = BinaryCapture(csvToBinary(basename))
+    assert len(cap) == 50
+    assert cap.channels == list(CHANNELS)
+    assert cap.meta["model"] == "DP831" and cap.meta["serial"] == "DP8B000001"
+    assert np.array_equal(cap.channel("CH1")["v"], 5.0 + np.arange(50) / 8)
+
+    names = binaryToCsv(cap.filename, str(tmp_path / "back"))
+    assert [os.path.basename(name) for name in names] == ["back_CH1.csv", "back_CH2.csv", "back_CH3.csv"]
+    for ch in CHANNELS:
+        assert np.array_equal(readCsv(str(tmp_path / ("back_" + ch + ".csv"))), readCsv(basename + "_" + ch + ".csv"))
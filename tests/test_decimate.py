@@ -0,0 +1,63 @@
+# python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "dp83xgui"))
+
+from decimate import MinMaxPyramid
+
+
+def bruteForce(x, y, width):
+    # Min and max of every `width` samples, the last block may be short
+    starts = range(0, len(x), width)
+    return (np.array([x[s] for s in starts]),
+            np.array([y[s:s+width].min() for s in starts]),
+            np.array([y[s:s+width].max() for s in starts]))
+
+
+def test_levels_match_brute_force():
+    rng = np.random.default_rng(1)
+    n = 100003
+    x = np.arange(n) * 0.01
+    y = rng.normal(size=n)
+    pyramid = MinMaxPyramid(x, y, block=16, factor=4, smallest=1024)
+    assert len(pyramid) == n
+    assert len(pyramid.levels) == 3        # 6251, 1563 then 391 points
+    width = 16
+    for lx, lmin, lmax in pyramid.levels:
+        bx, bmin, bmax = bruteForce(x, y, width)
+        assert np.array_equal(lx, bx)
+        assert np.array_equal(lmin, bmin)
+        assert np.array_equal(lmax, bmax)
+        width *= 4
+    assert len(pyramid.levels[-1][0]) <= 1024
+
+
+def test_query_keeps_peaks():
+    n = 200000
+    x = np.arange(n, dtype=np.float64)
+    y = np.zeros(n)
+    y[123457] = 10.0
+    y[98765] = -3.0
+    pyramid = MinMaxPyramid(x, y)
+    xs, ys = pyramid.query(0, n, 1000)
+    assert len(xs) <= 2*(1000 + 2)
+    assert ys.max() == 10.0 and ys.min() == -3.0
+    assert xs[0] <= 0 and xs[-1] >= n - 4096
+
+
+def test_query_zoomed_in_is_raw():
+    x = np.arange(100000, dtype=np.float64)
+    y = np.sin(x)
+    pyramid = MinMaxPyramid(x, y)
+    xs, ys = pyramid.query(5000, 5100, 1000)
+    assert np.array_equal(xs, x[4999:5102])
+    assert np.array_equal(ys, y[4999:5102])
+
+
+def test_bounds():
+    assert MinMaxPyramid(np.array([]), np.array([])).bounds() == (0.0, 1.0)
+    assert MinMaxPyramid(np.array([2.0, 5.0]), np.array([0.0, 1.0])).bounds() == (2.0, 5.0)
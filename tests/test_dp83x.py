@@ -0,0 +1,50 @@
+# DP83X against the simulator: python -m pytest tests
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "dp83xgui"))
+
+from dp83x import CharDevInst, DP83X
+
+
+def connect(constr):
+    inst = DP83X()
+    inst.conn(constr)
+    return inst
+
+
+def test_compound_kept_through_link_drop():
+    inst = connect("SIM::DP832::drop=0.1,0.2::test_compound")
+    inst.pollAll()
+    time.sleep(0.15)
+    with pytest.raises(IOError):
+        inst.pollAll()
+    assert inst.compound
+    time.sleep(0.2)
+    assert set(inst.pollAll()) == {"CH1", "CH2", "CH3"}
+    assert inst.compound
+
+
+def test_compound_rejected():
+    inst = connect("SIM::DP832::compound=0")
+    assert set(inst.pollAll(("CH1", "CH2"))) == {"CH1", "CH2"}
+    assert not inst.compound
+
+
+def test_coalesced_writes_start_from_root():
+    master, slave = os.openpty()
+    inst = CharDevInst(os.ttyname(slave))
+    try:
+        with inst.coalesce():
+            inst.write(":SOURce1:CURRent 1.000")
+            inst.write("OUTP CH1,OFF")
+            inst.write("*CLS")
+        assert os.read(master, 1024) == b":SOURce1:CURRent 1.000;:OUTP CH1,OFF;*CLS\n"
+    finally:
+        inst.close()
+        os.close(slave)
+        os.close(master)
@@ -0,0 +1,117 @@
+# AsyncDP83X against the simulator: python -m pytest tests
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "dp83xgui"))
+
+from dp83xasync import AsyncDP83X, SocketTransport
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def connect(constr="SIM::DP832"):
+    inst = AsyncDP83X()
+    await inst.conn(constr)
+    await inst.identify()
+    return inst
+
+
+def test_timer():
+    async def body():
+        inst = await connect()
+        sim = inst.inst.inst
+        assert await inst.timerSupported()
+        await inst.uploadTimer("CH2", [1.0, 2.0, 3.0], 0.5, [1.0, 1.0, 1.0])
+        assert sim.channels[1].groups == [(1.0, 0.5, 1.0), (2.0, 0.5, 1.0), (3.0, 0.5, 1.0)]
+        assert sim.channels[1].cycles == 0
+        await inst.timerOn("CH2")
+        assert sim.channels[1].timerOn
+        await inst.timerOff("CH2")
+        assert not sim.channels[1].timerOn
+        await inst.dis()
+    run(body())
+
+
+def test_no_timer():
+    async def body():
+        inst = await connect("SIM::DP832::timer=0")
+        assert not await inst.timerSupported()
+        await inst.dis()
+    run(body())
+
+
+def test_reconnect():
+    async def body():
+        inst = await connect("SIM::DP832::drop=0.3,0.3::test_reconnect")
+        idn = await inst.identify()
+        await inst.pollAll()
+        await asyncio.sleep(0.35)
+        try:
+            await inst.pollAll()
+        except IOError:
+            pass
+        else:
+            raise AssertionError("pollAll() worked with the link down")
+        while True:
+            try:
+                await inst.reconnect()
+                break
+            except IOError:
+                await asyncio.sleep(0.05)
+        assert await inst.identify() == idn
+        assert inst.compound
+        readings = await inst.pollAll()
+        assert set(readings) == {"CH1", "CH2", "CH3"}
+        await inst.dis()
+    start = time.monotonic()
+    run(body())
+    assert time.monotonic() - start < 5
+
+
+async def scpiServer(delay):
+    """Answers SLOW? after delay seconds and anything else straight away, with the command"""
+    async def handle(reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            cmd = line.decode("ascii").strip()
+            if cmd == "SLOW?":
+                await asyncio.sleep(delay)
+            writer.write((cmd + "\n").encode("ascii"))
+            try:
+                await writer.drain()
+            except ConnectionError:
+                break
+        writer.close()
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+def test_late_reply_discarded():
+    async def body():
+        server = await scpiServer(0.3)
+        port = server.sockets[0].getsockname()[1]
+        sock = SocketTransport("127.0.0.1", port, timeout=0.1)
+        await sock.open()
+        try:
+            await sock.query("SLOW?")
+        except IOError:
+            pass
+        else:
+            raise AssertionError("SLOW? should have timed out")
+        await asyncio.sleep(0.3)
+        assert (await sock.query("FAST?")).strip() == "FAST?"
+
+        await sock.write("SLOW?")
+        await sock.clear()
+        await asyncio.sleep(0.3)
+        assert (await sock.query("MEAS?")).strip() == "MEAS?"
+        await sock.close()
+        server.close()
+        await server.wait_closed()
+    run(body())
@@ -0,0 +1,73 @@
+# A shared simulator: python -m pytest tests
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "dp83xgui"))
+
+from dp83x import DP83X
+from dp83xshare import InstrumentShare, ShareInst, serve
+
+
+def test_writes_and_queries(tmp_path):
+    inst = DP83X()
+    inst.conn("SIM::DP832::latency=5")
+    share = InstrumentShare(inst, interval=500)
+    share.start()
+    address = str(tmp_path / "dp83x.sock")
+    server = serve(share, address)
+    try:
+        client = ShareInst("SHARE::" + address)
+        time.sleep(0.1)
+        assert client.query("OUTP? CH1").strip() == "OFF"
+        # A write and a query on one line, the reply is the query's
+        assert client.query("OUTP CH1,ON;OUTP? CH1").strip() == "ON"
+        # Not the cached OFF from the poll before the write
+        client.write("OUTP CH1,OFF")
+        assert client.query("OUTP? CH1").strip() == "OFF"
+        client.write(":APPL CH2,3.000")
+        assert client.query("APPL? CH2,VOLT;OUTP? CH2").strip() == "3.000;OFF"
+        client.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        share.stop()
+
+
+def test_setpoint_checks_shared(tmp_path):
+    inst = DP83X()
+    inst.conn("SIM::DP832")
+    sim = inst.inst
+    queries = []
+    query = sim.query
+    sim.query = lambda cmd: queries.append(cmd) or query(cmd)
+    share = InstrumentShare(inst, interval=100)
+    share.start()
+    address = str(tmp_path / "dp83x.sock")
+    server = serve(share, address)
+    try:
+        clients = []
+        for _ in range(3):
+            client = DP83X()
+            client.conn("SHARE::" + address)
+            client.setpoint("CH1", 5.0, 1.0)
+            clients.append(client)
+        time.sleep(0.3)
+        del queries[:]
+        for _ in range(5):
+            for client in clients:
+                assert client.checkSetpoints() == []
+        assert clients[0].queryVolt("CH1") == 5.0
+        # Only the server's own reads, all three channels at once
+        assert all(cmd.count("APPL?") in (0, 3) for cmd in queries)
+        # A client changing a setpoint is seen by the others' checks
+        clients[0].setpoint("CH1", 6.0)
+        time.sleep(0.05)        # the write comes in on another connection
+        assert clients[1].checkSetpoints() == ["CH1"]
+        for client in clients:
+            client.dis()
+    finally:
+        server.shutdown()
+        server.server_close()
+        share.stop()
@@ -0,0 +1,62 @@
+# python -m pytest tests
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "dp83xgui"))
+
+from protection import Watchdog, describe
+
+
+def sample(states=("ON", "ON", "ON"), i=0.5, p=2.5, e=0.1, temp=None):
+    readings = {"CH%d" % (n + 1): {"v": 5.0, "i": i, "p": p, "state": state, "e": e} for n, state in enumerate(states)}
+    sample = {"time": 1700000000.25, "mono": 1000.0, "readings": readings}
+    if temp is not None:
+        sample["temp"] = temp
+    return sample
+
+
+def test_trip():
+    watchdog = Watchdog({"CH1": {"i": 1.0, "p": None}, "CH2": {"p": 2.0, "e": 0.2}})
+    assert watchdog.check(sample()) == [{"channel": "CH2", "field": "p", "value": 2.5, "limit": 2.0}]
+    breaches = watchdog.check(sample(i=1.5, e=0.3))
+    assert [(b["channel"], b["field"]) for b in breaches] == [("CH1", "i"), ("CH2", "p"), ("CH2", "e")]
+    assert watchdog.check(sample(i=1.0, p=2.0, e=0.2)) == []      # at the limit is fine
+
+
+def test_ignored_when_off():
+    watchdog = Watchdog({"CH1": {"i": 1.0}, "CH3": {"i": 1.0}}, maxTemp=50)
+    assert watchdog.check(sample(("OFF", "ON", "off"), i=3.0, temp=60)) == [
+        {"channel": "", "field": "temp", "value": 60.0, "limit": 50}]
+    assert watchdog.check(sample(("OFF", "OFF", "OFF"), i=3.0, temp="60.5")) == []
+    assert [b["channel"] for b in watchdog.check(sample(("OFF", "ON", "ON"), i=3.0))] == ["CH3"]
+    # A channel that isn't being polled can't trip either
+    readings = sample(i=3.0)
+    del readings["readings"]["CH1"], readings["readings"]["CH3"]
+    assert watchdog.check(readings) == []
+
+
+def test_record(tmp_path):
+    events = []
+    log = str(tmp_path / "trips" / "DP832_DP8C000001_trips.csv")
+    watchdog = Watchdog({"CH1": {"i": 1.0}}, logFile=log, onTrip=events.append)
+    s = sample(i=1.25)
+    for n in range(2):
+        breaches = watchdog.check(s)
+        event = watchdog.record(s, breaches, received=int(1000.002e9), off=int(1000.005e9))
+    assert events == watchdog.trips == [event, event]
+    assert event["age"] == pytest.approx(0.005) and event["reaction"] == pytest.approx(0.003)
+    assert describe(event).endswith("CH1 I 1.250 > 1 A, off in 5.0 mS")
+    with open(log) as file:
+        lines = file.read().splitlines()
+    assert len(lines) == 3 and lines[0].startswith("Time,Timestamp,Channel")
+    assert lines[1].split(",")[1:] == ["1700000000.250000", "CH1", "i", "1.250000", "1.000000", "5.000", "3.000"]
+
+
+def test_parse_limit():
+    assert Watchdog.parseLimit("ch2:P:12.5") == ("CH2", "p", 12.5)
+    for spec in ("CH1:v:5", "CH1:i", "CH1:i:lots"):
+        with pytest.raises(ValueError):
+            Watchdog.parseLimit(spec)
@@ -0,0 +1,57 @@
+# python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "dp83xgui"))
+
+from ringbuffer import RingBuffer
+
+
+def fill(buf, start, stop):
+    for n in range(start, stop):
+        buf.append(n, n + 0.5, n + 0.25, n + 0.125)
+
+
+def test_wrap_around():
+    buf = RingBuffer(5)
+    fill(buf, 0, 3)
+    assert len(buf) == 3
+    assert list(buf.t) == [0, 1, 2]
+    fill(buf, 3, 12)
+    assert len(buf) == 5
+    assert list(buf.t) == [7, 8, 9, 10, 11]
+    assert list(buf.v) == [7.5, 8.5, 9.5, 10.5, 11.5]
+    assert buf.view().shape == (4, 5)
+    assert np.array_equal(buf.view()[3], buf.p)
+
+
+def test_view_is_contiguous():
+    buf = RingBuffer(4)
+    fill(buf, 0, 6)
+    assert np.shares_memory(buf.t, buf.data)
+    assert list(buf.t) == [2, 3, 4, 5]
+
+
+def test_clear():
+    buf = RingBuffer(4)
+    fill(buf, 0, 6)
+    buf.clear()
+    assert len(buf) == 0 and len(buf.t) == 0
+    fill(buf, 10, 12)
+    assert list(buf.t) == [10, 11]
+
+
+def test_resize_keeps_newest():
+    buf = RingBuffer(6)
+    fill(buf, 0, 9)
+    buf.resize(3)
+    assert list(buf.t) == [6, 7, 8]
+    fill(buf, 9, 10)
+    assert list(buf.t) == [7, 8, 9]
+    buf.resize(5)
+    assert list(buf.t) == [7, 8, 9]
+    fill(buf, 10, 13)
+    assert list(buf.t) == [8, 9, 10, 11, 12]
@@ -0,0 +1,88 @@
+# python -m pytest tests
+
+import math
+import os
+import random
+import statistics
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "dp83xgui"))
+
+from ringbuffer import RingBuffer
+from runstats import ChannelStats, SessionStats, WindowStats
+
+
+def expected(values):
+    return {"min": min(values), "max": max(values), "mean": statistics.fmean(values),
+            "rms": math.sqrt(statistics.fmean(x*x for x in values)), "pp": max(values) - min(values)}
+
+
+def assertSummary(summary, values):
+    for key, value in expected(values).items():
+        assert summary[key] == pytest.approx(value, rel=1e-9, abs=1e-9), key
+
+
+def test_window_matches_statistics():
+    rng = random.Random(2)
+    values = [12.0 + rng.gauss(0, 0.5) for _ in range(200)] + [1e4] + [rng.uniform(-1, 1) for _ in range(1000)]
+    for capacity in (1, 7, 64, 500):
+        stats = WindowStats(capacity)
+        assert stats.summary() is None
+        for n, x in enumerate(values):
+            stats.add(x)
+            if n % 37 == 0 or n > 1190:
+                assertSummary(stats.summary(), values[max(0, n + 1 - capacity):n + 1])
+
+
+def test_window_monotonic_runs():
+    # Rising then falling, so the min and max come from the ends of their deques
+    values = list(range(50)) + list(range(50, 0, -1)) + [25] * 30
+    stats = WindowStats(20)
+    for n, x in enumerate(values):
+        stats.add(float(x))
+        assertSummary(stats.summary(), values[max(0, n - 19):n + 1])
+
+
+def test_window_resize_and_clear():
+    stats = WindowStats(10)
+    for x in range(30):
+        stats.add(float(x))
+    stats.resize(5, [float(x) for x in range(30)])
+    assertSummary(stats.summary(), range(25, 30))
+    stats.add(100.0)
+    assertSummary(stats.summary(), [26, 27, 28, 29, 100])
+    stats.clear()
+    assert stats.summary() is None
+
+
+def test_session():
+    values = [3.0, -1.0, 2.5, 7.0, 0.0]
+    stats = SessionStats()
+    assert stats.summary() is None
+    for x in values:
+        stats.add(x)
+    assertSummary(stats.summary(), values)
+    stats.clear()
+    assert stats.summary() is None
+
+
+def test_channel_follows_ringbuffer():
+    buf = RingBuffer(8)
+    stats = ChannelStats(8)
+    for n in range(20):
+        buf.append(n, 5.0 + n, 0.1*n, 0.5*n*(5.0 + n))
+        stats.add(5.0 + n, 0.1*n, 0.5*n*(5.0 + n))
+    for f in ("v", "i", "p"):
+        assertSummary(stats.window[f].summary(), list(buf.view(f)))
+    assert stats.session["v"].summary()["min"] == 5.0 and stats.session["v"].summary()["max"] == 24.0
+
+    buf.resize(4)
+    stats.resize(buf)
+    assertSummary(stats.window["v"].summary(), [21.0, 22.0, 23.0, 24.0])
+    assert stats.session["v"].summary()["min"] == 5.0
+    stats.clearWindow()
+    assert stats.window["i"].summary() is None and stats.session["i"].summary() is not None
+    stats.clear()
+    assert stats.session["i"].summary() is None
@@ -0,0 +1,35 @@
+# python -m pytest tests
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "dp83xgui"))
+
+from scheduler import Schedule
+
+MS = 1000000
+
+
+def test_interval_after_burst():
+    schedule = Schedule(0.1, start=0)
+    schedule.tick(0)
+    schedule.setInterval(0, now=50*MS)          # a burst starts
+    now = 50*MS
+    for _ in range(100):
+        assert schedule.due(now)
+        schedule.tick(now)
+        now += 5*MS
+    schedule.setInterval(0.1, now=now)          # and ends 500 mS later
+    assert schedule.deadline() == now + 100*MS
+    schedule.tick(now + 100*MS)
+    assert schedule.deadline() == now + 200*MS
+    stats = schedule.stats()
+    assert stats["overruns"] == 0 and stats["missed"] == 0
+
+
+def test_interval_change_keeps_phase():
+    schedule = Schedule(0.1, start=0)
+    schedule.tick(0)
+    schedule.tick(100*MS)
+    schedule.setInterval(0.5, now=150*MS)
+    assert schedule.deadline() == 600*MS
@@ -0,0 +1,88 @@
+# DP83X setpoint cache against the simulator: python -m pytest tests
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "dp83xgui"))
+
+from dp83x import DP83X
+
+
+def connect():
+    inst = DP83X()
+    inst.conn("SIM::DP832")
+    writes = []
+    write = inst.inst.write
+    def recordWrite(cmd):
+        writes.append(cmd)
+        write(cmd)
+    inst.inst.write = recordWrite
+    return inst, writes
+
+
+def test_unchanged_setpoints_not_written():
+    inst, writes = connect()
+    assert inst.setpoint("CH1", 5, 1, "on") == [":APPL CH1,5.000,1.000", ":OUTP CH1,ON"]
+    assert len(writes) == 1
+    assert inst.setpoint("CH1", 5.0001, 1.0, "ON") == []
+    assert inst.setpoint("CH1", current=1) == []
+    assert len(writes) == 1
+    assert inst.setpoint("CH1", 5, 2, "ON") == [":SOURce1:CURRent 2.000"]
+    assert inst.setpoint("CH1", 6, 2) == [":APPL CH1,6.000"]
+    assert len(writes) == 3
+    assert inst.setpoints["CH1"] == {"v": 6.0, "i": 2.0, "state": "ON"}
+
+
+def test_failed_write_not_cached():
+    inst, writes = connect()
+    def failWrite(cmd):
+        raise IOError("link down")
+    inst.inst.write = failWrite
+    with pytest.raises(IOError):
+        inst.setpoint("CH2", 3, 0.5)
+    assert not inst.setpoints.get("CH2")
+    inst, writes = connect()
+    assert inst.setpoint("CH2", 3, 0.5) == [":APPL CH2,3.000,0.500"]
+
+
+def test_off_always_written():
+    inst, writes = connect()
+    inst.setpoint("CH1", state="OFF")
+    inst.off(["CH1"])
+    inst.off(["CH1"])
+    assert len(writes) == 3
+    assert inst.setpoint("CH1", state="OFF") == []
+
+
+def test_front_panel_changes_forgotten():
+    inst, writes = connect()
+    inst.setpoint("CH1", 5, 1)
+    inst.setpoint("CH2", 12, 0.5)
+    assert inst.checkSetpoints() == []
+    inst.inst.write(":APPL CH2,3.000")      # not through the cache, like the front panel
+    assert inst.checkSetpoints() == ["CH2"]
+    assert "CH2" not in inst.setpoints and inst.setpoints["CH1"] == {"v": 5.0, "i": 1.0}
+    assert inst.setpoint("CH2", 12, 0.5) == [":APPL CH2,12.000,0.500"]
+
+
+def test_polled_state_change_forgotten():
+    inst, writes = connect()
+    inst.setpoint("CH3", 2, 0.1, "ON")
+    inst.pollAll()
+    assert inst.setpoints["CH3"]["state"] == "ON"
+    inst.inst.write(":OUTP CH3,OFF")
+    inst.pollAll()
+    assert "CH3" not in inst.setpoints
+    assert inst.setpoint("CH3", 2, 0.1, "ON") == [":APPL CH3,2.000,0.100", ":OUTP CH3,ON"]
+
+
+def test_raw_writes_and_invalidate():
+    inst, writes = connect()
+    inst.setpoint("CH1", 5, 1, "ON")
+    inst.writing(":SYST:BEEP")
+    assert not inst.setpoints
+    inst.setpoint("CH1", 5, 1)
+    inst.invalidate("CH1", "v")
+    assert inst.setpoint("CH1", 5, 1) == [":APPL CH1,5.000"]
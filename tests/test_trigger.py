@@ -0,0 +1,127 @@
+# python -m pytest tests
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "dp83xgui"))
+
+from capturelog import BinaryCapture
+from trigger import EITHER, FALLING, RISING, BurstCapture, Trigger
+
+IDN = {"company": "RIGOL TECHNOLOGIES", "model": "DP832", "serial": "DP8C000001", "ver": "00.01.16"}
+
+
+def fires(trigger, values, field="v"):
+    return [trigger.check({"CH1": {field: value}}) for value in values]
+
+
+def test_falling_edge():
+    trigger = Trigger("CH1", "v", FALLING, 4.5)
+    assert fires(trigger, [5.0, 4.6, 4.5, 4.4, 5.0, 4.0, 3.0]) == [False, False, True, False, False, True, False]
+
+
+def test_rising_edge():
+    trigger = Trigger("CH1", "i", RISING, 0.8)
+    assert fires(trigger, [0.5, 0.8, 0.9, 0.7, 0.81, 0.81], "i") == [False, True, False, False, True, False]
+
+
+def test_either_edge():
+    trigger = Trigger("CH1", "p", EITHER, 10.0)
+    assert fires(trigger, [5.0, 12.0, 11.0, 9.0, 9.0, 10.0], "p") == [False, True, False, True, False, True]
+
+
+def test_level_reached_but_not_crossed():
+    # Landing on the level fires once, sitting on it or going back doesn't fire again
+    trigger = Trigger("CH1", "v", FALLING, 4.5)
+    assert fires(trigger, [5.0, 4.5, 4.5, 4.5, 4.8, 4.6]) == [False, True, False, False, False, False]
+
+
+def test_noise_on_the_level():
+    # Every crossing counts, noise across the level fires each time it goes back down
+    trigger = Trigger("CH1", "v", FALLING, 4.5)
+    assert fires(trigger, [4.51, 4.49, 4.51, 4.49, 4.52]) == [False, True, False, True, False]
+
+
+def test_hysteresis():
+    trigger = Trigger("CH1", "v", FALLING, 4.5, hysteresis=0.1)
+    assert fires(trigger, [4.51, 4.49, 4.7, 4.49, 4.55, 4.49, 4.6, 4.5]) == [False, False, False, True, False, False, False, False]
+    assert fires(trigger, [4.61, 4.5]) == [False, True]
+    trigger = Trigger("CH1", "i", RISING, 0.8, hysteresis=0.05)
+    assert fires(trigger, [0.7, 0.8, 0.76, 0.9, 0.74, 0.85], "i") == [False, True, False, False, False, True]
+
+
+def test_hysteresis_either_edge():
+    trigger = Trigger("CH1", "p", EITHER, 10.0, hysteresis=1.0)
+    assert fires(trigger, [12.0, 10.0, 10.5, 9.5, 10.5, 8.0, 10.0, 11.5, 12.0], "p") == [
+        False, True, False, False, False, False, True, False, False]
+
+
+def test_rearm_waits_for_recovery():
+    # An event that ends with the supply still low doesn't fire again until it has recovered
+    trigger = Trigger("CH1", "v", FALLING, 4.5, hysteresis=0.1)
+    assert fires(trigger, [5.0, 4.0]) == [False, True]
+    trigger.rearm()
+    assert fires(trigger, [4.0, 4.55, 4.4, 4.7, 4.45]) == [False, False, False, False, True]
+
+
+def test_state_change():
+    trigger = Trigger.parse("ch2:STATE")
+    assert trigger.channel == "CH2" and trigger.edge == EITHER
+    values = ["OFF", "OFF", "ON", "ON", "OFF"]
+    assert [trigger.check({"CH2": {"state": value}}) for value in values] == [False, False, True, False, True]
+
+
+def test_first_sample_and_rearm():
+    trigger = Trigger("CH1", "v", FALLING, 4.5)
+    assert fires(trigger, [4.0]) == [False]
+    assert not trigger.check({"CH2": {"v": 0.0}})
+    assert fires(trigger, [5.0, 4.0]) == [False, True]
+    trigger.rearm()
+    assert fires(trigger, [3.0, 5.0, 4.0]) == [False, False, True]
+
+
+def test_parse():
+    trigger = Trigger.parse("ch1:V:Falling:4.5")
+    assert (trigger.channel, trigger.field, trigger.edge, trigger.level) == ("CH1", "v", FALLING, 4.5)
+    assert trigger.describe() == "CH1 V falling 4.5"
+    trigger = Trigger.parse("CH2:i:rising:0.8:0.05")
+    assert (trigger.edge, trigger.level, trigger.hysteresis) == (RISING, 0.8, 0.05)
+    assert trigger.describe() == "CH2 I rising 0.8 (hysteresis 0.05)"
+    for spec in ("CH1:v:4.5", "CH1:x:falling:4.5", "CH1:v:down:4.5", "CH1:v:falling:low", "CH1:v:falling:4.5:-0.1"):
+        with pytest.raises(ValueError):
+            Trigger.parse(spec)
+
+
+def sample(t, volts):
+    readings = {ch: {"v": volts, "i": 0.5, "p": volts/2, "state": "ON", "e": 0.0} for ch in ("CH1", "CH2")}
+    return {"time": 1700000000.0 + t, "mono": 100.0 + t, "readings": readings}
+
+
+def test_burst_capture(tmp_path):
+    saved = []
+    burst = BurstCapture(Trigger("CH1", "v", FALLING, 4.5), IDN, ("CH1", "CH2"), pre=1.0, post=0.5,
+                         path=str(tmp_path), onCapture=lambda filename, trigger: saved.append(filename))
+    wanted = [burst.add(sample(n/8, 5.0)) for n in range(30)]
+    assert not any(wanted) and not burst.active
+    assert len(burst.buffer) == 9           # the last second at 8 samples/s
+    assert burst.add(sample(30/8, 4.0)) and burst.active
+    # Then as fast as they come, until post seconds after the trigger
+    wanted = [burst.add(sample(30/8 + n/64, 4.0)) for n in range(1, 64)]
+    assert wanted == [True]*31 + [False]*32
+    assert not burst.active and burst.count == 1
+    burst.add(sample(10.0, 5.0))
+    burst.add(sample(10.125, 4.0))
+    assert burst.active
+    burst.flush()
+    burst.wait()
+    assert burst.count == 2 and len(saved) == 2
+
+    cap = BinaryCapture(saved[0])
+    assert saved[0].endswith("_TRIG1.bin") and cap.meta["serial"] == "DP8C000001"
+    assert len(cap) == 8 + 1 + 32        # pre, the trigger and post
+    assert cap.t[0] == 0.0 and cap.t[-1] == 1.0 + 0.5
+    assert cap.channel("CH1")["v"][7] == 5.0 and cap.channel("CH1")["v"][8] == 4.0
+    cap = BinaryCapture(saved[1])
+    assert saved[1].endswith("_TRIG2.bin") and cap.channel("CH2")["v"].tolist() == [5.0, 4.0]
@@ -0,0 +1,34 @@
+# python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "dp83xgui"))
+
+from waveform import Waveform, loadTable
+
+
+def test_expression():
+    x = np.arange(4)/4
+    assert np.allclose(loadTable("np.sin(2*np.pi*x)**2", 4), np.sin(2*np.pi*x)**2)
+    assert np.allclose(loadTable("np.where(x < 0.5, 0, 1)", 4), [0, 0, 1, 1])
+    assert np.allclose(loadTable(" 1 - x ", 4), 1 - x)
+
+
+@pytest.mark.parametrize("expression", ["__import__('os').getcwd()", "np.load('table.npy')", "x.__class__",
+                                        "(lambda: x)()", "np.sin(x, out=x)", "open", "1 +"])
+def test_expression_rejected(expression):
+    with pytest.raises(ValueError):
+        loadTable(expression, 4)
+
+
+def test_timer_clamped():
+    waveform = Waveform("CH1", np.array([-1.0, 0.0, 0.5, 1.0]), 8, 10, offset=25, maxV=30)
+    volts, dwell = waveform.timerSequence()
+    assert volts == [15.0, 25.0, 30.0, 30.0]
+    assert min(waveform.volts) >= 0 and max(waveform.volts) <= 30
+    volts, dwell = Waveform("CH1", np.array([-1.0, 1.0]), 8, 5, maxV=30).timerSequence()
+    assert volts == [0.0, 5.0]